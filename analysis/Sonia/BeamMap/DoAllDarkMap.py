@@ -42,45 +42,13 @@ for filename in allfiles:
     # else:
     #     ch = ""
 
-    c = np.loadtxt(filename, comments='#', delimiter= ' ',  usecols=(1,2,4,5) , unpack=True, ndmin=0)
-    print "data shape  is :", c.shape
-    X = c[0]
-    Y = c[1]
-    Z = c[2]
-    flagShutter = c[3]
-    cutLight = flagShutter==1
-    # npoints = flagShutter[cutLight].shape[0]
-
-    X = X[cutLight]
-    Y = Y[cutLight]
-    light = Z[cutLight]
-    dark = Z[flagShutter==0]
-
-    uniqueX, indicesX = np.unique(X, return_index=True)
-    uniqueY, indicesY = np.unique(Y, return_index=True)
-    # print uniqueX, "\n",indicesX
-    # print uniqueY,"\n", indicesY
-    # uniqueX = [0.]
-    # uniqueY = [0.]
-    nmappoints = (uniqueX.shape[0])*(uniqueY.shape[0])
+    grid, dark = BM.ReduceMap(filename)
+    reducedX, reducedY, reducedmMap, noiseMap, countMap = grid.points()
+    nmappoints = reducedmMap.shape[0]
     if nmappoints < 6:
         print "only ", nmappoints, "points in this map, skipping"
         continue
-    reducedX = np.zeros(nmappoints)
-    reducedY = np.zeros(nmappoints)
-    reducedmMap = np.zeros(nmappoints)
-    i = 0
-    for x in uniqueX:
-        for y in uniqueY:
-            allpointsXY = light[(X==x)&(Y==y)]
-            # print "for (",x, y,") , Nmeasures = ", allpointsXY.shape[0]
-            # print allpointsXY
-            avMapPoint = allpointsXY.mean()
-            # print "average for this point", avMapPoint
-            reducedX[i] = x
-            reducedY[i] = y
-            reducedmMap[i] = avMapPoint
-            i = i+1
+    print "samples per point: %d to %d, median rms %g" % (countMap.min(), countMap.max(), np.median(noiseMap))
 
     avDark = dark.mean()
     signalMap = reducedmMap - np.array([avDark]*reducedmMap.shape[0])
@@ -103,9 +71,12 @@ for filename in allfiles:
         print "now using method: ", plotMethod.__name__
         plotname = plotDir+filename[:-5].replace(dataDir, "")+"_"+plotMethod.__name__+"_"+source+".png"
         if plotMethod == BM.beamMapScatter2dFixedScale or plotMethod == BM.beamMap2dFixedScale:
-            plotMethod(reducedX,reducedY,percent, plotname, title, label, -2, 2)
+            plotMethod(reducedX,reducedY,percent, plotname, title, label, -2, 2,
+                       reducedX.min(), reducedX.max(), reducedY.min(), reducedY.max())
         # elif  plotMethod == BM.diffMapScatter2d:
         #     plotMethod(X1,Y1,Z1, X2,Y2,Z2,plotname, title, label)
+        elif plotMethod == BM.beamMap2d:
+            plotMethod(reducedX,reducedY,percent, plotname, title, label,
+                       reducedX.min(), reducedX.max(), reducedY.min(), reducedY.max())
         else:
-            plotMethod(reducedX,reducedY,percent, plotname, title, label)
-    del c,X,Y,Z
\ No newline at end of file
+            plotMethod(reducedX,reducedY,percent, plotname, title, label)
\ No newline at end of file
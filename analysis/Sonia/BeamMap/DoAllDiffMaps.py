@@ -68,9 +68,9 @@ for sourceList in [laser1List,laser2List, laser3List, laser4List, QTHList]:
         reducedsourceList = sourceList[ifile+1:]
         for filename2 in reducedsourceList:
             print "For",source , "comparing files ", filename1, " and ", filename2
-            reducedX1,reducedY1,signalMap1, label1 = BM.MakeRawMap(filename1)
-            reducedX2,reducedY2,signalMap2, label1 = BM.MakeRawMap(filename2)
-            nmappoints = (reducedX1.shape[0])*(reducedY1.shape[0])
+            reducedX1,reducedY1,signalMap1,dark1, label1 = BM.MakeRawMap(filename1)
+            reducedX2,reducedY2,signalMap2,dark2, label2 = BM.MakeRawMap(filename2)
+            nmappoints = reducedX1.shape[0]
             if nmappoints < 6:
                 print "only ", nmappoints, "points in this map, skipping"
                 continue
@@ -85,4 +85,4 @@ for sourceList in [laser1List,laser2List, laser3List, laser4List, QTHList]:
             Y = reducedY1
             Z = (signalMap1 - signalMap2)*100/signalMap1
             label = "difference in %"
-            BM.beamMap2d(X,Y,Z,plotname,title,label)
\ No newline at end of file
+            BM.beamMap2d(X,Y,Z,plotname,title,label, X.min(), X.max(), Y.min(), Y.max())
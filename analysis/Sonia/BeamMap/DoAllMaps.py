@@ -26,14 +26,18 @@ print "using methods :", [method.__name__  for method in allmethods]
 
 for filename in allfiles:
     print 'now using file', filename
-#         b = np.genfromtxt(filename,  delimiter = ' ', skip_header = 4, usecols = (0,1,3))
-#         c = np.transpose(b)
-    c = np.loadtxt(filename, comments='#', delimiter= ' ',  usecols=(0,1,2) , unpack=True, ndmin=0)
-    print c.shape
-    X = c[0]
-    Y = c[1]
-    Z = c[2]
+    # old format: X, Y and current in the first columns, no shutter flag
+    grid = BM.GridStats()
+    for X, Y, Z in BM.ReadChunks(filename, usecols=(0,1,2)):
+        grid.add(X, Y, Z)
+    X, Y, Z, std, count = grid.points()
+    print "reduced %d samples on %d points" % (count.sum(), Z.shape[0])
+    title = os.path.basename(filename)
+    label = 'PhD current'
     for plotMethod in allmethods:
         print "now using method: ", plotMethod.__name__
         plotname = filename[:-5]+"_"+plotMethod.__name__+".png"
-        plotMethod(X,Y,Z, plotname)
+        if plotMethod == BM.beamMap2d:
+            plotMethod(X,Y,Z, plotname, title, label, X.min(), X.max(), Y.min(), Y.max())
+        else:
+            plotMethod(X,Y,Z, plotname, title, label)
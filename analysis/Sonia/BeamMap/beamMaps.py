@@ -1,3 +1,4 @@
+import itertools
 import matplotlib as mpl
 import matplotlib.pyplot as plt
 from matplotlib.mlab import griddata
@@ -5,93 +6,178 @@ from mpl_toolkits.mplot3d import Axes3D
 import numpy as np
 from mpl_toolkits.axes_grid1 import make_axes_locatable
 
+# lines of a data file reduced at a time
+chunksize = 100000
 
-def MakeRawMap(filename,xmin=-1, xmax=-1, ymin=-1, ymax=-1):
-    c = np.loadtxt(filename, comments='#', delimiter= ' ',  usecols=(1,2,4,5) , unpack=True, ndmin=0)
-    print "raw data shape  is :", c.shape
-    if xmin == -1:
-        xmin =c[0].min()
-    if xmax == -1:
-        xmax =c[0].max()
-    if ymin == -1:
-        ymin =c[1].min()
-    if ymax == -1:
-        ymax =c[1].max()
-    # cutX  = (c[0]>xmin)&(c[0]<xmax)
-    # cutY  = (c[1]>ymin)&(c[1]<ymax)
-    # zoom = cutX&cutY
-    # c = c[zoom]
-    # print "cropped data shape  is :", c.shape
-    X = c[0]
-    Y = c[1]
-    Z = c[2]
-    flagShutter = c[3]
-
-
-    cutLight = flagShutter==1
-    X = X[cutLight]
-    Y = Y[cutLight]
-    light = Z[cutLight]
-    dark = Z[flagShutter==0]
-    print "original data shape  is :", X.shape, Y.shape, light.shape, dark.shape
-
-    cutX  = (X>=xmin)&(X<=xmax)
-    cutY  = (Y>=ymin)&(Y<=ymax)
-    zoom = cutX&cutY
-    # c = c[zoom]
-
-    X = X[zoom]
-    Y = Y[zoom]
-    light = light[zoom]
-
-    print "cropped data shape  is :", X.shape, Y.shape, light.shape
-
-
-    uniqueX, indicesX = np.unique(X, return_index=True)
-    uniqueY, indicesY = np.unique(Y, return_index=True)
-    nmappoints = (uniqueX.shape[0])*(uniqueY.shape[0])
-    reducedX = np.zeros(nmappoints)
-    reducedY = np.zeros(nmappoints)
-    reducedmMap = np.zeros(nmappoints)
-    i = 0
-    for x in uniqueX:
-        for y in uniqueY:
-            allpointsXY = light[(X==x)&(Y==y)]
-            avMapPoint = allpointsXY.mean()
-            reducedX[i] = x
-            reducedY[i] = y
-            reducedmMap[i] = avMapPoint
-            i = i+1
+
+def ReadChunks(filename, usecols=(1,2,4,5), chunksize=chunksize):
+    """
+    Reads the columns usecols of a map file by blocks of chunksize lines.
+    Yields arrays of shape (len(usecols), n), as np.loadtxt(..., unpack=True).
+    """
+    f = open(filename, "r")
+    try:
+        while True:
+            block = list(itertools.islice(f, chunksize))
+            if not block:
+                break
+            lines = [line for line in block if line.strip() and not line.startswith('#')]
+            if lines:
+                yield np.loadtxt(lines, comments='#', delimiter= ' ', usecols=usecols, unpack=True, ndmin=2)
+    finally:
+        f.close()
+
+
+def MergeStats(n1, mean1, m2a, n2, mean2, m2b):
+    """
+    Combines count, mean and sum of squared deviations of two sets of samples
+    (scalars or arrays of the same shape).
+    """
+    n = n1 + n2
+    delta = mean2 - mean1
+    safe = np.maximum(n, 1)
+    mean = mean1 + delta*n2/safe
+    m2 = m2a + m2b + delta*delta*n1*n2/safe
+    return n, mean, m2
+
+
+class SampleStats(object):
+    """
+    Count, mean and standard deviation of samples added by blocks.
+    """
+
+    def __init__(self):
+        self.n = 0.
+        self.mu = 0.
+        self.m2 = 0.
+
+    def add(self, Z):
+        Z = np.asarray(Z, dtype=float)
+        if Z.size == 0:
+            return
+        mu = Z.mean()
+        self.n, self.mu, self.m2 = MergeStats(self.n, self.mu, self.m2,
+                                              float(Z.size), mu, ((Z - mu)**2).sum())
+
+    def __len__(self):
+        return int(self.n)
+
+    def mean(self):
+        if self.n == 0:
+            return np.nan
+        return self.mu
+
+    def std(self):
+        if self.n == 0:
+            return np.nan
+        return np.sqrt(self.m2/self.n)
+
+
+class GridStats(object):
+    """
+    Count, mean and standard deviation of the samples at each (X, Y) point of a map.
+    Samples are added by blocks: each block is binned once to its grid cells
+    (np.unique / np.bincount) and merged into the grid, which grows with new positions.
+    The grid arrays are indexed [ix, iy] on the sorted positions xs and ys.
+    """
+
+    def __init__(self):
+        self.xs = np.zeros(0)
+        self.ys = np.zeros(0)
+        self.n = np.zeros((0, 0))
+        self.mu = np.zeros((0, 0))
+        self.m2 = np.zeros((0, 0))
+
+    def _expand(self, ux, uy):
+        xs = np.union1d(self.xs, ux)
+        ys = np.union1d(self.ys, uy)
+        if xs.shape == self.xs.shape and ys.shape == self.ys.shape:
+            return
+        old = np.ix_(np.searchsorted(xs, self.xs), np.searchsorted(ys, self.ys))
+        for name in ('n', 'mu', 'm2'):
+            grid = np.zeros((xs.shape[0], ys.shape[0]))
+            grid[old] = getattr(self, name)
+            setattr(self, name, grid)
+        self.xs = xs
+        self.ys = ys
+
+    def add(self, X, Y, Z):
+        if len(Z) == 0:
+            return
+        ux, ix = np.unique(X, return_inverse=True)
+        uy, iy = np.unique(Y, return_inverse=True)
+        shape = (ux.shape[0], uy.shape[0])
+        cell = ix*shape[1] + iy
+        ncells = shape[0]*shape[1]
+        n = np.bincount(cell, minlength=ncells).astype(float)
+        mu = np.bincount(cell, weights=Z, minlength=ncells)/np.maximum(n, 1)
+        d = Z - mu[cell]
+        m2 = np.bincount(cell, weights=d*d, minlength=ncells)
+
+        self._expand(ux, uy)
+        sel = np.ix_(np.searchsorted(self.xs, ux), np.searchsorted(self.ys, uy))
+        self.n[sel], self.mu[sel], self.m2[sel] = MergeStats(self.n[sel], self.mu[sel], self.m2[sel],
+                                                             n.reshape(shape), mu.reshape(shape),
+                                                             m2.reshape(shape))
+
+    def mean(self):
+        mean = self.mu.copy()
+        mean[self.n == 0] = np.nan
+        return mean
+
+    def std(self):
+        return np.sqrt(self.m2/np.where(self.n == 0, np.nan, self.n))
+
+    def points(self):
+        """
+        One entry per grid point, X major (for x in xs: for y in ys).
+        :return: X, Y, mean, std, count
+        """
+        nx, ny = self.n.shape
+        return (np.repeat(self.xs, ny), np.tile(self.ys, nx),
+                self.mean().ravel(), self.std().ravel(), self.n.ravel())
+
+    def image(self):
+        """
+        :return: xs, ys, mean map indexed [iy, ix]
+        """
+        return self.xs, self.ys, self.mean().T
+
+
+def ReduceMap(filename, xmin=-1, xmax=-1, ymin=-1, ymax=-1, chunksize=chunksize):
+    """
+    Reduces a beam map file (columns X, Y, current, shutter flag at 1, 2, 4, 5),
+    light points inside the limits (-1: no limit) per grid point, dark points together.
+    :return: GridStats of the light, SampleStats of the dark
+    """
+    light = GridStats()
+    dark = SampleStats()
+    for X, Y, Z, flagShutter in ReadChunks(filename, chunksize=chunksize):
+        cutLight = flagShutter==1
+        dark.add(Z[flagShutter==0])
+        if xmin != -1:
+            cutLight &= X>=xmin
+        if xmax != -1:
+            cutLight &= X<=xmax
+        if ymin != -1:
+            cutLight &= Y>=ymin
+        if ymax != -1:
+            cutLight &= Y<=ymax
+        light.add(X[cutLight], Y[cutLight], Z[cutLight])
+    print "reduced %d light samples on %d x %d points, %d dark samples" % \
+        (light.n.sum(), light.xs.shape[0], light.ys.shape[0], len(dark))
+    return light, dark
+
+
+def MakeRawMap(filename,xmin=-1, xmax=-1, ymin=-1, ymax=-1, chunksize=chunksize):
+    light, dark = ReduceMap(filename, xmin, xmax, ymin, ymax, chunksize)
+    reducedX, reducedY, reducedmMap, std, count = light.points()
     label = 'PhD current'
     return reducedX,reducedY,reducedmMap,dark, label
 
-def MakeRawImageMap(filename):
-    c = np.loadtxt(filename, comments='#', delimiter= ' ',  usecols=(1,2,4,5) , unpack=True, ndmin=0)
-    print "data shape  is :", c.shape
-    X = c[0]
-    Y = c[1]
-    Z = c[2]
-    flagShutter = c[3]
-    cutLight = flagShutter==1
-
-    X = X[cutLight]
-    Y = Y[cutLight]
-    light = Z[cutLight]
-    dark = Z[flagShutter==0]
-
-    uniqueX, indicesX = np.unique(X, return_index=True)
-    uniqueY, indicesY = np.unique(Y, return_index=True)
-    nmappoints = (uniqueX.shape[0])*(uniqueY.shape[0])
-    allpointsXY = {}
-    reducedMap= {}
-    i = 0
-    for x in uniqueX:
-        for y in uniqueY:
-            allpointsXY[(x,y)]= light[(X==x)&(Y==y)]
-            reducedMap[(x,y)] = allpointsXY[(x,y)].mean()
-    map = np.array([np.array([reducedMap[(x,y)] for x in uniqueX]) for y in uniqueY])
-    # mapX = X.reshape((uniqueX.shape[0],uniqueY.shape[0]))
-    # mapY = Y.reshape((uniqueX.shape[0],uniqueY.shape[0]))
+def MakeRawImageMap(filename, chunksize=chunksize):
+    light, dark = ReduceMap(filename, chunksize=chunksize)
+    uniqueX, uniqueY, map = light.image()
     return uniqueX,uniqueY,map,dark
 
 def PlotCCDLimit(mycolor='black'):
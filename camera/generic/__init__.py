@@ -1 +1 @@
-__all__ = ['bidi', 'rebxml', 'fpga', 'reb', 'aspic']
+__all__ = ['bidi', 'rebxml', 'fpga', 'reb', 'aspic', 'backend', 'seqcache', 'fitswriter', 'imagewatch', 'housekeeping']
@@ -0,0 +1,313 @@
+#
+# LSST / LPNHE
+#
+"""
+Register access backends for the REB FPGA.
+The FPGA object does not talk to rriClient directly anymore but through one of these backends:
+- SubprocessBackend: one rriClient process (and one ssh if remote) per transaction, the historical behaviour.
+- ShellBackend: a single long-lived shell (local or through ssh) per REB, rriClient commands are pipelined into it.
+- FakeBackend: in-memory registers with optional simulated latency, for tests and benchmarks without hardware.
+All backends exchange rriClient command lines, so that the same parser is used on every path.
+"""
+
+import re
+import subprocess
+import threading
+import time
+
+## -----------------------------------------------------------------------
+
+# out : '  Register 0x4 (4): 0x9164efa8 (-1855656024)\n'
+pattern_register = re.compile(
+    "Register ([-+]?(0[xX])?[\dA-Fa-f]+) \(([-+]?\d+)\)\: ([-+]?(0[xX])?[\dA-Fa-f]+) \(([-+]?\d+)\)")
+
+
+def parse_read_output(out, address, verbose=True):
+    """
+    Parses the output of a rriClient read command.
+    :param out: string
+    :param address: int (for error messages)
+    :param verbose: bool
+    :return: dict of register values by address
+    """
+    result = {}
+
+    for line in out.split('\n'):
+        line = line.strip()
+        if verbose:
+            print line
+        if line == '':
+            continue
+        matches = pattern_register.match(line)
+        if not matches:
+            raise IOError("Failed to read register 0x%0x on FPGA" % address)
+        r = int(matches.group(1), base=16)
+        v = int(matches.group(4), base=16)
+
+        result[r] = v
+
+    return result
+
+
+class RegisterBackend(object):
+    """
+    Generic register backend. Inheritors implement exchange().
+    A transaction is a list of rriClient commands sent at once, the answer is the list of their outputs.
+    """
+    marker = '__RRI_DONE__'
+
+    def __init__(self, reb_id=2, ctrl_host=None):
+        self.reb_id = reb_id
+        self.ctrl_host = ctrl_host
+        self.transactions = 0  # number of round-trips to the transport
+        self.commands = 0  # number of rriClient commands sent
+        self.lock = threading.Lock()
+
+    def read_command(self, address, n=1):
+        return "rriClient %d read 0x%0x %d" % (self.reb_id, address, n)
+
+    def write_command(self, address, value):
+        return "rriClient %d write 0x%0x 0x%0x" % (self.reb_id, address, value)
+
+    def exchange(self, commands):
+        """
+        Sends all commands and returns the list of outputs, in order.
+        :param commands: list of strings
+        :return: list of strings
+        """
+        raise NotImplementedError
+
+    def transaction(self, commands):
+        """
+        Sends a list of commands in a single round-trip.
+        :param commands: list of strings
+        :return: list of strings
+        """
+        if not commands:
+            return []
+        with self.lock:
+            outputs = self.exchange(commands)
+            self.transactions += 1
+            self.commands += len(commands)
+        return outputs
+
+    def read(self, address, n=1, verbose=True):
+        """
+        Reads n registers from address.
+        :return: dict
+        """
+        out = self.transaction([self.read_command(address, n)])[0]
+        return parse_read_output(out, address, verbose)
+
+    def write(self, address, value):
+        """
+        Writes value to a single register.
+        """
+        self.transaction([self.write_command(address, value)])
+
+    def write_block(self, address, values):
+        """
+        Writes values to contiguous registers starting at address, in a single transaction.
+        """
+        self.transaction([self.write_command(address + i, v) for i, v in enumerate(values)])
+
+    def write_read(self, pairs, verbose=False):
+        """
+        For each (write address, value, read address), writes the value then reads back one register,
+        all pairs in a single transaction.
+        :return: list of values read
+        """
+        commands = []
+        for waddress, value, raddress in pairs:
+            commands.append(self.write_command(waddress, value))
+            commands.append(self.read_command(raddress, 1))
+        outputs = self.transaction(commands)
+
+        values = []
+        for (waddress, value, raddress), out in zip(pairs, outputs[1::2]):
+            result = parse_read_output(out, raddress, verbose)
+            if raddress not in result:
+                raise IOError("Failed to read FPGA memory at address " + str(raddress))
+            values.append(result[raddress])
+
+        return values
+
+    def split_outputs(self, out, ncommands):
+        """
+        Splits the concatenated output of a transaction on the end markers.
+        :return: list of strings
+        """
+        parts = out.split(self.marker + '\n')
+        if len(parts) < ncommands + 1:
+            raise IOError("Incomplete answer from rriClient (%d commands, %d answers)" %
+                          (ncommands, len(parts) - 1))
+        return parts[:ncommands]
+
+    def close(self):
+        pass
+
+    def __repr__(self):
+        return "%s(reb_id=%d, ctrl_host=%r)" % (self.__class__.__name__, self.reb_id, self.ctrl_host)
+
+
+class SubprocessBackend(RegisterBackend):
+    """
+    One shell (plus ssh if remote) per transaction. Commands of a transaction are chained in the same shell.
+    """
+
+    def exchange(self, commands):
+        command = "; ".join(["%s; echo %s" % (c, self.marker) for c in commands])
+
+        if self.ctrl_host is None:
+            remote_command = command
+        else:
+            remote_command = "ssh %s '%s'" % (self.ctrl_host, command)
+
+        proc = subprocess.Popen(remote_command, shell=True,
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE)
+        (out, err) = proc.communicate()
+
+        return self.split_outputs(out, len(commands))
+
+
+class ShellBackend(RegisterBackend):
+    """
+    One long-lived shell per REB (through a single ssh connection if remote).
+    Commands are written to its input all at once and answers are read back in order,
+    so that a transaction costs a single round-trip whatever its length.
+    """
+
+    def __init__(self, reb_id=2, ctrl_host=None):
+        RegisterBackend.__init__(self, reb_id, ctrl_host)
+        self.proc = None
+
+    def open(self):
+        if self.ctrl_host is None:
+            args = ['sh']
+        else:
+            args = ['ssh', '-T', self.ctrl_host, 'sh']
+        # stderr is left to the terminal as with the subprocess backend
+        self.proc = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE, bufsize=0)
+
+    def exchange(self, commands):
+        if self.proc is None or self.proc.poll() is not None:
+            self.open()
+
+        self.proc.stdin.write("".join(["%s\necho %s\n" % (c, self.marker) for c in commands]))
+        self.proc.stdin.flush()
+
+        outputs = []
+        current = []
+        while len(outputs) < len(commands):
+            line = self.proc.stdout.readline()
+            if not line:
+                self.proc = None
+                raise IOError("Lost connection to rriClient shell on %s" % (self.ctrl_host or 'localhost'))
+            if line.rstrip('\n') == self.marker:
+                outputs.append("".join(current))
+                current = []
+            else:
+                current.append(line)
+
+        return outputs
+
+    def close(self):
+        if self.proc is not None:
+            try:
+                self.proc.stdin.close()
+                self.proc.wait()
+            except (IOError, OSError):
+                pass
+            self.proc = None
+
+
+class FakeBackend(RegisterBackend):
+    """
+    In-memory registers answering rriClient commands, with an optional latency per transaction
+    to emulate the transport cost.
+    """
+    pattern_read = re.compile("rriClient\s+\d+\s+read\s+(0[xX][\dA-Fa-f]+)\s+(\d+)")
+    pattern_write = re.compile("rriClient\s+\d+\s+write\s+(0[xX][\dA-Fa-f]+)\s+(0[xX][\dA-Fa-f]+)")
+
+    def __init__(self, reb_id=2, ctrl_host=None, latency=0.):
+        RegisterBackend.__init__(self, reb_id, ctrl_host)
+        self.latency = latency
+        self.registers = {}
+
+    def exchange(self, commands):
+        if self.latency:
+            time.sleep(self.latency)
+
+        outputs = []
+        for c in commands:
+            m = self.pattern_write.match(c)
+            if m:
+                self.registers[int(m.group(1), base=16)] = int(m.group(2), base=16) & 0xffffffff
+                outputs.append("")
+                continue
+            m = self.pattern_read.match(c)
+            if m:
+                address = int(m.group(1), base=16)
+                out = ""
+                for r in xrange(address, address + int(m.group(2))):
+                    v = self.registers.get(r, 0)
+                    signed = v - (1 << 32) if v & 0x80000000 else v
+                    out += "  Register 0x%x (%d): 0x%08x (%d)\n" % (r, r, v, signed)
+                outputs.append(out)
+                continue
+            raise ValueError("Unknown rriClient command: %s" % c)
+
+        return outputs
+
+
+backends = {'subprocess': SubprocessBackend,
+            'shell': ShellBackend,
+            'fake': FakeBackend}
+
+
+def make_backend(backend, reb_id=2, ctrl_host=None):
+    """
+    Returns a backend instance from its name, or the backend itself if already built.
+    :param backend: string or RegisterBackend
+    :rtype: RegisterBackend
+    """
+    if isinstance(backend, RegisterBackend):
+        return backend
+    if backend not in backends:
+        raise ValueError("Unknown register backend: %s" % backend)
+    return backends[backend](reb_id, ctrl_host)
+
+## -----------------------------------------------------------------------
+
+
+def benchmark(backend, nregs=1000, base_address=0x200000):
+    """
+    Times single register writes and reads through a backend.
+    :param backend: RegisterBackend
+    :param nregs: int
+    :return: dict of operations per second
+    """
+    rates = {}
+
+    t0 = time.time()
+    for i in xrange(nregs):
+        backend.write(base_address + i, i)
+    rates['write'] = nregs / (time.time() - t0)
+
+    t0 = time.time()
+    for i in xrange(nregs):
+        backend.read(base_address + i, verbose=False)
+    rates['read'] = nregs / (time.time() - t0)
+
+    t0 = time.time()
+    backend.write_block(base_address, range(nregs))
+    rates['write_block'] = nregs / (time.time() - t0)
+
+    return rates
+
+
+if __name__ == "__main__":
+    for latency in [0., 0.001, 0.01]:
+        fake = FakeBackend(latency=latency)
+        print "FakeBackend latency %.3f s: %r" % (latency, benchmark(fake, 200))
@@ -0,0 +1,234 @@
+#
+# LSST / LPNHE
+#
+"""
+Parallel writing of multi-extension compressed FITS files.
+RICE compression of the channel extensions dominates the writing time of a frame, and each
+extension is compressed independently of the others. Here every HDU is serialized on its own,
+channel HDUs in a pool of processes, and the file is the concatenation of the serialized HDUs in
+order, which is the same byte stream as HDUList.writeto().
+"""
+
+import os
+import io
+import time
+import tempfile
+import threading
+import multiprocessing
+import numpy as N
+import astropy.io.fits as pyfits
+
+import reb
+
+# number of processes used by default (0 or 1: serial writing as before)
+default_workers = 0
+
+
+def hdu_to_bytes(hdu, checksum=False):
+    """
+    Serializes a single HDU as it appears in a FITS file.
+    :param hdu: pyfits HDU
+    :param checksum: bool
+    :rtype: string
+    """
+    buff = io.BytesIO()
+
+    if isinstance(hdu, pyfits.PrimaryHDU):
+        pyfits.HDUList([hdu]).writeto(buff, checksum=checksum)
+        return buff.getvalue()
+
+    # an extension cannot be written alone: the empty primary in front is cut away
+    primaryhdu = pyfits.PrimaryHDU()
+    pyfits.HDUList([primaryhdu, hdu]).writeto(buff, checksum=checksum)
+
+    return buff.getvalue()[len(primaryhdu.header.tostring()):]
+
+
+# HDUList being written by write_fits(), inherited by the pool processes when they are forked
+_hdulist = None
+_hdulist_lock = threading.Lock()
+
+
+def _compress_hdu(args):
+    """
+    Pool worker: serializes HDU number index of the HDUList inherited from write_fits().
+    The original HDU is used, not a copy rebuilt from its data and header: CompImageHDU
+    rewrites the comments of ZBITPIX, ZNAXIS... when it is created, and the file would differ.
+    """
+    index, checksum = args
+
+    return hdu_to_bytes(_hdulist[index], checksum)
+
+
+def _compress_channel(args):
+    """
+    Pool worker: reads a single channel from the raw file and compresses it.
+    """
+    num, imgname, imgcols, imglines, nchannels, channels, displayborders, checksum = args
+    detstring = reb.get_detsize(imgcols, imglines, nchannels, channels, displayborders)
+    num, y = reb.read_channels(imgname, imgcols, imglines, nchannels, [num]).next()
+    hdu = reb.make_channel_hdu(num, y, imgcols, imglines, detstring, channels, displayborders)
+
+    return hdu_to_bytes(hdu, checksum)
+
+
+def write_fits(hdulist, fitsname, workers=None, checksum=False):
+    """
+    Writes an HDUList to fitsname (overwriting it), compressing its CompImageHDUs in parallel.
+    The file is identical to the one written by hdulist.writeto().
+    With 0 or 1 worker, falls back to hdulist.writeto().
+    :param hdulist: pyfits.HDUList
+    :param fitsname: string
+    :param workers: number of processes, default_workers if None
+    :param checksum: bool
+    """
+    global _hdulist
+
+    if workers is None:
+        workers = default_workers
+    if workers <= 1:
+        hdulist.writeto(fitsname, clobber=True, checksum=checksum)
+        return
+
+    images = [(index, checksum) for index, hdu in enumerate(hdulist) if isinstance(hdu, pyfits.CompImageHDU)]
+
+    # the workers get the HDUs by fork when the pool starts, the data is not pickled
+    with _hdulist_lock:
+        _hdulist = hdulist
+        try:
+            pool = multiprocessing.Pool(workers)
+        finally:
+            _hdulist = None
+    try:
+        compressed = pool.imap(_compress_hdu, images)
+        with open(fitsname, 'wb') as f:
+            for hdu in hdulist:
+                if isinstance(hdu, pyfits.CompImageHDU):
+                    f.write(compressed.next())
+                else:
+                    f.write(hdu_to_bytes(hdu, checksum))
+    finally:
+        pool.close()
+        pool.join()
+
+
+def stream_to_fits(fitsname, imgname, imgcols, imglines, nchannels, channels=None, displayborders=False,
+                   primaryhdu=None, extrahdus=[], workers=None, checksum=False):
+    """
+    Same as reb.stream_to_fits(), with the channels read and compressed in a pool of processes.
+    Channels are written in order as soon as they are ready.
+    """
+    if workers is None:
+        workers = default_workers
+    if workers <= 1:
+        reb.stream_to_fits(fitsname, imgname, imgcols, imglines, nchannels, channels, displayborders,
+                           primaryhdu, extrahdus)
+        return
+
+    if primaryhdu is None:
+        primaryhdu = reb.make_primary_hdu(imgcols, imglines, nchannels, channels, displayborders)
+
+    tasks = [(num, imgname, imgcols, imglines, nchannels, channels, displayborders, checksum)
+             for num in range(nchannels) if not channels or num in channels]
+
+    pool = multiprocessing.Pool(workers)
+    try:
+        with open(fitsname, 'wb') as f:
+            f.write(hdu_to_bytes(primaryhdu, checksum))
+            for data in pool.imap(_compress_channel, tasks):
+                f.write(data)
+            for hdu in extrahdus:
+                f.write(hdu_to_bytes(hdu, checksum))
+    finally:
+        pool.close()
+        pool.join()
+
+## -----------------------------------------------------------------------
+
+
+def make_test_image(imgname, imgcols, imglines, nchannels, seed=0):
+    """
+    Writes a raw .img file with noise around a pedestal, for benchmarks.
+    """
+    rnd = N.random.RandomState(seed)
+    data = rnd.normal(0x1FFFF - 25000, 10., size=(imglines, imgcols, nchannels)).astype(N.int32)
+    data.tofile(imgname)
+
+
+def strip_checksum_times(data):
+    """
+    FITS file content with the checksum cards made independent of the time of writing:
+    the comments of DATASUM and ZDATASUM are blanked, and CHECKSUM and ZHECKSUM, which cover
+    these comments, are removed.
+    :param data: string
+    :rtype: string
+    """
+    cards = [data[i:i + 80] for i in xrange(0, len(data), 80)]
+    for i, card in enumerate(cards):
+        if card[8:10] != '= ':
+            continue
+        key = card[:8].rstrip()
+        if key in ('CHECKSUM', 'ZHECKSUM'):
+            cards[i] = card[:10].ljust(80)
+        elif key in ('DATASUM', 'ZDATASUM') and '/' in card:
+            cards[i] = card[:card.index('/')].ljust(80)
+
+    return ''.join(cards)
+
+
+def benchmark(nchannels_list=(16, 32, 48), workers=None, imgcols=576, imglines=2048, checksum=True):
+    """
+    Compares serial and parallel writing times of a frame against the number of channels.
+    Both files must be identical (AssertionError otherwise), except for the times of writing
+    in the checksum cards (see strip_checksum_times).
+    :return: list of (nchannels, serial time, parallel time)
+    """
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+
+    tmpdir = tempfile.mkdtemp()
+    imgname = os.path.join(tmpdir, 'bench.img')
+    serialname = os.path.join(tmpdir, 'serial.fz')
+    parallelname = os.path.join(tmpdir, 'parallel.fz')
+
+    results = []
+    for nchannels in nchannels_list:
+        make_test_image(imgname, imgcols, imglines, nchannels)
+
+        t0 = time.time()
+        hdulist = reb.conv_to_fits(imgname, imgcols, imglines, nchannels)
+        write_fits(hdulist, serialname, workers=0, checksum=checksum)
+        tserial = time.time() - t0
+
+        t0 = time.time()
+        hdulist = reb.conv_to_fits(imgname, imgcols, imglines, nchannels)
+        write_fits(hdulist, parallelname, workers=workers, checksum=checksum)
+        tparallel = time.time() - t0
+
+        with open(serialname, 'rb') as f:
+            serialdata = f.read()
+        with open(parallelname, 'rb') as f:
+            paralleldata = f.read()
+        if checksum:
+            serialdata = strip_checksum_times(serialdata)
+            paralleldata = strip_checksum_times(paralleldata)
+        assert paralleldata == serialdata, \
+            "Parallel writing of %d channels differs from hdulist.writeto()" % nchannels
+
+        results.append((nchannels, tserial, tparallel))
+
+    for fname in [imgname, serialname, parallelname]:
+        if os.path.isfile(fname):
+            os.remove(fname)
+    os.rmdir(tmpdir)
+
+    return results
+
+
+if __name__ == "__main__":
+    nworkers = multiprocessing.cpu_count()
+    print "Writing with %d workers" % nworkers
+    for checksum in [False, True]:
+        for nchannels, tserial, tparallel in benchmark((4, 16, 32, 48), workers=nworkers, checksum=checksum):
+            print "%2d channels, checksum %s: serial %.2f s, parallel %.2f s (x%.1f), identical files" % \
+                  (nchannels, checksum, tserial, tparallel, tserial / tparallel)
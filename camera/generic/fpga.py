@@ -10,9 +10,11 @@ This is for generic FPGA commands that are common to all versions.
 
 import sys
 import re
-import subprocess
 import time
+import threading
 import bidi
+import housekeeping
+from backend import make_backend
 
 # import gc # trying to avoid fork crash
 
@@ -632,6 +634,8 @@ class Sequencer(object):
         self.program = program  # empty program
         self.parameters = parameters  # memory of the parameter values set in XML/txt
         self.pointers = pointers  # memory of pointers set in txt
+        self.sources = []  # files the sequencer was compiled from (includes too)
+        self._timer = None  # SequencerTiming, see timer()
 
     def get_function(self, func):
         if func in range(16):
@@ -642,6 +646,32 @@ class Sequencer(object):
 
         return self.functions[func_id]
 
+    def timer(self):
+        """
+        Timing engine of this sequencer, created at the first use.
+        :rtype: SequencerTiming
+        """
+        if self._timer is None:
+            self._timer = SequencerTiming(self)
+        return self._timer
+
+    def changed(self, address=None, pointer=None):
+        """
+        To be called after modifying the program or a pointer, so that the timing engine only drops
+        the durations using them. Without argument, the timing engine is rebuilt.
+        :param address: address of a modified (or replaced) instruction
+        :param pointer: name of a modified pointer
+        """
+        if self._timer is None:
+            return
+        if address is None and pointer is None:
+            self._timer = None
+            return
+        if address is not None:
+            self._timer.instruction_changed(address)
+        if pointer is not None:
+            self._timer.pointer_changed(pointer)
+
     def pointer_value(self, typeptr, numptr):
         """
         Returns the pointer content for a given pointer type and number.
@@ -649,78 +679,298 @@ class Sequencer(object):
         :param numptr:
         :return:
         """
-        value = 0
-        for pname in self.pointers:
-            p = self.pointers[pname]
-            if p.pointer_type == typeptr and p.ptr_num() == numptr:
-                value = p.value
-                break
+        return self.timer().pointer_value(typeptr, numptr)
+
+    def timing(self, subr, verbose=False):
+        """
+        Computes timing for a given subroutine (in us).
+        If verbose, prints the breakout by instruction.
+        :param subr: name or address of the subroutine
+        :return: float
+        """
+        timer = self.timer()
+        total_time = timer.subroutine_time(subr)
+
+        if verbose:
+            # depth-first walk through the breakdowns
+            stack = [(0, iter(timer.breakdown(subr)))]
+            while stack:
+                level, steps = stack[-1]
+                step = next(steps, None)
+                if step is None:
+                    stack.pop()
+                    continue
+                print('%s%s  run time: %f us  run total: %f us' % ('\t' * level, step['instruction'],
+                                                                  step['time'], step['total']))
+                if step['type'] == 'JSR':
+                    stack.append((level + 1, iter(timer.breakdown(step['target']))))
+
+        return total_time
+
 
-        return value
+# units of the time parameters of the sequencers, in seconds
+time_units = {'ns': 1e-9, 'us': 1e-6, 'ms': 1e-3, 's': 1}
 
-    def recurse_time(self, start_address, clockperiod, recurse_level=0):
+
+def clock_period(parameters, default=10e-9):
+    """
+    FPGA clock period in seconds from the parameters of a sequencer. The .txt files give it
+    already converted to seconds, the .xml files as a string with its unit ('10 ns').
+    :param parameters: dict of the sequencer parameters
+    :param default: period if the sequencer does not define it
+    :return: float
+    """
+    value = parameters.get('clockperiod')
+    if value is None:
+        return default
+    if isinstance(value, (int, long, float)):
+        return float(value)
+
+    match = re.match(r'\s*([0-9.eE+-]+)\s*([a-z]+)\s*$', str(value))
+    if match is None or match.group(2) not in time_units:
+        raise ValueError('Unable to parse clock period %r' % value)
+
+    return float(match.group(1)) * time_units[match.group(2)]
+
+
+class SequencerTiming(object):
+    """
+    Timing engine of a Sequencer (times in us).
+    The program is split into subroutines (instructions from a start address up to the first one
+    that is neither a call nor a jump), and the durations of subroutines and functions are computed
+    once, without recursion, then memoized. Each subroutine duration records the instructions,
+    pointers and called subroutines it used: a modified instruction or pointer (see Sequencer.changed())
+    only drops the durations depending on it, other queries are answered from memory.
+    """
+
+    def __init__(self, seq):
+        self.seq = seq
+        self.clockperiod = clock_period(seq.parameters) * 1e6  # in us
+        # (type, number) -> pointer name
+        self.pointers = {}
+        for name, p in seq.pointers.iteritems():
+            self.pointers[(p.pointer_type, p.ptr_num())] = name
+        self.names = dict([(addr, name) for name, addr in seq.program.subroutines.iteritems()])
+        self.blocks = {}  # start address -> addresses of the subroutine
+        self.durations = {}  # start address -> duration
+        self.breakdowns = {}  # start address -> list of steps
+        self.function_durations = {}
+        self.dependents = {}  # key -> set of start addresses whose duration depends on it
+
+    def pointer_value(self, typeptr, numptr):
         """
-        Auxiliary for recursivity in timing().
-        :param start_adress:
-        :return:
+        Content of the pointer of given type and number (0 if there is none).
         """
-        current_address = start_address
-        total_time = 0
-        strlevel = '\t' * recurse_level
+        name = self.pointers.get((typeptr, numptr))
+        if name is None:
+            return 0
+        value = self.seq.pointers[name].value
 
-        while current_address in self.program.instructions:
-            instr = self.program.instructions[current_address]
-            if instr.opcode in instr.Call_codes:
-                # parse repetitions, look up function
-                if instr.opcode in [instr.OP_CallFunction, instr.OP_CallPointerFunction]:
-                    repetitions = instr.repeat
-                else:
-                    repetitions = self.pointer_value('REP_FUNC', instr.repeat)
-                if instr.opcode in [instr.OP_CallFunction, instr.OP_CallFuncPointerRepeat]:
-                    funcnum = instr.function_id
-                else:
-                    funcnum = self.pointer_value('PTR_FUNC', instr.function_id)
-                instr_time = self.functions[funcnum].total_time() * repetitions * clockperiod
-                total_time += instr_time
+        return value if value is not None else 0
 
-            elif instr.opcode in instr.Jsr_codes:
-                # parse repetitions, look up new address, iterate
-                if instr.opcode in [instr.OP_JumpToSubroutine, instr.OP_JumpPointerSubroutine]:
-                    repetitions = instr.repeat
-                else:
-                    repetitions = self.pointer_value('REP_SUBR', instr.repeat)
-                if instr.opcode in [instr.OP_JumpToSubroutine, instr.OP_JumpSubPointerRepeat]:
-                    target_address = instr.address
+    def address(self, subr):
+        """
+        Start address of a subroutine given by name or address.
+        """
+        if isinstance(subr, str):
+            if subr not in self.seq.program.subroutines:
+                raise ValueError('Unknown subroutine name: %s' % subr)
+            return self.seq.program.subroutines[subr]
+
+        return subr
+
+    def block(self, start):
+        """
+        Addresses of the calls and jumps of the subroutine starting at start, and of its end instruction.
+        """
+        if start not in self.blocks:
+            instructions = self.seq.program.instructions
+            addrs = []
+            addr = start
+            while addr in instructions:
+                addrs.append(addr)
+                instr = instructions[addr]
+                if instr.opcode not in instr.Call_codes and instr.opcode not in instr.Jsr_codes:
+                    break
+                addr += 1
+            self.blocks[start] = addrs
+
+        return self.blocks[start]
+
+    def function_time(self, funcnum):
+        """
+        Duration of a single call to a function.
+        """
+        if funcnum not in self.function_durations:
+            self.function_durations[funcnum] = self.seq.functions[funcnum].total_time() * self.clockperiod
+
+        return self.function_durations[funcnum]
+
+    def resolve(self, instr):
+        """
+        Repetitions and target of a call or jump, through pointers if needed.
+        :return: (type 'CALL' or 'JSR', repetitions, function number or subroutine address, pointer keys used)
+        """
+        used = []
+
+        def pointer(typeptr, numptr):
+            used.append((typeptr, numptr))
+            return self.pointer_value(typeptr, numptr)
+
+        if instr.opcode in instr.Call_codes:
+            if instr.infinite_loop:
+                repetitions = float('inf')
+            elif instr.opcode in [instr.OP_CallFunction, instr.OP_CallPointerFunction]:
+                repetitions = instr.repeat
+            else:
+                repetitions = pointer('REP_FUNC', instr.repeat)
+            if instr.opcode in [instr.OP_CallFunction, instr.OP_CallFuncPointerRepeat]:
+                target = instr.function_id
+            else:
+                target = pointer('PTR_FUNC', instr.function_id)
+            return 'CALL', repetitions, target, used
+
+        if instr.opcode in [instr.OP_JumpToSubroutine, instr.OP_JumpPointerSubroutine]:
+            repetitions = instr.repeat
+        else:
+            repetitions = pointer('REP_SUBR', instr.repeat)
+        if instr.opcode in [instr.OP_JumpToSubroutine, instr.OP_JumpSubPointerRepeat]:
+            target = instr.address
+        else:
+            target = pointer('PTR_SUBR', instr.address)
+        return 'JSR', repetitions, target, used
+
+    def compute(self, start):
+        """
+        Computes and memoizes the durations of the subroutine at start and of all subroutines it calls,
+        with an explicit stack instead of recursion.
+        """
+        instructions = self.seq.program.instructions
+        stack = [start]
+        waiting = set()  # subroutines waiting for their callees, to detect recursive calls
+
+        while stack:
+            current = stack[-1]
+            if current in self.durations:
+                stack.pop()
+                continue
+
+            steps = []
+            for addr in self.block(current):
+                instr = instructions[addr]
+                if instr.opcode in instr.Call_codes or instr.opcode in instr.Jsr_codes:
+                    steps.append((addr, instr) + self.resolve(instr))
+
+            missing = [target for addr, instr, optype, repetitions, target, used in steps
+                       if optype == 'JSR' and target not in self.durations]
+            if missing:
+                if current in waiting:
+                    raise ValueError('Recursive call of subroutine at 0x%03x' % current)
+                waiting.add(current)
+                stack.extend(missing)
+                continue
+
+            total_time = 0
+            breakdown = []
+            keys = [('addr', addr) for addr in self.block(current)]
+            for addr, instr, optype, repetitions, target, used in steps:
+                keys.extend([('ptr', key) for key in used])
+                if optype == 'CALL':
+                    keys.append(('func', target))
+                    instr_time = self.function_time(target) * repetitions if repetitions else 0
                 else:
-                    target_address = self.pointer_value('PTR_SUBR', instr.address)
-                instr_time = self.recurse_time(target_address, clockperiod, recurse_level=recurse_level+1) \
-                             * repetitions
+                    keys.append(('sub', target))
+                    instr_time = self.durations[target] * repetitions if repetitions else 0
                 total_time += instr_time
+                breakdown.append({'address': addr,
+                                  'instruction': repr(instr),
+                                  'type': optype,
+                                  'repeat': repetitions,
+                                  'target': target,
+                                  'name': self.names.get(target) if optype == 'JSR' else None,
+                                  'time': instr_time,
+                                  'total': total_time})
 
-            else:
-                print('%s%s  run total: %f us' % (strlevel, instr.__repr__(), total_time))
-                break
+            for key in keys:
+                self.dependents.setdefault(key, set()).add(current)
+            self.durations[current] = total_time
+            self.breakdowns[current] = breakdown
+            waiting.discard(current)
+            stack.pop()
 
-            # print here to get total after breakout for calls to subroutines
-            print('%s%s  run time: %f us  run total: %f us' % (strlevel, instr.__repr__(), instr_time, total_time))
-            current_address += 1
+    def subroutine_time(self, subr):
+        """
+        Duration of a subroutine given by name or address.
+        :return: float
+        """
+        start = self.address(subr)
+        if start not in self.durations:
+            self.compute(start)
 
-        return total_time
+        return self.durations[start]
 
-    def timing(self, subr):
+    def breakdown(self, subr):
         """
-        Computes timing for a given subroutine, with breakout by instruction.
-        :param subr:
-        :return:
+        Timing of the subroutine by instruction: list of dictionaries with address, instruction (as a string),
+        type ('CALL' or 'JSR'), repeat, target (function number or subroutine address), name (of the subroutine),
+        time (including repetitions) and total (running total).
+        """
+        start = self.address(subr)
+        if start not in self.durations:
+            self.compute(start)
+
+        return [dict(step) for step in self.breakdowns[start]]
+
+    def program_time(self):
+        """
+        Duration of the program as executed: from the MAIN pointer if any, otherwise from address 0.
+        """
+        if ('MAIN', 0) in self.pointers:
+            return self.subroutine_time(self.pointer_value('MAIN', 0))
+
+        return self.subroutine_time(0)
+
+    def invalidate(self, key):
+        """
+        Drops the durations depending on key, and those of their callers.
         """
-        # will need this, converts to us
-        p = self.parameters['clockperiod'] * 1e6
+        keys = [key]
+        while keys:
+            for start in self.dependents.pop(keys.pop(), ()):
+                if start in self.durations:
+                    del self.durations[start]
+                    del self.breakdowns[start]
+                    keys.append(('sub', start))
 
-        if subr not in self.program.subroutines:
-            print('Unknown subroutine name: %s' % subr)
+    def instruction_changed(self, address):
+        for start in [start for start, addrs in self.blocks.iteritems() if address in addrs]:
+            del self.blocks[start]
+        self.invalidate(('addr', address))
 
-        start_address = self.program.subroutines[subr]
-        return self.recurse_time(start_address, p)
+    def pointer_changed(self, name):
+        p = self.seq.pointers[name]
+        self.pointers[(p.pointer_type, p.ptr_num())] = name
+        self.invalidate(('ptr', (p.pointer_type, p.ptr_num())))
+
+
+def check_timing(seq):
+    """
+    Runs the timing engine on all subroutines of a sequencer, then checks that the durations
+    recomputed after invalidating every instruction are the same.
+    :return: dict {subroutine name: duration in us}
+    """
+    timer = SequencerTiming(seq)
+    durations = {}
+    for name in sorted(seq.program.subroutines):
+        durations[name] = timer.subroutine_time(name)
+        assert durations[name] >= 0, 'Negative duration of %s' % name
+
+    for address in sorted(seq.program.instructions):
+        timer.instruction_changed(address)
+    for name, duration in durations.iteritems():
+        assert timer.subroutine_time(name) == duration, 'Duration of %s changed' % name
+
+    return durations
 
 ## -----------------------------------------------------------------------
 
@@ -739,7 +989,10 @@ class Function(object):
 
         # TODO: add flexibility on the clock line bit map
 
-    def __repr__(self):
+    def header(self):
+        """
+        Header of the function representation: name, full name and channel names.
+        """
         s = "Function: " + self.name + "\n"
         s += "    " + self.fullname + "\n"
 
@@ -769,9 +1022,13 @@ class Function(object):
 
         s += l0 + '\n' + l1 + '\n' + l2 + '\n'
 
+        return s
+
+    def __repr__(self):
+        s = self.header()
         s += (73 * "-") + "\n"
         for sl in xrange(16):
-            bit_str = "%032d" % int(bin(self.outputs.get(sl, 0x0))[2:])
+            bit_str = "{0:032b}".format(self.outputs.get(sl, 0x0))
             s += "%02d\t %8d\t\t\t %s\n" % (sl,
                                             self.timelengths.get(sl, 0),
                                             bit_str)
@@ -885,6 +1142,13 @@ class MetaData(object):
             else:
                 self.comments[k] = ''
 
+    def copy(self):
+        """
+        Copy of the meta-data, independent from this one.
+        :rtype: MetaData
+        """
+        return MetaData(list(self.keys), self.values, self.comments, self.name)
+
     def update(self, addmeta):
         """
         Updates from another meta object.
@@ -915,6 +1179,21 @@ class MetaData(object):
 ## ----------------------------------------------------------
 
 
+def contiguous_runs(regs):
+    """
+    Splits a dictionary of register values into runs of contiguous addresses.
+    :param regs: dict
+    :return: list of (start address, list of values)
+    """
+    runs = []
+    for address in sorted(regs):
+        if runs and address == runs[-1][0] + len(runs[-1][1]):
+            runs[-1][1].append(regs[address])
+        else:
+            runs.append((address, [regs[address]]))
+    return runs
+
+
 def check_location(s, loc=3):
     if s not in [0, 1, 2]:
         raise ValueError("Invalid REB stripe (%d)" % s)
@@ -932,67 +1211,70 @@ class FPGA(object):
     program_base_addr = 0x300000
     program_mem_size = 0x3ff
     n_sensors_boardtemp = 10
+    # sequencer memory kept in the shadow image: (first address, last address)
+    shadow_ranges = [(0x100000, 0x1000ff),  # function outputs
+                     (0x200000, 0x2000ff),  # function slice durations
+                     (0x300000, 0x3003ff),  # program
+                     (0x340000, 0x340000),  # main pointer
+                     (0x350000, 0x38000f)]  # other pointers
+    # caching policy for registers read back: (first address, last address, policy)
+    # 'constant' is read once, 'writethrough' only changes when we write it,
+    # anything not listed is volatile and always read from the board
+    register_policies = [(0x0, 0x2, 'constant'),  # schema, version, SCI ID
+                         (0x340000, 0x340000, 'writethrough'),  # main pointer
+                         (0x350000, 0x38000f, 'writethrough'),  # other pointers
+                         (0x400007, 0x400007, 'writethrough')]  # stripe selection
     supplies = ['6V', '9V', '24V', '40V']
 
     # --------------------------------------------------------------------
 
-    def __init__(self, ctrl_host=None, reb_id=2):
+    def __init__(self, ctrl_host=None, reb_id=2, backend='subprocess'):
         self.reb_id = reb_id
         self.ctrl_host = ctrl_host
+        # register access: 'subprocess' (one rriClient per call), 'shell' (persistent) or 'fake'
+        self.backend = make_backend(backend, reb_id, ctrl_host)
+        # image of the sequencer memory as last written {address: value}
+        self.shadow = {}
+        # cached register values for non-volatile registers
+        self.regcache = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # background monitoring, see start_housekeeping()
+        self.housekeeping = None
+        self.hklock = threading.Lock()
         # declare two CABACs and two ASPICs for each stripe even if they will not be used
         # (at least we will want to initialize to 0)
 
+    def set_backend(self, backend):
+        """
+        Switches the register access backend, closing the previous one.
+        :param backend: string or RegisterBackend
+        """
+        self.backend.close()
+        self.backend = make_backend(backend, self.reb_id, self.ctrl_host)
+
     # --------------------------------------------------------------------
 
-    def read(self, address, n=1, check=True, fake=False, verbose=True):
+    def read(self, address, n=1, check=True, fake=False, verbose=True, cached=True):
         """
         Read a FPGA register and return its value.
         if n > 1, returns a list of values.
+        If cached is True, constant and write-through registers are answered from the cache when possible.
         """
-        # local/remote rriClient invocation... (for the moment)
-        # to be replaced
-
-        command = ("rriClient %d read 0x%0x %d" % (self.reb_id, address, n))
-
-        if self.ctrl_host is None:
-            remote_command = command
-        else:
-            remote_command = "ssh %s %s" % (self.ctrl_host, command)
-
         if fake:
-            print >> sys.stderr, remote_command
+            print >> sys.stderr, self.backend.read_command(address, n)
             return dict(zip(range(address, address + n), n * [0]))
 
-        proc = subprocess.Popen(remote_command, shell=True,
-                                stdout=subprocess.PIPE,
-                                stderr=subprocess.PIPE)
-        (out, err) = proc.communicate()
-        # print err
-
-        # out : 
-        # '  Register 0x4 (4): 0x9164efa8 (-1855656024)\n'
-        #
+        if cached and self.is_cacheable(address, n):
+            if self.is_cached(address, n):
+                self.cache_hits += 1
+                return dict([(a, self.regcache[a]) for a in xrange(address, address + n)])
+            self.cache_misses += 1
 
-        result = {}
-
-        lines = [line.strip() for line in out.split('\n')]
-
-        # print lines
-
-        for line in lines:
-            if verbose:
-                print line
-            if line == '':
-                continue
-            matches = re.match(
-                "Register ([-+]?(0[xX])?[\dA-Fa-f]+) \(([-+]?\d+)\)\: ([-+]?(0[xX])?[\dA-Fa-f]+) \(([-+]?\d+)\)",
-                line)
-            if not matches:
-                raise IOError("Failed to read register 0x%0x on FPGA" % address)
-            r = int(matches.group(1), base=16)
-            v = int(matches.group(4), base=16)
-
-            result[r] = v
+        result = self.backend.read(address, n, verbose)
+        for a, v in result.iteritems():
+            if self.register_policy(a) is not None:
+                self.regcache[a] = v
 
         # if the number of resulting values is different 
         # from the one requested, and check is True, raise an error
@@ -1008,33 +1290,157 @@ class FPGA(object):
         Write a given value into a FPGA register. 
         TODO : implement 'check'
         """
-        # "rriClient invocation... (for the moment)
-        # to be replaced
-
-        command = ("rriClient %d write 0x%0x 0x%0x" %
-                   (self.reb_id, address, value))
+        command = self.backend.write_command(address, value)
 
         if fake:
             print >> sys.stderr, command
             return
 
-        if self.ctrl_host is None:
-            remote_command = command
-        else:
-            remote_command = "ssh %s %s" % (self.ctrl_host, command)
-
-        proc = subprocess.Popen(remote_command, shell=True,
-                                stdout=subprocess.PIPE,
-                                stderr=subprocess.PIPE)
-        (out, err) = proc.communicate()
-        # print err
-        # out : 
-        # '  Register 0x4 (4): 0x9164efa8 (-1855656024)\n'
-        # print err
+        self.backend.write(address, value)
+        self.update_shadow(address, [value])
+        self.update_cache(address, [value])
         # printout for debug
         if check:
             print command
 
+    def write_block(self, address, values, fake=False):
+        """
+        Write a list of values into contiguous FPGA registers starting at <address>,
+        in a single transport transaction.
+        """
+        if fake:
+            for i, value in enumerate(values):
+                print >> sys.stderr, self.backend.write_command(address + i, value)
+            return
+
+        self.backend.write_block(address, values)
+        self.update_shadow(address, values)
+        self.update_cache(address, values)
+
+    def write_read(self, pairs, fake=False):
+        """
+        For each (write address, value, read address) in pairs, writes the value and reads back
+        one register, in a single transport transaction: pairs cannot be interleaved with other accesses.
+        Read registers are not cached (they are expected to change with the write).
+        :return: list of values read
+        """
+        if fake:
+            for waddress, value, raddress in pairs:
+                print >> sys.stderr, self.backend.write_command(waddress, value)
+                print >> sys.stderr, self.backend.read_command(raddress, 1)
+            return len(pairs) * [0]
+
+        values = self.backend.write_read(pairs)
+        for waddress, value, raddress in pairs:
+            self.update_shadow(waddress, [value])
+            self.update_cache(waddress, [value])
+
+        return values
+
+    def write_many(self, regs, fake=False):
+        """
+        Write a dictionary {address: value} of FPGA registers,
+        with one transport transaction per contiguous run of addresses.
+        """
+        for address, values in contiguous_runs(regs):
+            self.write_block(address, values, fake)
+
+    # --------------------------------------------------------------------
+
+    def register_policy(self, address):
+        """
+        Caching policy of a register: 'constant', 'writethrough' or None if volatile.
+        """
+        for first, last, policy in self.register_policies:
+            if first <= address <= last:
+                return policy
+        return None
+
+    def is_cacheable(self, address, n=1):
+        for a in xrange(address, address + n):
+            if self.register_policy(a) is None:
+                return False
+        return True
+
+    def is_cached(self, address, n=1):
+        for a in xrange(address, address + n):
+            if a not in self.regcache:
+                return False
+        return True
+
+    def update_cache(self, address, values):
+        """
+        Write-through of written values into the register cache.
+        Writing to a constant register forgets its cached value.
+        """
+        for i, value in enumerate(values):
+            policy = self.register_policy(address + i)
+            if policy == 'writethrough':
+                self.regcache[address + i] = value & 0xffffffff
+            elif policy == 'constant':
+                self.regcache.pop(address + i, None)
+
+    def invalidate_cache(self, address=None, n=1):
+        """
+        Forgets cached register values, all of them if address is None.
+        """
+        if address is None:
+            self.regcache = {}
+        else:
+            for a in xrange(address, address + n):
+                self.regcache.pop(a, None)
+
+    def cache_stats(self):
+        """
+        Cache hits (transport calls saved), misses and transport transactions so far.
+        :rtype: dict
+        """
+        return {'hits': self.cache_hits,
+                'misses': self.cache_misses,
+                'transactions': self.backend.transactions}
+
+    # --------------------------------------------------------------------
+
+    def in_shadow(self, address):
+        for first, last in self.shadow_ranges:
+            if first <= address <= last:
+                return True
+        return False
+
+    def update_shadow(self, address, values):
+        """
+        Records values written from address into the shadow image if they are sequencer memory.
+        """
+        for i, value in enumerate(values):
+            if self.in_shadow(address + i):
+                self.shadow[address + i] = value & 0xffffffff
+
+    def invalidate_shadow(self):
+        """
+        Forgets the shadow image, for instance after an FPGA reset.
+        The next sequencer upload will be complete.
+        """
+        self.shadow = {}
+        self.invalidate_cache()
+
+    def verify_shadow(self):
+        """
+        Reads back the sequencer memory covered by the shadow image and compares.
+        Invalidates the shadow image if it does not match the FPGA anymore.
+        :rtype: bool
+        """
+        for address, values in contiguous_runs(self.shadow):
+            readback = self.read(address, len(values), verbose=False, cached=False)
+            for i, value in enumerate(values):
+                if readback[address + i] != value:
+                    print >> sys.stderr, "Sequencer memory at 0x%0x is 0x%0x, expected 0x%0x: shadow is stale" % \
+                                         (address + i, readback[address + i], value)
+                    self.invalidate_shadow()
+                    return False
+        return True
+
+    # --------------------------------------------------------------------
+
     def write_spi(self, address, stripe, position, register, write=False):
         """
         Writes to an SPI serial link through the FPGA in the format defined for ASPIC and CABAC.
@@ -1045,13 +1451,42 @@ class FPGA(object):
         :param register: int
         :return:
         """
+        self.write(address, self.spi_command(stripe, position, register, write))
+
+    def spi_command(self, stripe, position, register, write=False):
+        """
+        Value to write to the SPI register for the given stripe, position and register content.
+        :rtype: int
+        """
         stripecode = 1 << (26 + stripe)
         positioncode = position << 24
         if write:
             regcode = ((1 << 23) | register) & 0xffffff
         else:
             regcode = register & 0x7fffff
-        self.write(address, stripecode + positioncode + regcode)
+        return stripecode + positioncode + regcode
+
+    def read_spi_registers(self, address, stripe, registers, positions=(2, 1)):
+        """
+        Reads back registers of the SPI chips (ASPIC or CABAC) of a stripe, for the given positions
+        (2 for top, 1 for bottom). All read commands and reads of the answer register
+        (address + 0x10 + stripe) are queued and sent in a single transport transaction.
+        :param address: int
+        :param stripe: int
+        :param registers: list of register addresses in the chips
+        :param positions: list of int
+        :return: dict {position: {register address: value}}
+        """
+        answer = address + 0x10 + stripe
+        requests = [(position, register) for register in registers for position in positions]
+        values = self.write_read([(address, self.spi_command(stripe, position, register << 16), answer)
+                                  for position, register in requests])
+
+        config = dict([(position, {}) for position in positions])
+        for (position, register), value in zip(requests, values):
+            config[position][register] = value
+
+        return config
 
     # --------------------------------------------------------------------
 
@@ -1063,24 +1498,33 @@ class FPGA(object):
         bc = instr.bytecode()
         self.write(mem_addr, bc)
 
-    def send_program(self, program, clear=True):
+    def program_registers(self, program, clear=True):
         """
-        Load the program <program> into the FPGA program memory.
+        Register image {address: bytecode} of the program <program>.
+        If clear is True, unused addresses up to the end of the likely program area are set to 0.
         """
-
         instrs = program.instructions
         addrs = instrs.keys()
         addrs.sort()
 
+        regs = {}
         # Clear the whole memory to avoid mixing with remains
         # of the previous programs
         # now limited to likely addresses to gain time
         if clear:
-            self.clear_program(addrs[-1]+16)
+            for i in xrange(addrs[-1] + 16):
+                regs[self.program_base_addr | i] = 0
 
-        # Load the instructions
         for addr in addrs:
-            self.send_program_instruction(addr, instrs[addr])
+            regs[self.program_base_addr | addr] = instrs[addr].bytecode()
+
+        return regs
+
+    def send_program(self, program, clear=True):
+        """
+        Load the program <program> into the FPGA program memory.
+        """
+        self.write_many(self.program_registers(program, clear))
 
     def dump_program(self):
         """
@@ -1110,15 +1554,14 @@ class FPGA(object):
         Option: limit to a likely block of addresses.
         """
         prg_addr = self.program_base_addr
-        for i in xrange(max_address and max_address or self.program_mem_size):
-            self.write(prg_addr + i, 0)
+        self.write_block(prg_addr, [0] * (max_address and max_address or self.program_mem_size))
 
             # --------------------------------------------------------------------
 
-    def send_function(self, function_id, function):
+    def function_registers(self, function_id, function):
         """
-        Send the function <function> into the FPGA memory 
-        at the #function_id slot.
+        Register image {address: value} of the function <function>
+        at the #function_id slot (slice durations and outputs).
         """
         if function_id not in range(16):
             raise ValueError("Invalid Function ID")
@@ -1128,23 +1571,30 @@ class FPGA(object):
 
         # Set the given function slices and outputs
         # function #0 -> special case, only the first slice has meaning
-
+        regs = {}
         for sl in xrange(16):
-            slice_addr = slices_addr | sl
             duration = function.timelengths.get(sl, 0) & 0xffff
-            if (function_id == 0) and (sl > 0):
-                duration = 0
-            self.write(slice_addr, duration)
-
-            output_addr = outputs_addr | sl
             output = function.outputs.get(sl, 0) & 0xffffffff
             if (function_id == 0) and (sl > 0):
+                duration = 0
                 output = 0
-            self.write(output_addr, output)
+            regs[slices_addr | sl] = duration
+            regs[outputs_addr | sl] = output
+
+        return regs
+
+    def send_function(self, function_id, function):
+        """
+        Send the function <function> into the FPGA memory 
+        at the #function_id slot.
+        """
+        self.write_many(self.function_registers(function_id, function))
 
     def send_functions(self, functions):
+        regs = {}
         for i, f in functions.iteritems():
-            self.send_function(i, f)
+            regs.update(self.function_registers(i, f))
+        self.write_many(regs)
 
     def dump_function(self, function_id):
         """
@@ -1204,22 +1654,62 @@ class FPGA(object):
         """
         return self.read(seqpointer.address)[seqpointer.address]
 
+    def pointer_registers(self, allpointers):
+        """
+        Register image {address: value} of all pointers.
+        """
+        regs = {}
+        for seqpointer in allpointers.itervalues():
+            regs[seqpointer.address] = seqpointer.value
+        return regs
+
     def send_pointers(self, allpointers):
         """
         Sends all pointers.
         :param allpointers:
         :return:
         """
-        for seqpointer in allpointers:
-            self.send_pointer(allpointers[seqpointer])
+        self.write_many(self.pointer_registers(allpointers))
 
     # --------------------------------------------------------------------
 
-    def send_sequencer(self, seq, clear=True):
+    def sequencer_registers(self, seq):
+        """
+        Register image {address: value} of the whole sequencer (program, functions, pointers).
+        Program memory that was used by the previous program is cleared.
+        """
+        regs = {}
+        for address, value in self.shadow.iteritems():
+            if self.program_base_addr <= address <= self.program_base_addr + self.program_mem_size and value:
+                regs[address] = 0
+        regs.update(self.program_registers(seq.program, clear=False))
+        for i, f in seq.functions.iteritems():
+            regs.update(self.function_registers(i, f))
+        regs.update(self.pointer_registers(seq.pointers))
+
+        return regs
+
+    def send_sequencer(self, seq, clear=True, incremental=False, verify=False):
         """
         Load the functions and the program at once.
         Plus pointers now (empty if does not apply).
-        """
+        If incremental is True, only writes the registers that differ from the shadow image
+        of what was last written (full upload if there is no shadow image yet).
+        If verify is True, the shadow image is checked against the FPGA memory first.
+        """
+        if incremental and verify:
+            self.verify_shadow()
+
+        if incremental and self.shadow:
+            regs = self.sequencer_registers(seq)
+            diff = {}
+            for address, value in regs.iteritems():
+                if self.shadow.get(address) != value:
+                    diff[address] = value
+            print >> sys.stderr, "Loading the sequencer: %d registers changed out of %d" % (len(diff), len(regs))
+            self.write_many(diff)
+            return
+
         # self.send_program(seq.program, clear = clear)
         print >> sys.stderr, "Loading the sequencer program..."
         self.send_program(seq.program, clear=clear)
@@ -1275,9 +1765,9 @@ class FPGA(object):
 
     # ----------------------------------------------------------
 
-    def get_state(self):
+    def get_state(self, verbose=True):
         addr = 0x8
-        result = self.read(address=addr)
+        result = self.read(address=addr, verbose=verbose)
         return result[addr]
 
     state = property(get_state, "FPGA state")
@@ -1351,14 +1841,14 @@ class FPGA(object):
 
     # ----------------------------------------------------------
 
-    def get_board_temperatures(self):
-        st = self.get_state()
+    def get_board_temperatures(self, verbose=True):
+        st = self.get_state(verbose)
         self.set_trigger(st | 0x10)
         # trigger will stop autonomously when done
-        while self.get_state() & 0x10:
+        while self.get_state(verbose) & 0x10:
             time.sleep(0.05)
 
-        raw = self.read(0x600010, self.n_sensors_boardtemp)
+        raw = self.read(0x600010, self.n_sensors_boardtemp, verbose=verbose)
         tempkeys = []
         temperatures = {}
         comments = {}
@@ -1376,13 +1866,13 @@ class FPGA(object):
 
     # ----------------------------------------------------------
 
-    def get_input_voltages_currents(self):
-        st = self.get_state()
+    def get_input_voltages_currents(self, verbose=True):
+        st = self.get_state(verbose)
         self.set_trigger(st | 0x08)
         # trigger will stop when done
-        while self.get_state() & 8:
+        while self.get_state(verbose) & 8:
             time.sleep(0.05)
-        raw = self.read(0x600000, len(self.supplies) * 2)
+        raw = self.read(0x600000, len(self.supplies) * 2, verbose=verbose)
 
         voltages = {}
         currents = {}
@@ -1416,8 +1906,94 @@ class FPGA(object):
         """
         Output for header.
         """
-        config = self.get_input_voltages_currents()
-        config.update(self.get_board_temperatures())
+        config = self.monitored(self.supply_keys(), self.get_input_voltages_currents)
+        config.update(self.monitored(self.boardtemp_keys(), self.get_board_temperatures))
 
         return config
+
+    # ----------------------------------------------------------
+
+    def supply_keys(self):
+        keys = []
+        for v in self.supplies:
+            keys.extend(['V_%s' % v, 'I_%s' % v])
+        return keys
+
+    def boardtemp_keys(self):
+        return ['TREB_%d' % i for i in xrange(self.n_sensors_boardtemp)]
+
+    def get_housekeeping(self, stripes, verbose=True):
+        """
+        All monitoring values read from the board, sampled by the housekeeping poller.
+        :param stripes: list of stripes
+        :param verbose: prints the registers read
+        :return: MetaData
+        """
+        hk = self.get_input_voltages_currents(verbose)
+        hk.update(self.get_board_temperatures(verbose))
+
+        return hk
+
+    def start_housekeeping(self, stripes=(0,), period=5., size=4096):
+        """
+        Starts sampling the monitoring values every period seconds in the background, between
+        sequencer runs. The last size samples are kept.
+        """
+        self.stop_housekeeping()
+        self.housekeeping = housekeeping.HousekeepingPoller(self, stripes, period, size)
+        self.housekeeping.start()
+
+    def stop_housekeeping(self):
+        if self.housekeeping is not None:
+            self.housekeeping.stop()
+            self.housekeeping = None
+
+    def housekeeping_meta(self, keys, maxage=None):
+        """
+        Latest values of keys from the housekeeping poller, None if they are not available or
+        older than maxage (by default twice the sampling period).
+        :return: MetaData
+        """
+        if self.housekeeping is None:
+            return None
+        if maxage is None:
+            maxage = 2 * self.housekeeping.period
+        values = self.housekeeping.latest(keys, maxage)
+        if values is None:
+            return None
+
+        return MetaData(list(keys), values, self.housekeeping.comments)
+
+    def monitored(self, keys, reader, *args):
+        """
+        Monitoring values from the housekeeping poller if recent enough, otherwise read with reader(*args).
+        :return: MetaData
+        """
+        meta = self.housekeeping_meta(keys)
+        if meta is None:
+            # not in the middle of a sweep of the poller
+            with self.hklock:
+                meta = reader(*args)
+
+        return meta
         
+
+
+if __name__ == "__main__":
+    import os
+    import glob
+    import rebtxt
+    import rebxml
+
+    cameradir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+    for seqfile in sorted(glob.glob(os.path.join(cameradir, '*', 'sequencer-*.*'))):
+        if seqfile.endswith('.txt'):
+            seq = rebtxt.fromtxtfile(seqfile)
+        elif seqfile.endswith('.xml'):
+            seq = rebxml.fromxmlfile(seqfile)
+        else:
+            continue
+        durations = check_timing(seq)
+        print "%-40s clock %g s, %2d subroutines, longest %.1f us" % \
+              (os.path.relpath(seqfile, cameradir), clock_period(seq.parameters), len(durations),
+               max(durations.values() + [0]))
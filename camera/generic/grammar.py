@@ -45,15 +45,16 @@ class SeqParser(object):
         self.length = len(self.s)
         
         # compiling patterns
-        self.p_zmsp =    re.compile("^" + self._p_zmsp)
-        self.p_omsp =    re.compile("^" + self._p_omsp)
-        self.p_newline = re.compile("^" + self._p_newline)
-        self.p_comment = re.compile("^" + self._p_comment)
-        self.p_integer = re.compile("^" + self._p_integer)
-        self.p_address = re.compile("^" + self._p_address)
-        self.p_name =    re.compile("^" + self._p_name)
-        self.p_duration_unit = re.compile("^" + self._p_duration_unit)
-        self.p_file = re.compile("^" + self._p_file)
+        # (matched in place with pattern.match(self.s, pos): no copy of the rest of the file)
+        self.p_zmsp =    re.compile(self._p_zmsp)
+        self.p_omsp =    re.compile(self._p_omsp)
+        self.p_newline = re.compile(self._p_newline)
+        self.p_comment = re.compile(self._p_comment)
+        self.p_integer = re.compile(self._p_integer)
+        self.p_address = re.compile(self._p_address)
+        self.p_name =    re.compile(self._p_name)
+        self.p_duration_unit = re.compile(self._p_duration_unit)
+        self.p_file = re.compile(self._p_file)
 
     #=======================================================================
 
@@ -66,12 +67,11 @@ class SeqParser(object):
             return pos
 
         # Always match, eat spaces
-        matches = self.p_zmsp.search(self.s[pos:])
+        matches = self.p_zmsp.match(self.s, pos)
         if matches == None:
             return pos
 
-        l = matches.end()
-        pnext = pos + l
+        pnext = matches.end()
         return pnext
 
 
@@ -80,12 +80,11 @@ class SeqParser(object):
         if pos >= self.length:
             return None
         
-        matches = self.p_omsp.search(self.s[pos:])
+        matches = self.p_omsp.match(self.s, pos)
         if matches == None:
             return None
 
-        l = matches.end()
-        pnext = pos + l
+        pnext = matches.end()
         return pnext
     
     #-----------------------------------------------------------------------
@@ -95,13 +94,12 @@ class SeqParser(object):
         if pos >= self.length:
             return None
 
-        matches = self.p_newline.search(self.s[pos:])
+        matches = self.p_newline.match(self.s, pos)
         if matches == None:
             return None
 
         # start = matches.start()
-        l = matches.end()
-        pnext = pos + l
+        pnext = matches.end()
 
         return pnext
 
@@ -112,14 +110,13 @@ class SeqParser(object):
         if pos >= self.length:
             return None
 
-        matches = self.p_comment.search(self.s[pos:])
+        matches = self.p_comment.match(self.s, pos)
         if matches == None:
             return None
 
         # start = matches.start()
-        l = matches.end()
         comment = matches.group(1)
-        pnext = pos + l
+        pnext = matches.end()
 
         comment = comment.strip()
         
@@ -162,13 +159,12 @@ class SeqParser(object):
     def m_integer(self, pos):
         pnext = pos
 
-        matches = self.p_integer.search(self.s[pnext:])
+        matches = self.p_integer.match(self.s, pnext)
         if matches == None:
             return None
 
-        l = matches.end()
         integer = int(matches.group(1))
-        pnext = pnext + l
+        pnext = matches.end()
 
         return (pnext, integer)
 
@@ -178,13 +174,12 @@ class SeqParser(object):
     def m_address(self, pos):
         pnext = pos
 
-        matches = self.p_integer.search(self.s[pnext:])
+        matches = self.p_integer.match(self.s, pnext)
         if matches == None:
             return None
 
-        l = matches.end()
         address = int(matches.group(1), 16)
-        pnext = pnext + l
+        pnext = matches.end()
 
         return (pnext, address)
 
@@ -194,13 +189,12 @@ class SeqParser(object):
     def m_name(self, pos):
         pnext = pos
 
-        matches = self.p_name.search(self.s[pnext:])
+        matches = self.p_name.match(self.s, pnext)
         if matches == None:
             return None
 
-        l = matches.end()
         name = matches.group(1)
-        pnext = pnext + l
+        pnext = matches.end()
 
         return (pnext, name)
 
@@ -242,13 +236,12 @@ class SeqParser(object):
     def m_duration_unit(self, pos):
         pnext = pos
 
-        matches = self.p_duration_unit.search(self.s[pos:])
+        matches = self.p_duration_unit.match(self.s, pos)
         if matches == None:
             return None
 
-        l = matches.end()
         unit = matches.group(1)
-        pnext = pos + l
+        pnext = matches.end()
 
         return pnext, unit
 
@@ -280,13 +273,12 @@ class SeqParser(object):
     def m_file_name(self,pos):
         pnext = pos
 
-        matches = self.p_file.search(self.s[pnext:])
+        matches = self.p_file.match(self.s, pnext)
         if matches == None:
             return None
 
-        l = matches.end()
         name = matches.group(1)
-        pnext = pnext + l
+        pnext = matches.end()
 
         return (pnext, name)
 
@@ -2136,12 +2128,15 @@ def merge_result(stronger, weaker):
     merge_section_dicts(stronger['mains'], weaker['mains'], 'name')
 
 
-def parse_file(txtfile):
+def parse_file(txtfile, files=None):
     """
     Parses input file, manages 'includes' section.
+    If files is a list, the names of all parsed files are appended to it.
     :param txtfile:
     :return:
     """
+    if files is not None:
+        files.append(txtfile)
     sfile = open(txtfile, 'r')
     s = sfile.read()
     sfile.close()
@@ -2156,9 +2151,75 @@ def parse_file(txtfile):
     for parentfile in reversed(result['includes']):
         parentname = parentfile[0]
         print('Including sequencer file: %s ' % parentname)
-        parentresult = parse_file(parentname)
+        parentresult = parse_file(parentname, files)
         merge_result(result, parentresult)
 
     return result
 
 
+
+## -----------------------------------------------------------------------
+
+
+def synthetic_source(s, factor):
+    """
+    Builds a larger sequencer source by repeating the subroutines section of s,
+    with renamed subroutines. Only meant for benchmarking the parser.
+    :param s: string
+    :param factor: int
+    :return: string
+    """
+    start = s.index('[subroutines]')
+    start = s.index('\n', start) + 1
+    end = s.index('[mains]')
+    block = s[start:end]
+    names = re.findall("^[ \t]+([A-Za-z][\dA-Za-z\_]*):", block, re.MULTILINE)
+
+    blocks = []
+    for i in xrange(factor):
+        renamed = block
+        for name in names:
+            renamed = re.sub("^([ \t]+)%s:" % name, "\\g<1>%s_%d:" % (name, i), renamed, flags=re.MULTILINE)
+        blocks.append(renamed)
+
+    return s[:start] + ''.join(blocks) + s[end:]
+
+
+def benchmark(txtfiles, factors=(1, 10, 100)):
+    """
+    Times the parsing of sequencer files, as shipped and scaled up with synthetic_source().
+    :param txtfiles: list of file names
+    :param factors: scaling factors
+    :return: list of (file name, factor, size in bytes, time in s)
+    """
+    import sys
+    import time
+
+    results = []
+    for txtfile in txtfiles:
+        with open(txtfile, 'r') as f:
+            s = f.read()
+        for factor in factors:
+            source = synthetic_source(s, factor)
+            # the parser is talkative
+            stdout = sys.stdout
+            sys.stdout = open('/dev/null', 'w')
+            try:
+                t0 = time.time()
+                SeqParser(source).m_seq(0)
+                dt = time.time() - t0
+            finally:
+                sys.stdout.close()
+                sys.stdout = stdout
+            results.append((txtfile, factor, len(source), dt))
+
+    return results
+
+
+if __name__ == "__main__":
+    import glob
+    import os
+
+    reb3dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'reb3')
+    for txtfile, factor, size, dt in benchmark(sorted(glob.glob(os.path.join(reb3dir, 'sequencer-*.txt')))):
+        print "%-30s x%-4d %9d bytes  %8.3f s" % (os.path.basename(txtfile), factor, size, dt)
@@ -0,0 +1,184 @@
+#
+# LSST / LPNHE
+#
+"""
+Background monitoring of REB telemetry.
+A HousekeepingPoller samples the board monitoring values (supplies, temperatures, slow ADC...)
+at a fixed rate, only while the sequencer is idle, and keeps their history in a RingBuffer,
+so that headers are filled from memory instead of reading the board while a frame waits.
+"""
+
+import time
+import threading
+import numpy as N
+
+
+class RingBuffer(object):
+    """
+    Fixed-size history of timestamped samples of a set of named values.
+    Missing values are stored as NaN.
+    """
+
+    def __init__(self, keys, size=4096):
+        self.keys = list(keys)
+        self.columns = dict([(key, i) for i, key in enumerate(self.keys)])
+        self.size = size
+        self.times = N.zeros(size)
+        self.data = N.empty((size, len(self.keys)))
+        self.data.fill(N.nan)
+        self.count = 0  # total number of samples appended
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return min(self.count, self.size)
+
+    def append(self, t, values):
+        """
+        Adds a sample. Keys unknown to the buffer are ignored.
+        :param t: timestamp
+        :param values: dict
+        """
+        row = N.empty(len(self.keys))
+        row.fill(N.nan)
+        for key, value in values.iteritems():
+            if key in self.columns:
+                try:
+                    row[self.columns[key]] = value
+                except (TypeError, ValueError):
+                    pass
+
+        with self.lock:
+            i = self.count % self.size
+            self.times[i] = t
+            self.data[i] = row
+            self.count += 1
+
+    def history(self, tstart=None, tend=None):
+        """
+        Samples taken between tstart and tend (included), in chronological order.
+        :return: (times, data) copies, data has one column per key
+        """
+        with self.lock:
+            n = len(self)
+            order = (N.arange(n) + (self.count - n)) % self.size
+            times = self.times[order]
+            data = self.data[order]
+
+        select = N.ones(n, dtype=bool)
+        if tstart is not None:
+            select &= (times >= tstart)
+        if tend is not None:
+            select &= (times <= tend)
+
+        return times[select], data[select]
+
+    def latest(self):
+        """
+        Last sample.
+        :return: (timestamp, dict of values), (None, {}) if empty
+        """
+        with self.lock:
+            if self.count == 0:
+                return None, {}
+            i = (self.count - 1) % self.size
+            t = self.times[i]
+            row = self.data[i].copy()
+
+        return t, dict([(key, row[j]) for j, key in enumerate(self.keys) if not N.isnan(row[j])])
+
+    def stats(self, tstart=None, tend=None):
+        """
+        Minimum, mean and maximum of each value over a time window.
+        :return: dict {key: (min, mean, max, number of samples)}, empty if no sample in the window
+        """
+        times, data = self.history(tstart, tend)
+        result = {}
+        for j, key in enumerate(self.keys):
+            column = data[:, j]
+            column = column[~N.isnan(column)]
+            if len(column):
+                result[key] = (column.min(), column.mean(), column.max(), len(column))
+
+        return result
+
+
+class HousekeepingPoller(threading.Thread):
+    """
+    Samples fpga.get_housekeeping(stripes) every period seconds, skipping the samples when the
+    sequencer is running, into a RingBuffer of size samples.
+    The buffer is created at the first sample, with the keys it returned.
+    """
+
+    def __init__(self, fpga, stripes=(0,), period=5., size=4096):
+        threading.Thread.__init__(self, name='HousekeepingPoller')
+        self.daemon = True
+        self.fpga = fpga
+        self.stripes = list(stripes)
+        self.period = period
+        self.size = size
+        self.buffer = None
+        self.comments = {}
+        self.skipped = 0  # samples skipped because the sequencer was running
+        self.stopped = threading.Event()
+
+    def sample(self):
+        """
+        Takes one sample if the sequencer is idle.
+        :return: bool, True if a sample was taken
+        """
+        # the lock is also taken when starting the sequencer
+        with self.fpga.hklock:
+            if self.fpga.get_state(verbose=False) & 4:
+                self.skipped += 1
+                return False
+            # quiet: sampled every period in the background
+            meta = self.fpga.get_housekeeping(self.stripes, verbose=False)
+            t = time.time()
+
+        if self.buffer is None:
+            self.buffer = RingBuffer(meta.keys, self.size)
+            self.comments = dict(meta.comments)
+        self.buffer.append(t, meta.values)
+
+        return True
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                self.sample()
+            except Exception as e:
+                print('Warning: housekeeping sample failed (%s)' % e)
+            self.stopped.wait(self.period)
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+    def latest(self, keys=None, maxage=None):
+        """
+        Latest values of the given keys (all if None).
+        :param maxage: returns None if the last sample is older than this (seconds)
+        :return: dict, or None if not available
+        """
+        if self.buffer is None:
+            return None
+        t, values = self.buffer.latest()
+        if t is None:
+            return None
+        if maxage is not None and time.time() - t > maxage:
+            return None
+        if keys is None:
+            return values
+        if not set(keys).issubset(values):
+            return None
+
+        return dict([(key, values[key]) for key in keys])
+
+    def stats(self, tstart=None, tend=None):
+        """
+        Minimum, mean and maximum of all values over a time window (see RingBuffer.stats).
+        """
+        if self.buffer is None:
+            return {}
+
+        return self.buffer.stats(tstart, tend)
@@ -0,0 +1,183 @@
+#
+# LSST / LPNHE
+#
+"""
+Detection of the end of a frame readout.
+The raw image is written by imageClient into the raw image directory: the frame is complete when
+the .img file is closed. On Linux this is watched with inotify (through ctypes, no extra module
+needed), elsewhere the file is polled with an adaptive delay.
+"""
+
+import os
+import time
+import select
+import struct
+import ctypes
+import ctypes.util
+
+# inotify constants from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CLOEXEC = 0x00080000
+IN_NONBLOCK = 0x00000800
+
+event_header = struct.Struct('iIII')  # wd, mask, cookie, len
+
+
+def wait_until(condition, timeout=None, mindelay=0.005, maxdelay=0.5, factor=1.5):
+    """
+    Polls condition() with a delay growing from mindelay to maxdelay, until it is True.
+    :param condition: function without argument
+    :param timeout: maximum waiting time in seconds (None to wait forever)
+    :return: bool, False if timed out
+    """
+    t0 = time.time()
+    delay = mindelay
+
+    while not condition():
+        if timeout is not None:
+            remaining = timeout - (time.time() - t0)
+            if remaining <= 0:
+                return False
+            delay = min(delay, remaining)
+        time.sleep(delay)
+        delay = min(delay * factor, maxdelay)
+
+    return True
+
+
+class InotifyWatcher(object):
+    """
+    Watches a directory for files closed after writing (or moved into it).
+    """
+    _libc = None
+
+    @classmethod
+    def libc(cls):
+        if cls._libc is None:
+            name = ctypes.util.find_library('c')
+            if not name:
+                raise OSError("C library not found")
+            libc = ctypes.CDLL(name, use_errno=True)
+            # raises AttributeError where inotify does not exist
+            libc.inotify_init1, libc.inotify_add_watch
+            cls._libc = libc
+        return cls._libc
+
+    def __init__(self, directory):
+        libc = self.libc()
+        self.fd = libc.inotify_init1(IN_CLOEXEC | IN_NONBLOCK)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        wd = libc.inotify_add_watch(self.fd, directory, IN_CLOSE_WRITE | IN_MOVED_TO)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, "inotify_add_watch failed on %s" % directory)
+
+    def read_names(self, timeout=None):
+        """
+        Waits for events and returns the names of the files closed or moved in.
+        :param timeout: seconds, None to wait forever
+        :return: list of strings (empty on timeout)
+        """
+        ready, w, x = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+
+        buff = os.read(self.fd, 65536)
+        names = []
+        pos = 0
+        while pos < len(buff):
+            wd, mask, cookie, length = event_header.unpack_from(buff, pos)
+            pos += event_header.size
+            names.append(buff[pos:pos + length].rstrip('\0'))
+            pos += length
+
+        return names
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+def inotify_available():
+    """
+    Whether inotify can be used on this system.
+    """
+    try:
+        InotifyWatcher.libc()
+        return True
+    except (OSError, AttributeError):
+        return False
+
+
+def file_complete(filename, size=None):
+    """
+    Polling criterion: the file exists and has the expected size if given.
+    """
+    try:
+        filesize = os.path.getsize(filename)
+    except OSError:
+        return False
+
+    if size is None:
+        return filesize > 0
+    return filesize >= size
+
+
+def wait_file(filename, timeout=None, size=None, use_inotify=True, maxdelay=0.2):
+    """
+    Waits until filename has been written and closed.
+    With inotify, returns on the close event of the file, or immediately if it already has the expected size.
+    Otherwise polls the file with an adaptive delay: the file must then have the expected size,
+    or keep the same size between two polls if size is None.
+    :param filename: string
+    :param timeout: seconds, None to wait forever
+    :param size: expected size in bytes, if known
+    :return: bool, False if timed out
+    """
+    directory, name = os.path.split(os.path.abspath(filename))
+
+    watcher = None
+    if use_inotify and os.path.isdir(directory) and inotify_available():
+        try:
+            watcher = InotifyWatcher(directory)
+        except OSError:
+            watcher = None
+
+    if watcher is None:
+        if size is not None:
+            return wait_until(lambda: file_complete(filename, size), timeout, maxdelay=maxdelay)
+
+        # unknown size: the file must not grow anymore
+        lastsize = [-1]
+
+        def stable():
+            try:
+                filesize = os.path.getsize(filename)
+            except OSError:
+                return False
+            done = (filesize > 0 and filesize == lastsize[0])
+            lastsize[0] = filesize
+            return done
+
+        return wait_until(stable, timeout, mindelay=0.05, maxdelay=maxdelay)
+
+    try:
+        # the watch is in place: a file already complete cannot be missed
+        if size is not None and file_complete(filename, size):
+            return True
+
+        t0 = time.time()
+        while True:
+            remaining = None
+            if timeout is not None:
+                remaining = timeout - (time.time() - t0)
+                if remaining <= 0:
+                    return False
+            if name in watcher.read_names(remaining):
+                return True
+    finally:
+        watcher.close()
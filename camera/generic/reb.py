@@ -12,10 +12,14 @@ talk to the appropriate FPGAs (which will inherit from the generic FPGA object).
 import time
 import datetime
 import os
+import itertools
+import hashlib
 import numpy as N
 import astropy.io.fits as pyfits
 import fpga
 import rebxml
+import seqcache
+import imagewatch
 
 
 def generate_tagstr():
@@ -31,6 +35,44 @@ def utc_now_isoformat():
 
 # Sequencer representation
 
+# number of sequencer tables kept by get_sequencer_table()
+seqtable_cache_size = 16
+_seqtable_cache = {}
+
+
+def bit_strings(values, nbits=32):
+    """
+    Binary representation of an array of integers, most significant bit first.
+    :param values: sequence of integers
+    :return: N.array of strings of length nbits
+    """
+    values = N.asarray(values, dtype=N.uint64).reshape(-1)
+    shifts = N.arange(nbits - 1, -1, -1, dtype=N.uint64)
+    bits = ((values[:, N.newaxis] >> shifts) & 1).astype(N.uint8) + ord('0')
+
+    return N.ascontiguousarray(bits).view('S%d' % nbits).reshape(-1)
+
+
+def sequencer_hash(seq):
+    """
+    Content hash of a sequencer: functions, program and pointers.
+    :param seq: Sequencer
+    :return: string
+    """
+    h = hashlib.sha1()
+    for ifunc in sorted(seq.functions):
+        func = seq.functions[ifunc]
+        h.update(repr((ifunc, func.name, func.fullname,
+                       sorted(func.timelengths.items()), sorted(func.outputs.items()))))
+    instructions = seq.program.instructions
+    for addr in sorted(instructions):
+        h.update(repr((addr, sorted(instructions[addr].__dict__.items()))))
+    for p in sorted(seq.pointers):
+        h.update(repr(seq.pointers[p]))
+
+    return h.hexdigest()
+
+
 def get_sequencer_hdu(seq):
     """
     Builds table HDU for FITS file containing sequencer dump
@@ -38,25 +80,34 @@ def get_sequencer_hdu(seq):
     :return: pyfits.TableHDU
     """
     prog = seq.program
-    progaddr = prog.instructions.keys()
+    progaddr = sorted(prog.instructions.keys())
     prognum = 256 + len(progaddr)
 
     slicenum = N.zeros(shape=(prognum,), dtype=N.dtype('a4'))
     output = N.zeros(shape=(prognum,), dtype=N.dtype('a32'))
     duration = N.zeros(shape=(prognum,), dtype=N.dtype('i8'))
 
+    islices = []
+    outputs = []
+    timelengths = []
     for ifunc in seq.functions:
         func = seq.get_function(ifunc)
         for islice in func.outputs.keys():
-            i = ifunc * 16 + islice
-            slicenum[i] = hex(i)[2:]
-            output[i] = bin(func.outputs[islice])[2:]
-            duration[i] = func.timelengths[islice]
-
-    for i, addr in enumerate(sorted(progaddr)):
-        slicenum[i+256] = '3' + '%03x' % addr
-        output[i+256] = prog.instructions[addr].__repr__()[:20]
-        duration[i+256] = prog.instructions[addr].repeat
+            islices.append(ifunc * 16 + islice)
+            outputs.append(func.outputs[islice])
+            timelengths.append(func.timelengths[islice])
+
+    if islices:
+        # same as bin() without leading zeros
+        bits = N.char.lstrip(bit_strings(outputs), '0')
+        bits[bits == ''] = '0'
+        slicenum[islices] = ['%x' % i for i in islices]
+        output[islices] = bits
+        duration[islices] = timelengths
+
+    slicenum[256:] = ['3%03x' % addr for addr in progaddr]
+    output[256:] = [repr(prog.instructions[addr])[:20] for addr in progaddr]
+    duration[256:] = [prog.instructions[addr].repeat for addr in progaddr]
 
     slicecol = pyfits.Column(name="Address", format='A4', array=slicenum)
     outputcol = pyfits.Column(name="Output", format='A32', array=output)
@@ -69,31 +120,68 @@ def get_sequencer_hdu(seq):
     return exthdu
 
 
+def function_lines(func):
+    """
+    Lines of the representation of a sequencer function (as in Function.__repr__), tabs expanded.
+    :param func: Function
+    :return: list of strings
+    """
+    lines = [l.expandtabs(8) for l in func.header().splitlines() if l]
+    lines.append(73 * "-")
+
+    bits = bit_strings([func.outputs.get(sl, 0x0) for sl in xrange(16)])
+    for sl in xrange(16):
+        prefix = ("%02d\t %8d\t\t\t " % (sl, func.timelengths.get(sl, 0))).expandtabs(8)
+        lines.append(prefix + bits[sl])
+
+    return lines
+
+
 def get_sequencer_string(seq):
     """
     Builds a string table representation of the sequencer content in seq.
     :ptype seq: Sequencer
     :return: N.array
     """
-    reprarray = N.zeros(shape=(0,), dtype=N.dtype('a73'))
+    lines = []
 
     # all functions
     for ifunc in seq.functions:
-        reprfunc = seq.functions[ifunc].__repr__()
-        for l in reprfunc.splitlines():
-            if l:
-                reprarray = N.append(reprarray, l.expandtabs(8))
+        lines.extend(function_lines(seq.functions[ifunc]))
 
     # splitting the subroutine stack into array lines
-    reprprog = seq.program.__repr__()
-    for l in reprprog.splitlines():
-        reprarray = N.append(reprarray, l)
+    lines.extend(repr(seq.program).splitlines())
 
     # adding the pointer values if any
     for p in seq.pointers:
-        reprarray = N.append(reprarray, seq.pointers[p].__repr__())
+        lines.append(repr(seq.pointers[p]))
+
+    return N.array(lines, dtype=N.dtype('a73'))
+
+
+def get_sequencer_table(seq, seqhash=None):
+    """
+    TableHDU 'SEQUENCER' with the string representation of the sequencer, for FITS files.
+    Tables are kept by content hash of the sequencer, so that switching back to an earlier
+    configuration does not rebuild them. The header is a copy, the data is shared.
+    :param seq: Sequencer
+    :param seqhash: sequencer_hash(seq) if already known
+    :return: pyfits.TableHDU
+    """
+    if seqhash is None:
+        seqhash = sequencer_hash(seq)
+
+    seqhdu = _seqtable_cache.get(seqhash)
+    if seqhdu is None:
+        seqhdu = pyfits.TableHDU.from_columns([pyfits.Column(format='A73',
+                                                             array=get_sequencer_string(seq),
+                                                             ascii=True)])
+        seqhdu.header['EXTNAME'] = 'SEQUENCER'
+        if len(_seqtable_cache) >= seqtable_cache_size:
+            _seqtable_cache.clear()
+        _seqtable_cache[seqhash] = seqhdu
 
-    return reprarray
+    return pyfits.TableHDU(data=seqhdu.data, header=seqhdu.header.copy())
 
 # FITS mosaic formating
 
@@ -188,10 +276,85 @@ def make_fits_name(fitstopdir, imgstr, compressed=True):
     return fitsname
 
 
+def make_primary_hdu(imgcols, imglines, nchannels, channels=None, displayborders=False):
+    """
+    Creates the primary HDU of the image file with the detector geometry keywords.
+    :rtype: pyfits.PrimaryHDU
+    """
+    primaryhdu = pyfits.PrimaryHDU()
+    detstring = get_detsize(imgcols, imglines, nchannels, channels, displayborders)
+    primaryhdu.header['DETSIZE'] = (detstring, 'NOAO MOSAIC keywords')
+    primaryhdu.header['WIDTH'] = (imgcols, 'CCD columns per channel')
+    primaryhdu.header['HEIGHT'] = (imglines, 'CCD lines per channel')
+
+    return primaryhdu
+
+
+def read_channels(imgname, imgcols, imglines, nchannels, channels=None, blocklines=256):
+    """
+    Iterates over the channels of a raw .img file, yielding (channel number, data) one channel at a time.
+    The file is memory-mapped and each channel is de-interleaved by blocks of lines directly into its
+    output array, where the 18-bit sign conversion is applied in place: only one channel is held in memory.
+    :param imgname: file in .img format
+    :param imgcols: columns in a single channel
+    :param imglines: lines in a single channel
+    :param nchannels: total number of channels acquired
+    :param channels: selected channels, if not None
+    :param blocklines: number of lines de-interleaved at once
+    """
+    raw = N.memmap(imgname, dtype=N.dtype('i4'), mode='r', shape=(imglines, imgcols, nchannels))
+
+    try:
+        for num in range(nchannels):
+            if channels:  # to skip non-useful channels
+                if num not in channels:
+                    continue
+            y = N.empty((imglines, imgcols), dtype=N.int32)
+            for start in range(0, imglines, blocklines):
+                block = y[start:start + blocklines]
+                block[:] = raw[start:start + blocklines, :, num]
+                # for 18-bit data:
+                # negative numbers are translated, sign is inverted on all data, also make all values positive
+                # 0 -> 1FFFF, 1FFFF -> 0, 20000 -> 3FFFF, 3FFFF -> 20000
+                # this works by XORing the lowest 17 bits
+                N.bitwise_xor(block, 0x1FFFF, out=block)
+            yield num, y
+    finally:
+        del raw
+
+
+def make_channel_hdu(num, y, imgcols, imglines, detstring, channels=None, displayborders=False):
+    """
+    Creates the compressed image HDU of a single channel.
+    :param num: channel number
+    :param y: channel data, as given by read_channels()
+    :rtype: pyfits.CompImageHDU
+    """
+    # create extension to fits file for each channel
+    exthdu = pyfits.CompImageHDU(data=y, name="CHAN_%d" % num, compression_type='RICE_1')
+    get_extension_header(imgcols, imglines, num, exthdu, detstring, channels, displayborders)
+    avchan = N.mean(y[11:imgcols-50, 2:imglines-20])
+    exthdu.header["AVERAGE"] = avchan
+
+    return exthdu
+
+
+def channel_hdus(imgname, imgcols, imglines, nchannels, channels=None, displayborders=False):
+    """
+    Iterates over the compressed image HDUs of the channels of a raw .img file, built one at a time.
+    :rtype: generator of pyfits.CompImageHDU
+    """
+    detstring = get_detsize(imgcols, imglines, nchannels, channels, displayborders)
+
+    for num, y in read_channels(imgname, imgcols, imglines, nchannels, channels):
+        yield make_channel_hdu(num, y, imgcols, imglines, detstring, channels, displayborders)
+
+
 def conv_to_fits(imgname, imgcols, imglines, nchannels, channels=None, displayborders=False):
     """
     Creates the fits object from the acquired data.
     If channels is not None, it is the list of channels to be saved.
+    Use stream_to_fits() to write the file without holding all channels in memory.
     :param imgname: file in .img format
     :param imgcols: columns in a single channel
     :param imglines: lines in a single channel
@@ -199,50 +362,40 @@ def conv_to_fits(imgname, imgcols, imglines, nchannels, channels=None, displaybo
     :param channels: selected channels to convert to fits, if not None
     :param displayborders: if the displayed image will include the non-exposed areas
     """
-
-    # Reading raw file to array
-    dt = N.dtype('i4')
-    buff = N.fromfile(imgname, dtype=dt)
-
-    # for 18-bit data:
-    # negative numbers are translated, sign is inverted on all data, also make all values positive
-    # 0 -> 1FFFF, 1FFFF -> 0, 20000 -> 3FFFF, 3FFFF -> 20000
-    # this works by XORing the lowest 17 bits
-    rawdata = N.bitwise_xor(buff, 0x1FFFF)
-    # reshape by channel
-    length = imglines * imgcols
-    rawdata = rawdata.reshape(length, nchannels)
-
-    # Creating FITS HDUs:
     # Create empty primary HDU and fills header
-    primaryhdu = pyfits.PrimaryHDU()
-    detstring = get_detsize(imgcols, imglines, nchannels, channels, displayborders)
-    primaryhdu.header['DETSIZE'] = (detstring, 'NOAO MOSAIC keywords')
-    primaryhdu.header['WIDTH'] = (imgcols, 'CCD columns per channel')
-    primaryhdu.header['HEIGHT'] = (imglines, 'CCD lines per channel')
+    primaryhdu = make_primary_hdu(imgcols, imglines, nchannels, channels, displayborders)
     # Create HDU list
     hdulist = pyfits.HDUList([primaryhdu])
 
     # Add extensions for channels HDUs
-    for num in range(nchannels):
-        if channels:  # to skip non-useful channels
-            if num not in channels:
-                continue
-        chan = rawdata[0:length, num]
-        chan = chan.reshape(imglines, imgcols)
-        y = chan.astype(N.int32)
-        # create extension to fits file for each channel
-        #if self.compression:
-        exthdu = pyfits.CompImageHDU(data=y, name="CHAN_%d" % num, compression_type='RICE_1')
-        #else:
-            #exthdu = pyfits.ImageHDU(data=y, name="CHAN_%d" % num)  # for non-compressed image
-        get_extension_header(imgcols, imglines, num, exthdu, detstring, channels, displayborders)
-        avchan = N.mean(y[11:imgcols-50, 2:imglines-20])
-        exthdu.header["AVERAGE"] = avchan
+    for exthdu in channel_hdus(imgname, imgcols, imglines, nchannels, channels, displayborders):
         hdulist.append(exthdu)
 
     return hdulist
 
+
+def stream_to_fits(fitsname, imgname, imgcols, imglines, nchannels, channels=None, displayborders=False,
+                   primaryhdu=None, extrahdus=[]):
+    """
+    Writes the FITS file of the acquired data one HDU at a time: each channel is written as soon as
+    it is converted, so that peak memory is a single channel instead of the whole frame.
+    The primary HDU must then be complete before the call, extra HDUs (sequencer, meta) are written last.
+    :param fitsname: output FITS file
+    :param imgname: file in .img format
+    :param primaryhdu: primary HDU as made by make_primary_hdu(), created if None
+    :param extrahdus: list of HDUs appended after the channels
+    """
+    if primaryhdu is None:
+        primaryhdu = make_primary_hdu(imgcols, imglines, nchannels, channels, displayborders)
+    primaryhdu.writeto(fitsname, clobber=True)
+
+    for hdu in itertools.chain(channel_hdus(imgname, imgcols, imglines, nchannels, channels, displayborders),
+                               extrahdus):
+        # reopening releases the data of the HDUs already written
+        fitsfile = pyfits.open(fitsname, mode='append')
+        fitsfile.append(hdu)
+        fitsfile.close()
+
 # =======================================================================
 
 
@@ -257,11 +410,12 @@ class REB(object):
     imgcols = 550
     exposuresub = "Exposure"
     darksub = "DarkExposure"
+    use_seqcache = True  # reuse compiled sequencers from the disk cache (see seqcache.py)
 
     # ===================================================================
 
-    def __init__(self, reb_id=2,  ctrl_host=None, stripe_id=[0]):
-        self.fpga = fpga.FPGA(ctrl_host, reb_id)
+    def __init__(self, reb_id=2,  ctrl_host=None, stripe_id=[0], backend='subprocess'):
+        self.fpga = fpga.FPGA(ctrl_host, reb_id, backend)
         self.stripes = []
         self.nchannels = 0  # total number of channels acquired
         self.set_stripes(stripe_id)  # stripe in use
@@ -273,9 +427,11 @@ class REB(object):
         self.min_exposure = int(0.1 / self.exposure_unit)  # minimal shutter opening time (not used for darks)
         # initialize parameters for frames
         self.seq = None  # will be filled when loading the sequencer
+        self.seqtable = None  # (sequencer, TableHDU) kept by get_sequencer_table()
         self.exptime = 0
         self.shutdelay = 0
         self.tstamp = 0
+        self.tsequence = None  # time.time() at the start of the last sequence
         self.seqname = ""  # there is actually no way to access that from self.seq, filled when called by name
         self.memorized_sequence = 'Bias'  # used when switching to a peculiar sequence
 
@@ -331,12 +487,17 @@ class REB(object):
         :return:
         """
         self.xmlfile = xmlfile
-        
-        self.seq = rebxml.fromxmlfile(os.path.join(self.xmldir, self.xmlfile))
 
-    def load_sequencer(self, xmlfile=None):
+        if self.use_seqcache:
+            self.seq = seqcache.fromfile(os.path.join(self.xmldir, self.xmlfile), rebxml.fromxmlfile)
+        else:
+            self.seq = rebxml.fromxmlfile(os.path.join(self.xmldir, self.xmlfile))
+        self.sequencer_changed()
+
+    def load_sequencer(self, xmlfile=None, incremental=False):
         """
         Loads all sequencer content.
+        If incremental is True, only the FPGA registers that changed since the last load are written.
         :return:
         """
         if xmlfile:
@@ -347,7 +508,7 @@ class REB(object):
                 self.read_sequencer_file(self.xmlfile)
 
         self.wait_end_sequencer()
-        self.fpga.send_sequencer(self.seq)
+        self.fpga.send_sequencer(self.seq, incremental=incremental)
 
         self.imglines = self.seq.parameters['ReadLines']
         self.imgcols = self.seq.parameters['ReadColumns']
@@ -360,6 +521,50 @@ class REB(object):
         # select a subroutine to fill self.seqname
         self.select_subroutine('Bias')
 
+    def sequencer_changed(self, address=None, pointer=None):
+        """
+        To be called when self.seq is modified: drops the sequencer table kept for FITS files,
+        and the sequencer timings depending on the modified instruction or pointer (all if not given).
+        :param address: address of the modified instruction
+        :param pointer: name of the modified pointer
+        """
+        self.seqtable = None
+        if self.seq is not None:
+            self.seq.changed(address, pointer)
+
+    def sequence_duration(self, subname=None):
+        """
+        Expected duration of a sequence from the sequencer content, in seconds.
+        :param subname: subroutine name, by default the currently selected sequence
+        :return: float, None if it cannot be computed (no sequencer, infinite loop...)
+        """
+        if self.seq is None:
+            return None
+        if subname is None:
+            subname = self.seqname
+        try:
+            duration = self.seq.timer().subroutine_time(subname) * 1e-6
+        except Exception as e:
+            # the caller falls back to the exposure time
+            print('Warning: could not compute duration of sequence %s (%s)' % (subname, e))
+            return None
+        if duration == float('inf'):
+            return None
+
+        return duration
+
+    def get_sequencer_table(self):
+        """
+        TableHDU 'SEQUENCER' of the current sequencer (see get_sequencer_table()), rebuilt only
+        after a change of the sequencer.
+        :return: pyfits.TableHDU
+        """
+        if self.seqtable is None or self.seqtable[0] is not self.seq:
+            self.seqtable = (self.seq, get_sequencer_table(self.seq))
+        seqhdu = self.seqtable[1]
+
+        return pyfits.TableHDU(data=seqhdu.data, header=seqhdu.header.copy())
+
     def select_subroutine(self, subname, repeat=1):
         """
         Modify the main subroutine to be a call (JSR) to the subroutine.
@@ -378,6 +583,7 @@ class REB(object):
         self.wait_end_sequencer()
         self.fpga.send_program_instruction(0x0, first_instr)
         self.seq.program.instructions[0x0] = first_instr  # to keep it in sync
+        self.sequencer_changed(address=0x0)
         self.seqname = subname
         print('Sequencer program set to %s' % subname)
 
@@ -413,6 +619,7 @@ class REB(object):
         exposureadd = self.seq.program.subroutines[self.exposuresub]
         newinstruction = self.seq.program.instructions[exposureadd]
         newinstruction.repeat = int(max(newiter, self.min_exposure))  # This does rewrite the seq.program too
+        self.sequencer_changed(address=exposureadd)
         self.wait_end_sequencer()
         self.fpga.send_program_instruction(exposureadd, newinstruction)
 
@@ -430,6 +637,7 @@ class REB(object):
         darkadd = self.seq.program.subroutines[self.darksub]
         newinstruction = self.seq.program.instructions[darkadd]
         newinstruction.repeat = int(max(newiter, 1))  # must not be 0 or sequencer gets stuck
+        self.sequencer_changed(address=darkadd)
         self.wait_end_sequencer()
         self.fpga.send_program_instruction(darkadd, newinstruction)
 
@@ -440,12 +648,39 @@ class REB(object):
 
      # --------------------------------------------------------------------
 
-    def wait_end_sequencer(self):
+    def wait_end_sequencer(self, timeout=None):
         """
         Waits until the sequencer is not running anymore.
+        The state is polled with a short delay growing up to 0.5 s, so that the end of a sequence
+        is detected within a fraction of its duration.
+        :param timeout: seconds, None to wait forever
+        :return: bool, False if timed out
         """
-        while self.fpga.get_state() & 4:  # sequencer status bit in the register
-            time.sleep(1)
+        # sequencer status bit in the register
+        return imagewatch.wait_until(lambda: not (self.fpga.get_state(verbose=False) & 4), timeout)
+
+    def wait_end_readout(self, imgname=None, timeout=None):
+        """
+        Waits until the raw image of the current frame is complete, returns its name.
+        If the raw image directory is local, watches for the file to be written and closed by imageClient,
+        otherwise waits for the end of the sequencer.
+        :param imgname: raw file name, by default the one of the latest frame
+        :param timeout: seconds, None to wait forever
+        :return: string
+        """
+        if imgname is None:
+            imgname = self.make_img_name()
+
+        if os.path.isdir(os.path.dirname(imgname)):
+            size = self.imgcols * self.imglines * self.nchannels * 4
+            done = imagewatch.wait_file(imgname, timeout, size)
+        else:
+            done = self.wait_end_sequencer(timeout)
+
+        if not done:
+            raise IOError("Timeout waiting for the end of readout of %s" % imgname)
+
+        return imgname
 
     def config_sequence(self, name, exptime=0.1, shutdelay=100):
         """
@@ -473,7 +708,10 @@ class REB(object):
         if self.seqname not in ['Wait', 'InfiniteWait']:
             self.update_filetag()
         self.tstamp = utc_now_isoformat()
-        self.fpga.start()
+        self.tsequence = time.time()
+        # not while the housekeeping poller is reading the board
+        with self.fpga.hklock:
+            self.fpga.start()
         print("Starting %s sequence with %f exposure time." % (self.seqname, self.exptime))
         #freeze until image output (do not send commands while the COB is acquiring)
         #time.sleep(self.exptime+3)
@@ -522,6 +760,40 @@ class REB(object):
 
     # --------------------------------------------------------------------
 
+    def start_housekeeping(self, period=5., size=4096):
+        """
+        Starts monitoring the board in the background between sequences (see FPGA.start_housekeeping).
+        """
+        self.fpga.start_housekeeping(self.stripes, period, size)
+
+    def stop_housekeeping(self):
+        self.fpga.stop_housekeeping()
+
+    def get_meta_housekeeping(self, tstart=None, tend=None):
+        """
+        Mean of the monitoring values over a time window, with their minimum and maximum in the comments.
+        Only reads memory.
+        The poller does not sample while the sequencer runs, so the default window starts one sampling
+        period before the last sequence (if any): it holds the sample taken just before it and those taken since.
+        :return: MetaData
+        """
+        if self.fpga.housekeeping is None or self.fpga.housekeeping.buffer is None:
+            return fpga.MetaData([])
+        if tstart is None and self.tsequence is not None:
+            tstart = self.tsequence - self.fpga.housekeeping.period
+
+        stats = self.fpga.housekeeping.stats(tstart, tend)
+        comments = self.fpga.housekeeping.comments
+        orderkeys = [key for key in self.fpga.housekeeping.buffer.keys if key in stats]
+        dictvalues = {}
+        dictcomments = {}
+        for key in orderkeys:
+            vmin, vmean, vmax, n = stats[key]
+            dictvalues[key] = round(vmean, 3)
+            dictcomments[key] = '%s (mean of %d, %.3f to %.3f)' % (comments.get(key, ''), n, vmin, vmax)
+
+        return fpga.MetaData(orderkeys, dictvalues, dictcomments)
+
     def get_meta_operating(self):
         """
         Gets all REB operating parameters. For headers and checks.
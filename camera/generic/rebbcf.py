@@ -80,6 +80,12 @@ class REBconfig(ConfigParser):
 
         self.hardware = self.get('board', 'hardware')
 
+        # register access backend (optional, see generic/backend.py)
+        if self.has_option('board', 'backend'):
+            self.backend = self.get('board', 'backend')
+        else:
+            self.backend = 'subprocess'
+
         # 2D ADC data: CCD Segment/ADC Channel row/col
         if size is None:
             self.row    = self.getint('board', 'row')
@@ -15,6 +15,7 @@ import os.path
 from reb import *
 import rebtxt
 import rebbcf
+import seqcache
 
 class REBplus(REB):
 
@@ -34,7 +35,7 @@ class REBplus(REB):
         ctrl_host = None  # would be self.config.ipaddress if it was used
         stripe_id = self.config.stripes.keys()
 
-        REB.__init__(self, reb_id,  ctrl_host, stripe_id)
+        REB.__init__(self, reb_id,  ctrl_host, stripe_id, self.config.backend)
         self.xmlfile = self.config.xmlfile  # has been overwritten by REB initializer
         # parameters are the same as the parent at initialization
         # will be filled when loading the sequencer
@@ -60,14 +61,19 @@ class REBplus(REB):
         """
         self.xmlfile = xmlfile
 
-        self.seq = rebtxt.fromtxtfile(os.path.join(self.xmldir, self.xmlfile))
+        if self.use_seqcache:
+            self.seq = seqcache.fromfile(os.path.join(self.xmldir, self.xmlfile), rebtxt.fromtxtfile)
+        else:
+            self.seq = rebtxt.fromtxtfile(os.path.join(self.xmldir, self.xmlfile))
+        self.sequencer_changed()
 
         self.exposure_unit = self.seq.parameters['ElemExposure']  # in s
         self.min_exposure = int(0.1 / self.exposure_unit)  # minimal shutter opening time (not used for darks)
 
-    def load_sequencer(self, xmlfile=None):
+    def load_sequencer(self, xmlfile=None, incremental=False):
         """
         Loads all sequencer content.
+        If incremental is True, only the FPGA registers that changed since the last load are written.
         :return:
         """
         if xmlfile:
@@ -78,7 +84,7 @@ class REBplus(REB):
                 self.read_sequencer_file(self.xmlfile)
 
         self.wait_end_sequencer()
-        self.fpga.send_sequencer(self.seq)
+        self.fpga.send_sequencer(self.seq, incremental=incremental)
 
         # ! change of name compared to XML
         # also change of convention: everything is a window now
@@ -128,6 +134,7 @@ class REBplus(REB):
             seqpointer.target = newtarget
             seqpointer.value = self.seq.program.subroutines[seqpointer.target]
 
+        self.sequencer_changed(pointer=pointername)
         # write to FPGA
         self.fpga.send_pointer(seqpointer)
 
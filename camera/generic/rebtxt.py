@@ -27,6 +27,7 @@ class TxtParser(object):
         self.unnamed_subroutine_num = 0
         self.pointers = {}
         self.pointers_desc = {}
+        self.files = []
 
 
     def process_number(self, s):
@@ -393,7 +394,8 @@ class TxtParser(object):
 
     def parse_file(self, txtfile):
         # parser manages includes of other files and fuses dictionaries
-        result = grammar.parse_file(txtfile)
+        self.files = []
+        result = grammar.parse_file(txtfile, self.files)
 
         return self.parse_result(result)
 
@@ -440,6 +442,7 @@ def fromtxtfile(txtfile):
                     program=program,
                     parameters=parameters,
                     pointers=prg.seq_pointers)
+    seq.sources = list(parser.files)
 
     return seq
 
@@ -452,6 +452,7 @@ def fromxmlfile(xmlfile):
                     functions_desc=functions_desc,
                     program=program,
                     parameters=parameters)
+    seq.sources = [xmlfile]
 
     return seq
 
@@ -0,0 +1,201 @@
+#
+# LSST / LPNHE
+#
+"""
+On-disk cache of compiled sequencers.
+A sequencer file (XML or text with its includes) is compiled once, then the resulting Sequencer
+(program, functions, pointers, parameters) is stored in a compressed binary file named after
+the content hash of the source. The hashes of the included files are stored along and checked
+at load time, so that a modified include also triggers a recompilation.
+Includes are stored as written in the source: like the compilers, the check resolves them
+from the current directory, so it reads the same files as a new compilation would.
+"""
+
+import os
+import hashlib
+import zlib
+import cPickle
+
+from fpga import Sequencer, Program, Instruction, Function, SequencerPointer
+import bidi
+
+cache_version = 2
+cachedir = os.path.join(os.path.expanduser('~'), '.cache', 'lsst-sequencer')
+
+
+def file_hash(filename):
+    """
+    SHA1 of the content of a file.
+    :rtype: string
+    """
+    with open(filename, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def cache_name(filename, compiler):
+    """
+    Name of the cache file for a given source file and compiler function.
+    """
+    h = hashlib.sha1()
+    h.update('%d:%s.%s:' % (cache_version, compiler.__module__, compiler.__name__))
+    with open(filename, 'rb') as f:
+        h.update(f.read())
+    return os.path.join(cachedir, h.hexdigest() + '.seq')
+
+## -----------------------------------------------------------------------
+
+
+def sequencer_to_data(seq):
+    """
+    Converts a Sequencer to plain python types.
+    :type seq: Sequencer
+    :rtype: dict
+    """
+    functions = {}
+    for ifunc, func in seq.functions.iteritems():
+        functions[ifunc] = (func.name, func.fullname, func.timelengths, func.outputs)
+
+    functions_desc = {}
+    for name, desc in seq.functions_desc.iteritems():
+        functions_desc[name] = dict([(k, v) for k, v in desc.iteritems() if k != 'function'])
+
+    instructions = {}
+    for addr, instr in seq.program.instructions.iteritems():
+        instructions[addr] = dict(instr.__dict__)
+
+    pointers = {}
+    for name, ptr in seq.pointers.iteritems():
+        pointers[name] = dict(ptr.__dict__)
+
+    return {'channels': dict(seq.channels.dictionary),
+            'channels_desc': seq.channels_desc,
+            'functions': functions,
+            'functions_desc': functions_desc,
+            'instructions': instructions,
+            'subroutines': seq.program.subroutines,
+            'parameters': seq.parameters,
+            'pointers': pointers}
+
+
+def sequencer_from_data(data):
+    """
+    Rebuilds a Sequencer from the output of sequencer_to_data().
+    Objects are rebuilt without calling their constructors, which would renumber pointers.
+    :type data: dict
+    :rtype: Sequencer
+    """
+    channels = bidi.BidiMap([], [])
+    channels.update(data['channels'])
+
+    functions = {}
+    for ifunc, (name, fullname, timelengths, outputs) in data['functions'].iteritems():
+        functions[ifunc] = Function(name=name, fullname=fullname,
+                                    timelengths=timelengths, outputs=outputs, channels=channels)
+
+    functions_desc = {}
+    for name, desc in data['functions_desc'].iteritems():
+        functions_desc[name] = dict(desc)
+        functions_desc[name]['function'] = functions[desc['idfunc']]
+
+    program = Program()
+    program.subroutines = dict(data['subroutines'])
+    for addr, fields in data['instructions'].iteritems():
+        instr = Instruction.__new__(Instruction)
+        instr.__dict__.update(fields)
+        program.instructions[addr] = instr
+
+    pointers = {}
+    for name, fields in data['pointers'].iteritems():
+        ptr = SequencerPointer.__new__(SequencerPointer)
+        ptr.__dict__.update(fields)
+        pointers[name] = ptr
+
+    return Sequencer(channels=channels,
+                     channels_desc=data['channels_desc'],
+                     functions=functions,
+                     functions_desc=functions_desc,
+                     program=program,
+                     parameters=data['parameters'],
+                     pointers=pointers)
+
+## -----------------------------------------------------------------------
+
+
+def save(seq, filename):
+    """
+    Writes the compiled sequencer to the cache file, with hashes of its source files.
+    """
+    # not absolute paths: from another directory, the includes are other files
+    sources = [(source, file_hash(source)) for source in seq.sources]
+    blob = zlib.compress(cPickle.dumps((sources, sequencer_to_data(seq)), cPickle.HIGHEST_PROTOCOL))
+
+    cdir = os.path.dirname(filename)
+    if not os.path.isdir(cdir):
+        os.makedirs(cdir)
+    # write then rename so that a concurrent reader never sees a partial file
+    tmpname = '%s.%d' % (filename, os.getpid())
+    with open(tmpname, 'wb') as f:
+        f.write(blob)
+    os.rename(tmpname, filename)
+
+
+def load(filename):
+    """
+    Reads a compiled sequencer from the cache file.
+    Returns None if the file does not exist or if any source file changed.
+    :rtype: Sequencer
+    """
+    if not os.path.isfile(filename):
+        return None
+
+    with open(filename, 'rb') as f:
+        sources, data = cPickle.loads(zlib.decompress(f.read()))
+
+    for source, h in sources:
+        if not os.path.isfile(source) or file_hash(source) != h:
+            return None
+
+    seq = sequencer_from_data(data)
+    seq.sources = [source for source, h in sources]
+
+    return seq
+
+
+def fromfile(seqfile, compiler):
+    """
+    Returns the Sequencer compiled from seqfile, from the cache if possible.
+    compiler is the function to use otherwise (rebtxt.fromtxtfile or rebxml.fromxmlfile).
+    :param seqfile: string
+    :param compiler: function
+    :rtype: Sequencer
+    """
+    cname = cache_name(seqfile, compiler)
+
+    try:
+        seq = load(cname)
+    except Exception as e:
+        print('Warning: could not read sequencer cache %s (%s)' % (cname, e))
+        seq = None
+
+    if seq is not None:
+        print('Loaded compiled sequencer from cache %s' % cname)
+        return seq
+
+    seq = compiler(seqfile)
+    try:
+        save(seq, cname)
+    except (IOError, OSError) as e:
+        print('Warning: could not write sequencer cache %s (%s)' % (cname, e))
+
+    return seq
+
+
+def clear():
+    """
+    Removes all cached sequencers.
+    """
+    if not os.path.isdir(cachedir):
+        return
+    for fname in os.listdir(cachedir):
+        if fname.endswith('.seq'):
+            os.remove(os.path.join(cachedir, fname))
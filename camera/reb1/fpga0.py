@@ -267,7 +267,7 @@ class FPGA0(FPGA):
         Output for header.
         """
 
-        config = self.get_input_voltages_currents()
+        config = self.monitored(self.supply_keys(), self.get_input_voltages_currents)
         config.update(self.get_aspic_config(s))
         config.update(self.get_cabac_config(s))
         config.update(self.get_dacs())
@@ -6,6 +6,7 @@
 #
 from lsst.camera.generic.fpga import *
 import time
+import numpy as N
 
 import lsst.camera.generic.aspic as aspic
 
@@ -19,6 +20,10 @@ class FPGA3(FPGA):
     supplies = ['DREB', '7V', 'VDDCLK', 'VDDOD']
     n_sensors_boardtemp = 10
 
+    register_policies = FPGA.register_policies + [(0x330000, 0x330001, 'writethrough'),  # ADC sampling increment
+                                                  (0x800001, 0x800002, 'constant'),  # board serial number
+                                                  (0xD00000, 0xD00000, 'writethrough')]  # BSS switch
+
      # list of acceptable parameters for REB commands
     params = ["OD", "GD", "RD", "OG", 'CS',
               "SL", "SU", "RGL", "RGU", "PL", "PU"]
@@ -137,12 +142,13 @@ class FPGA3(FPGA):
 
     # --------------------------------------------------------------------
 
-    def __init__(self, ctrl_host=None, reb_id=2, hardware='REB3'):
-        FPGA.__init__(self, ctrl_host, reb_id)
+    def __init__(self, ctrl_host=None, reb_id=2, hardware='REB3', backend='subprocess'):
+        FPGA.__init__(self, ctrl_host, reb_id, backend)
         # declare two ASPICs for each stripe even if they will not be used
         self.aspics = {}
         self.aspics['top'] = [aspic.ASPIC(), aspic.ASPIC(), aspic.ASPIC()]
         self.aspics['bottom'] = [aspic.ASPIC(), aspic.ASPIC(), aspic.ASPIC()]
+        self.aspic_configs = {}  # ASPIC readback by stripe, until the next change
 
         self.dacs = {}
         for param in self.dacparams:
@@ -158,12 +164,14 @@ class FPGA3(FPGA):
         Reads the REB serial number stored in a chip on the board.
         :rtype: string
         """
-        self.write(0x800000, 1)  # starts REB SN acquisition
-        time.sleep(0.01)
+        if not self.is_cached(0x800001, 2):
+            self.write(0x800000, 1)  # starts REB SN acquisition
+            time.sleep(0.01)
         regs = self.read(0x800001, 2)
         controlbits = regs[0x800002] >> 16
         if not controlbits & 1:
             print('Error code %d while reading the board serial number' % controlbits)
+            self.invalidate_cache(0x800001, 2)
         SNstring = '0x%04x%08x' % (regs[0x800002] & 0xffff, regs[0x800001])
 
         return SNstring
@@ -489,9 +497,9 @@ class FPGA3(FPGA):
             self.write(0x600101, 0x2220)
             self.write(0x600101, 0x2420)
 
-    def slow_adc_readmux(self, muxtuple):
+    def slow_adc_muxcommand(self, muxtuple):
         """
-        Triggers reading of slow ADC pointed at the given address
+        Value to write to 0x600101 to select the slow ADC input given by muxtuple.
         For REB3, muxtuple is:
         extmux: address on external 8-channel mux
         adcmux: address on internal 16-channel mux
@@ -501,38 +509,64 @@ class FPGA3(FPGA):
         adcmux: internal 4-channel mux of the ADC
         :rtype: int
         """
-
         if self.hardware == 'REB3':
             extmux, adcmux = muxtuple
             # includes enable bit on 8-channel mux
-            self.write(0x600101, ((extmux & 7) << 5) + (1 << 4) + (adcmux & 0xf))
-            raw = self.read(0x601010, 1)[0x601010]
-            value = raw & 0xfff
-            checkextmux = (raw >> 21) & 7
-            checkadcmux = (raw >> 12) & 0xf
-            if (checkextmux != extmux) or (checkadcmux != adcmux):
-                print('Warning: mismatch in slow ADC read %d, %d' % (checkextmux, checkadcmux))
-            # convert ADU to V or mA (for current sources)
-            value *=  self.adcconvert
+            return ((extmux & 7) << 5) + (1 << 4) + (adcmux & 0xf)
 
         elif self.hardware == 'REB4':
             # TODO: initialization needs to be done elsewhere
             # assuming range does not need to be changed for each value individually
             muxsam, muxselect, adcmux = muxtuple
             # write to muxes and ADC channel select
-            self.write(0x600101, ((muxsam & 7) << 19) + ((muxselect & 7) << 16) + (1 << 8) + ((adcmux & 0x3) << 5))
-            raw = self.read(0x601010, 1)[0x601010]
-            value = raw & 0xfff
-            checkadcmux = (raw >> 13) & 0x3
-            if checkadcmux != adcmux:
-                print('Warning: mismatch in slow ADC, reading channel %d' %  checkadcmux)
-            # convert ADU to V or mA (for current sources)
-            value *=  self.adcconvert[adcmux]
+            return ((muxsam & 7) << 19) + ((muxselect & 7) << 16) + (1 << 8) + ((adcmux & 0x3) << 5)
 
         else:
             raise ValueError('No slow ADC rules for this hardware type: %s' % self.hardware)
 
-        return value
+    def slow_adc_readmuxes(self, muxtuples):
+        """
+        Reads the slow ADC at all the given mux addresses. The write/read pairs are sent in a single
+        transaction, conversion is done on the whole array.
+        Timestamps are spread evenly over the duration of the transaction.
+        :return: (values, timestamps) as numpy arrays
+        """
+        if not muxtuples:
+            return N.zeros(0), N.zeros(0)
+
+        pairs = [(0x600101, self.slow_adc_muxcommand(muxtuple), 0x601010) for muxtuple in muxtuples]
+        t0 = time.time()
+        raw = N.array(self.write_read(pairs), dtype=N.int64)
+        t1 = time.time()
+        timestamps = N.linspace(t0, t1, len(pairs) + 1)[1:]
+
+        muxes = N.array(muxtuples, dtype=N.int64).reshape(len(pairs), -1)
+        values = (raw & 0xfff).astype(N.float64)
+        if self.hardware == 'REB3':
+            checkextmux = (raw >> 21) & 7
+            checkadcmux = (raw >> 12) & 0xf
+            mismatch = (checkextmux != muxes[:, 0]) | (checkadcmux != muxes[:, 1])
+            for i in N.flatnonzero(mismatch):
+                print('Warning: mismatch in slow ADC read %d, %d' % (checkextmux[i], checkadcmux[i]))
+            # convert ADU to V or mA (for current sources)
+            values *= self.adcconvert
+        else:
+            checkadcmux = (raw >> 13) & 0x3
+            for i in N.flatnonzero(checkadcmux != muxes[:, 2]):
+                print('Warning: mismatch in slow ADC, reading channel %d' % checkadcmux[i])
+            # convert ADU to V or mA (for current sources)
+            values *= N.array(self.adcconvert)[muxes[:, 2]]
+
+        return values, timestamps
+
+    def slow_adc_readmux(self, muxtuple):
+        """
+        Triggers reading of slow ADC pointed at the given address (see slow_adc_muxcommand).
+        :rtype: float
+        """
+        values, timestamps = self.slow_adc_readmuxes([muxtuple])
+
+        return values[0]
 
     def aspic_temperature_read(self):
         """
@@ -562,41 +596,81 @@ class FPGA3(FPGA):
         :type param: string
         :rtype: float
         """
-        muxtuple = self.adcmap[param]
+        values, timestamps = self.slow_adc_sweep([param])
+
+        return values[0]
 
-        value = self.slow_adc_readmux(muxtuple)
+    def slow_adc_sweep(self, keys):
+        """
+        Reads a list of parameters by name in a single transaction.
+        :param keys: list of parameter names (keys of self.adcmap)
+        :return: (values, timestamps) as numpy arrays
+        """
+        values, timestamps = self.slow_adc_readmuxes([self.adcmap[key] for key in keys])
         # resistor bridge for biases
-        if param[:2] in self.groups['BIASES']:
-            value *= 11
+        bridge = N.array([key[:2] in self.groups['BIASES'] for key in keys], dtype=bool)
+        values[bridge] *= 11
+
+        return values, timestamps
 
-        return value
+    def slow_adc_keys(self, s):
+        """
+        Slow ADC parameters relevant to a given stripe, sorted for reliable order in the header.
+        """
+        # last digit of parameter name is always the stripe
+        return [key for key in sorted(self.adcmap.keys()) if key[-1] == '%d' % s]
 
     def slow_adc_stripe(self, s):
         """
-        Reads all slow ADC values relevant to a given stripe.
+        Reads all slow ADC values relevant to a given stripe, in a single sweep.
         :param s: stripe
         :return:
         """
         self.check_location(s)
 
-        orderkeys = []
+        orderkeys = self.slow_adc_keys(s)
+        values, timestamps = self.slow_adc_sweep(orderkeys)
+
         dictvalues = {}
         dictcomments = {}
 
-        # sort dictionary keys for reliable order in the header
-        for key in sorted(self.adcmap.keys()):
-            # last digit of parameter name is always the stripe
-            if key[-1] == '%d' % s:
-                value = self.slow_adc_read(key)
-                orderkeys.append(key)
-                dictvalues[key] = round(value, 3)
-                if key[:2] == 'CS':
-                    dictcomments[key] = '[mA] current in source %s' % key
-                else:
-                    dictcomments[key] = '[V] %s voltage read through slow ADC' % key
+        for key, value in zip(orderkeys, values):
+            dictvalues[key] = round(value, 3)
+            if key[:2] == 'CS':
+                dictcomments[key] = '[mA] current in source %s' % key
+            else:
+                dictcomments[key] = '[V] %s voltage read through slow ADC' % key
 
         return MetaData(orderkeys, dictvalues, dictcomments)
 
+    def get_housekeeping(self, stripes, verbose=True):
+        """
+        Monitoring values for the housekeeping poller: supplies, board temperatures
+        and a single sweep of the slow ADC values of the stripes (including ASPIC temperatures),
+        plus the clock rails where they can be read back.
+        :return: MetaData
+        """
+        hk = FPGA.get_housekeeping(self, stripes, verbose)
+
+        keys = []
+        for s in stripes:
+            keys.extend(self.slow_adc_keys(s))
+        # values which do not belong to a stripe (clock rails on REB4)
+        keys.extend([key for key in sorted(self.adcmap.keys()) if not key[-1].isdigit()])
+
+        values, timestamps = self.slow_adc_sweep(keys)
+        dictvalues = {}
+        dictcomments = {}
+        for key, value in zip(keys, values):
+            dictvalues[key] = round(value, 3)
+            if key[:2] == 'CS':
+                dictcomments[key] = '[mA] current in source %s' % key
+            else:
+                dictcomments[key] = '[V] %s voltage read through slow ADC' % key
+        hk.update(MetaData(keys, dictvalues, dictcomments))
+
+        return hk
+
     # ----------------------------------------------------------
     #TODO: heaters (not urgent ?)
     # ----------------------------------------------------------
@@ -604,34 +678,29 @@ class FPGA3(FPGA):
     def get_aspic_config(self, s=0, check=False):
         """
         Read ASPIC configurations for the given stripe and updates objects in class.
-        If check is true then it checks that the readback is the same as the expected value.
+        The readback is kept until the ASPICs of the stripe are modified, unless check is true: then the ASPICs
+        are read again and it checks that the readback is the same as the expected value.
         :param s:
         """
         self.check_location(s)
 
-        topconfig = {}
-        bottomconfig = {}
+        if not check and s in self.aspic_configs:
+            return self.aspic_configs[s].copy()
 
-        for address in range(3):
-            # send for reading top ASPIC
-            self.write_spi(0xB00000, s, 2, address << 16)
-            # read answer
-            topconfig[address] = self.read(0xB00010 + s, 1)[0xB00010 + s]
-            # send for reading bottom ASPIC
-            self.write_spi(0xB00000, s, 1, address << 16)
-            # read answer
-            bottomconfig[address] = self.read(0xB00010 + s, 1)[0xB00010 + s]
+        # top and bottom ASPICs in a single transaction
+        regs = self.read_spi_registers(0xB00000, s, range(3))
 
-        self.aspics['top'][s].read_all_registers(topconfig, True)
-        self.aspics['bottom'][s].read_all_registers(bottomconfig, True)
+        self.aspics['top'][s].read_all_registers(regs[2], True)
+        self.aspics['bottom'][s].read_all_registers(regs[1], True)
 
         keyst, configt, comt = self.aspics['top'][s].get_header("%dT" % s)
         keysb, configb, comb = self.aspics['bottom'][s].get_header("%dB" % s)
 
         config = MetaData(keyst, configt, comt, 'ASPICS')
         config.update_ordered(keysb, configb, comb)
+        self.aspic_configs[s] = config
 
-        return config
+        return config.copy()
 
     def set_aspic_value(self, param, value, s=0, loc=3):
         """
@@ -639,6 +708,7 @@ class FPGA3(FPGA):
         object.
         """
         self.check_location(s, loc)
+        self.aspic_configs.pop(s, None)
 
         if loc == 1 or loc == 3:
             # bottom ASPIC
@@ -655,6 +725,7 @@ class FPGA3(FPGA):
         (1 for bottom, 2 for top, 3 for both).
         """
         self.check_location(s, loc)
+        self.aspic_configs.pop(s, None)
 
         if loc == 1 or loc == 3:
             # bottom ASPIC
@@ -675,6 +746,7 @@ class FPGA3(FPGA):
         :return:
         """
         self.check_location(s)
+        self.aspic_configs.pop(s, None)
 
         self.write(0xB00001, s)
     # ----------------------------------------------------------
@@ -688,7 +760,7 @@ class FPGA3(FPGA):
         config.update(self.get_clock_voltages())
         config.update(self.get_bias_voltages(s, readback=False))
         config.update(self.get_current_source(s, readback=False)) # readback with slow ADC
-        config.update(self.slow_adc_stripe(s))
+        config.update(self.monitored(self.slow_adc_keys(s), self.slow_adc_stripe, s))
         config.update(self.get_aspic_config(s, check=False))
 
         return config
@@ -10,6 +10,7 @@
 __author__ = 'juramy'
 
 import lsst.camera.generic.reb as reb
+import lsst.camera.generic.fitswriter as fitswriter
 from lsst.camera.generic.rebplus import *
 import time
 import os
@@ -27,7 +28,9 @@ class REB3(REBplus):
         REBplus.__init__(self, bcfile)
         # self.config holds the desired running configuration, not updated to reflect current values
         # (those are in ASPIC objects and in FPGA)
-        self.fpga = fpga.FPGA3(ctrl_host=None, reb_id=self.config.reb_id, hardware=self.config.hardware)
+        self.fpga.backend.close()
+        self.fpga = fpga.FPGA3(ctrl_host=None, reb_id=self.config.reb_id, hardware=self.config.hardware,
+                               backend=self.config.backend)
 
      # --------------------------------------------------------------------
 
@@ -226,12 +229,13 @@ class REB3(REBplus):
  # --------------------------------------------------------------------
 
 
-def save_to_fits(R, channels=None, rawimg='', fitsname = ""):  # not meant to be part of REB class, will call other instruments
+def save_to_fits(R, channels=None, rawimg='', fitsname = "", workers=None):  # not meant to be part of REB class, will call other instruments
     """
     Managing FITS creation from img file and adding other header information.
     :type R: lsst.camera.reb3.reb3.REB3
     :param channels: list of channels
     :param fitsname: name if not using default structure.
+    :param workers: number of processes compressing the channels (see fitswriter.default_workers).
     :return:
     """
     if rawimg:
@@ -239,8 +243,7 @@ def save_to_fits(R, channels=None, rawimg='', fitsname = ""):  # not meant to be
     else:
         imgname = R.make_img_name()
     if os.path.isfile(imgname):
-        hdulist = reb.conv_to_fits(imgname, R.imgcols, R.imglines, R.nchannels, channels, displayborders=True)
-        primaryhdu = hdulist[0]
+        primaryhdu = reb.make_primary_hdu(R.imgcols, R.imglines, R.nchannels, channels, displayborders=True)
         imgstr = os.path.splitext(os.path.basename(imgname))[0]
         primaryhdu.header["IMAGETAG"] = imgstr
         if not fitsname:
@@ -265,13 +268,12 @@ def save_to_fits(R, channels=None, rawimg='', fitsname = ""):  # not meant to be
         #for key in headermeta.keys:
         #    exthdu.header[key] = (headermeta.values[key], headermeta.comments[key])
         # Sequencer content (no actual readback, get it from the seq object)
-        seqhdu = pyfits.TableHDU.from_columns([pyfits.Column(format='A73',
-                                                         array=reb.get_sequencer_string(R.seq),
-                                                         ascii=True)])
-        seqhdu.header['EXTNAME'] = 'SEQUENCER'
-        hdulist.append(seqhdu)
+        seqhdu = R.get_sequencer_table()
 
-        hdulist.writeto(fitsname, clobber=True)
+        # channels are converted and written one by one
+        fitswriter.stream_to_fits(fitsname, imgname, R.imgcols, R.imglines, R.nchannels, channels,
+                                  displayborders=True, primaryhdu=primaryhdu, extrahdus=[seqhdu],
+                                  workers=workers)
 
         print("Wrote FITS file "+fitsname)
     else:
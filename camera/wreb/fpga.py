@@ -23,16 +23,20 @@ class FPGA1(FPGA):
     og_conv = 0.00122  # placeholder for alternative OG
     VddOD = 14  # high voltage power supply to CABAC if used for biases
 
+    register_policies = FPGA.register_policies + [(0x330000, 0x330001, 'writethrough'),  # ADC sampling increment
+                                                  (0xD00000, 0xD00001, 'writethrough')]  # BSS switch, CABAC power
+
     # --------------------------------------------------------------------
 
-    def __init__(self, ctrl_host=None, reb_id=2):
-        FPGA.__init__(self, ctrl_host, reb_id)
+    def __init__(self, ctrl_host=None, reb_id=2, backend='subprocess'):
+        FPGA.__init__(self, ctrl_host, reb_id, backend)
         # declare two CABACs and two ASPICs for each stripe even if they will not be used
         # (at least we will want to initialize to 0)
         self.cabac_top = [cabac.CABAC(), cabac.CABAC(), cabac.CABAC()]
         self.cabac_bottom = [cabac.CABAC(), cabac.CABAC(), cabac.CABAC()]
         self.aspic_top = [aspic.ASPIC(), aspic.ASPIC(), aspic.ASPIC()]
         self.aspic_bottom = [aspic.ASPIC(), aspic.ASPIC(), aspic.ASPIC()]
+        self.aspic_configs = {}  # ASPIC readback by stripe, until the next change
         self.dacs = {}
 
     # --------------------------------------------------------------------
@@ -299,24 +303,11 @@ class FPGA1(FPGA):
 
         self.check_location(s)
 
-        topconfig = {}
-        bottomconfig = {}
-
-        for address in range(22):
-            regaddress = address << 16
-            # send for reading top CABAC
-            self.write_spi(0x500000, s, 2, regaddress)
-            # read answer to dict
-            #time.sleep(0.05)
-            topconfig[address] = self.read(0x500010 + s, 1)[0x500010 + s]
-            # send for reading bottom CABAC
-            self.write_spi(0x500000, s, 1, regaddress)
-            # read answer to dict
-            #time.sleep(0.05)
-            bottomconfig[address] = self.read(0x500010 + s, 1)[0x500010 + s]
-
-        self.cabac_top[s].read_all_registers(topconfig, check)
-        self.cabac_bottom[s].read_all_registers(bottomconfig, check)
+        # top and bottom CABACs in a single transaction
+        regs = self.read_spi_registers(0x500000, s, range(22))
+
+        self.cabac_top[s].read_all_registers(regs[2], check)
+        self.cabac_bottom[s].read_all_registers(regs[1], check)
 
         keyst, configt, comt = self.cabac_top[s].get_header("%dT" % s)
         keysb, configb, comb = self.cabac_bottom[s].get_header("%dB" % s)
@@ -334,8 +325,7 @@ class FPGA1(FPGA):
         """
         self.check_location(s, loc)
 
-        self.write_spi(0x500000, s, loc, reg, False)
-        value = self.read(0x500010 + s, 1)[0x500010 + s]
+        value = self.write_read([(0x500000, self.spi_command(s, loc, reg), 0x500010 + s)])[0]
 
         return value
 
@@ -387,34 +377,29 @@ class FPGA1(FPGA):
     def get_aspic_config(self, s=0, check=False):
         """
         Read ASPIC configurations for the given stripe and updates objects in class.
-        If check is true then it checks that the readback is the same as the expected value.
+        The readback is kept until the ASPICs of the stripe are modified, unless check is true: then the ASPICs
+        are read again and it checks that the readback is the same as the expected value.
         :param s:
         """
         self.check_location(s)
 
-        topconfig = {}
-        bottomconfig = {}
+        if not check and s in self.aspic_configs:
+            return self.aspic_configs[s].copy()
 
-        for address in range(3):
-            # send for reading top ASPIC
-            self.write_spi(0xB00000, s, 2, address << 16)
-            # read answer
-            topconfig[address] = self.read(0xB00010 + s, 1)[0xB00010 + s]
-            # send for reading bottom ASPIC
-            self.write_spi(0xB00000, s, 1, address << 16)
-            # read answer
-            bottomconfig[address] = self.read(0xB00010 + s, 1)[0xB00010 + s]
+        # top and bottom ASPICs in a single transaction
+        regs = self.read_spi_registers(0xB00000, s, range(3))
 
-        self.aspic_top[s].read_all_registers(topconfig, True)
-        self.aspic_bottom[s].read_all_registers(bottomconfig, True)
+        self.aspic_top[s].read_all_registers(regs[2], True)
+        self.aspic_bottom[s].read_all_registers(regs[1], True)
 
         keyst, configt, comt = self.aspic_top[s].get_header("%dT" % s)
         keysb, configb, comb = self.aspic_bottom[s].get_header("%dB" % s)
 
         config = MetaData(keyst, configt, comt, 'ASPICS')
         config.update_ordered(keysb, configb, comb)
+        self.aspic_configs[s] = config
 
-        return config
+        return config.copy()
 
     def set_aspic_value(self, param, value, s=0, loc=3):
         """
@@ -422,6 +407,7 @@ class FPGA1(FPGA):
         object.
         """
         self.check_location(s, loc)
+        self.aspic_configs.pop(s, None)
 
         if loc == 1 or loc == 3:
             # bottom ASPIC
@@ -438,6 +424,7 @@ class FPGA1(FPGA):
         (1 for bottom, 2 for top, 3 for both).
         """
         self.check_location(s, loc)
+        self.aspic_configs.pop(s, None)
 
         if loc == 1 or loc == 3:
             # bottom ASPIC
@@ -456,6 +443,7 @@ class FPGA1(FPGA):
         :return:
         """
         self.check_location(s)
+        self.aspic_configs.pop(s, None)
 
         self.write(0xB00001, s)
 
@@ -468,7 +456,7 @@ class FPGA1(FPGA):
         Output for header.
         """
 
-        config = self.get_input_voltages_currents()
+        config = self.monitored(self.supply_keys(), self.get_input_voltages_currents)
         config.update(self.get_dacs())
         config.update(self.get_aspic_config(s))
         config.update(self.get_cabac_config(s))
@@ -7,6 +7,7 @@
 __author__ = 'juramy'
 
 import lsst.camera.generic.reb as reb
+import lsst.camera.generic.fitswriter as fitswriter
 import time
 import os
 import logging
@@ -19,9 +20,10 @@ class WREB(reb.REB):
     exposure_unit = 0.026  # duration of the elementary exposure subroutine in s
     min_exposure = int(0.1 / exposure_unit)  # minimal shutter opening time (not used for darks)
 
-    def __init__(self, rriaddress = 2, ctrl_host = None, stripe_id=[0]):
-        reb.REB.__init__(self, rriaddress, ctrl_host, stripe_id)
-        self.fpga = fpga.FPGA1(ctrl_host, rriaddress)
+    def __init__(self, rriaddress = 2, ctrl_host = None, stripe_id=[0], backend='subprocess'):
+        reb.REB.__init__(self, rriaddress, ctrl_host, stripe_id, backend)
+        self.fpga.backend.close()
+        self.fpga = fpga.FPGA1(ctrl_host, rriaddress, backend)
         self.fpga.n_sensors_boardtemp = 6  # fewer board temperature sensors than on a full REB
         # self.fpga.supplies = ['DREB', 'CLK_H', 'DPHI', 'HTR', 'ANA', 'OD']
         # currently power supplies readback has been removed from the board
@@ -280,12 +282,13 @@ class WREB(reb.REB):
 # --------------------------------------------------------------------
 
 
-def save_to_fits(R, channels=None, rawimg='', fitsname = ""):  # not meant to be part of REB class, will call other instruments
+def save_to_fits(R, channels=None, rawimg='', fitsname = "", workers=None):  # not meant to be part of REB class, will call other instruments
     """
     Managing FITS creation from img file and adding other header information.
     :type R: lsst.camera.wreb.wreb.WREB
     :param channels: list of channels
     :param fitsname: name if not using default structure.
+    :param workers: number of processes compressing the channels (see fitswriter.default_workers).
     :return:
     """
     if rawimg:
@@ -293,8 +296,7 @@ def save_to_fits(R, channels=None, rawimg='', fitsname = ""):  # not meant to be
     else:
         imgname = R.make_img_name()
     if os.path.isfile(imgname):
-        hdulist = reb.conv_to_fits(imgname, R.imgcols, R.imglines, R.nchannels, channels, displayborders=False)
-        primaryhdu = hdulist[0]
+        primaryhdu = reb.make_primary_hdu(R.imgcols, R.imglines, R.nchannels, channels, displayborders=False)
         imgstr = os.path.splitext(os.path.basename(imgname))[0]
         primaryhdu.header["IMAGETAG"] = imgstr
         if not fitsname:
@@ -317,13 +319,12 @@ def save_to_fits(R, channels=None, rawimg='', fitsname = ""):  # not meant to be
         #hdulist.append(exthdu)
 
         # Sequencer content (no actual readback, get it from the seq object)
-        seqhdu = pyfits.TableHDU.from_columns([pyfits.Column(format='A73',
-                                                         array=reb.get_sequencer_string(R.seq),
-                                                         ascii=True)])
-        seqhdu.header['EXTNAME'] = 'SEQUENCER'
-        hdulist.append(seqhdu)
+        seqhdu = R.get_sequencer_table()
 
-        hdulist.writeto(fitsname, clobber=True)
+        # channels are converted and written one by one
+        fitswriter.stream_to_fits(fitsname, imgname, R.imgcols, R.imglines, R.nchannels, channels,
+                                  displayborders=False, primaryhdu=primaryhdu, extrahdus=[seqhdu],
+                                  workers=workers)
 
         print("Wrote FITS file "+fitsname)
     else:
@@ -17,6 +17,8 @@ import time
 import datetime
 import serial
 
+import lsst.instruments.serialio as serialio
+
 
 # ==================================================================
 
@@ -54,6 +56,7 @@ class Multimeter(object):
         self.bytesize = serial.EIGHTBITS
         self.stopbits = serial.STOPBITS_ONE
         self.serial_device = None
+        self.transport = None
         # self.EOL = '\r'              # '\r' = 'CR'
         self.EOL = '\n'              # '\n' = 'LF'
         # end of line EOL = '\r' (confirmed & tested)
@@ -112,6 +115,12 @@ class Multimeter(object):
              not(self.serial_device.isOpen()) ):
             raise IOError("Keithley: " + 
                           "Failed to open serial device %s" % self.device)
+
+        # answers are read up to their end of line, not until the timeout
+        self.transport = serialio.SerialTransport(self.serial_device,
+                                                  terminator = '\n',
+                                                  eol = self.EOL,
+                                                  timeout = self.timeout)
         
         self.serial_device.flushOutput()
         
@@ -161,9 +170,19 @@ class Multimeter(object):
         """
         Purge the serial device to avoid framing errors.
         """
-        self.serial_device.flushOutput()
-        self.serial_device.flushInput()
-        self.serial_device.readline() # To purge remaining bytes (???)
+        self.transport.purge()
+
+    def drain(self, quiet = 0.2):
+        """
+        Drop the incoming data until the device has sent nothing
+        for <quiet> seconds (end of a long answer).
+        """
+        self.transport.purge(output = False)
+        while True:
+            time.sleep(quiet)
+            if not self.serial_device.inWaiting():
+                break
+            self.transport.purge(output = False)
 
 # ------------------------------------------------------------------ 
 #
@@ -175,7 +194,7 @@ class Multimeter(object):
         """
         if self.debug: print >>sys.stderr, \
                 "Keithley: Sending command [" + command + "]"
-        self.serial_device.write(command + self.EOL)
+        self.transport.write(command)
 
 
     def read(self, timeout = None):
@@ -191,14 +210,16 @@ class Multimeter(object):
                 "Reading serial device buffer"
 
         if timeout != None:
-            self.serial_device.timeout = timeout
             if self.debug: print >>sys.stderr, "Keithley: " + \
                     "Timeout specified: ", timeout
             
-        answer = self.serial_device.readline() # return buffer
-        
-        # Restoring timeout to default one
-        self.serial_device.timeout = self.timeout
+        try:
+            answer = self.transport.read_until(timeout = timeout)
+        except serialio.DeviceTimeout, e:
+            # incomplete answer: drop the rest of it, not to take it
+            # as the answer of the next query
+            answer = e.partial
+            self.drain()
         
         # remove end of line
         answer = answer.strip()
@@ -215,11 +236,16 @@ class Multimeter(object):
         Read the answer from the serial device.
         Return it as a string.
 
+        Only queries (commands with a '?') have an answer:
+        for the other commands, return '' without waiting.
+
         If <timeout> is specified, the function will wait
         for data with the specified timeout (instead of the default one). 
         """
 
         self.write(command)
+        if '?' not in command:
+            return ''
         return self.read(timeout = timeout)
 
 # ------------------------------------------------------------------ 
@@ -18,6 +18,8 @@ import time
 import datetime
 import serial
 
+import lsst.instruments.serialio as serialio
+
 
 # ==================================================================
 
@@ -52,6 +54,7 @@ class LakeShore:
         self.bytesize = serial.SEVENBITS
         self.stopbits = serial.STOPBITS_ONE
         self.serial_port = None
+        self.transport = None
         self.EOL = '\n'              # '\n' = 'LF'
         # end of line EOL = '\r' (confirmed & tested)
 
@@ -81,6 +84,12 @@ class LakeShore:
              not(self.serial_port.isOpen()) ):
             raise IOError("LakeShore325: " + 
                           "Failed to open serial port %s" % self.port)
+
+        # answers are read up to their end of line, not until the timeout
+        self.transport = serialio.SerialTransport(self.serial_port,
+                                                  terminator = '\n',
+                                                  eol = self.EOL,
+                                                  timeout = self.timeout)
         
         self.serial_port.flushOutput()
         
@@ -128,9 +137,7 @@ class LakeShore:
         """
         Purge the serial port to avoid framing errors.
         """
-        self.serial_port.flushOutput()
-        self.serial_port.flushInput()
-        self.serial_port.readline() # To purge remaining bytes (???)
+        self.transport.purge()
 
 # ------------------------------------------------------------------ 
 #
@@ -142,7 +149,7 @@ class LakeShore:
         """
         if self.debug: print >>sys.stderr, \
                 "LakeShore325: Sending command [" + command + "]"
-        self.serial_port.write(command + self.EOL)
+        self.transport.write(command)
 
 
     def read(self, timeout = None):
@@ -158,14 +165,14 @@ class LakeShore:
                 "Reading serial port buffer"
 
         if timeout != None:
-            self.serial_port.timeout = timeout
             if self.debug: print >>sys.stderr, "LakeShore325: " + \
                     "Timeout specified: ", timeout
             
-        answer = self.serial_port.readline() # return buffer
-        
-        # Restoring timeout to default one
-        self.serial_port.timeout = self.timeout
+        try:
+            answer = self.transport.read_until(timeout = timeout)
+        except serialio.DeviceTimeout, e:
+            # incomplete answer
+            answer = e.partial
         
         # remove end of line
         answer = answer.strip()
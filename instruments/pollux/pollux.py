@@ -15,6 +15,8 @@ import os, os.path
 import time
 import serial
 
+import lsst.instruments.serialio as serialio
+
 # ==================================================================
 
 from exceptions import Exception
@@ -46,6 +48,7 @@ class Pollux(object):
         self.bytesize = serial.EIGHTBITS
         self.stopbits = serial.STOPBITS_ONE
         self.serial_port = None
+        self.transport = None
         self.EOL = '\n'
     
         # ---- debug mode
@@ -89,6 +92,11 @@ class Pollux(object):
                 raise IOError("Failed to open serial port %s" % self.port)
 
         # then the serial port is open (or was already open)
+        # answers are read up to their end of line, not until the timeout
+        self.transport = serialio.SerialTransport(self.serial_port,
+                                                  terminator = '\n',
+                                                  eol = self.EOL,
+                                                  timeout = self.timeout)
         
         self.serial_port.flushOutput()
         
@@ -123,16 +131,17 @@ class Pollux(object):
 
         if self.debug: print >>sys.stderr, \
                 "Sending command [" + command + "]"
-        self.serial_port.write(command + self.EOL)
+        self.transport.write(command)
 
     # ----------------- read command  ----------------------- 
 
-    def read(self, timeout = None):
+    def read(self, timeout = None, lines = 1):
         """
-        Read the answer from the serial port.
-        Return it as a string.
+        Read the answer (<lines> lines) from the serial port.
+        Return it as a list of strings (the lines received
+        before the timeout if incomplete).
         If <timeout> is specified, the function will wait
-        for data with the specified timeout (instead of the default one). 
+        for each line with the specified timeout (instead of the default one). 
         """
         
         if not( self.serial_port and
@@ -143,15 +152,16 @@ class Pollux(object):
                 "Reading serial port buffer"
 
         if timeout != None:
-            self.serial_port.timeout = timeout
             if self.debug: print >>sys.stderr, \
                     "Timeout specified: ", timeout
-            
-        answer = self.serial_port.readlines() # return buffer
-        
-        # Restoring timeout to default one
-        self.serial_port.timeout = self.timeout
-        # answer = answer.strip()
+
+        answer = []
+        try:
+            for i in xrange(lines):
+                answer.append(self.transport.read_until(timeout = timeout))
+        except serialio.DeviceTimeout:
+            pass
+
         if self.debug: print >>sys.stderr, \
                 "Received [" + str(answer) + "]"
 
@@ -163,9 +173,7 @@ class Pollux(object):
         """
         Purge the serial port to avoid framing errors.
         """
-        self.serial_port.flushOutput()
-        self.serial_port.flushInput()
-        self.serial_port.readlines()
+        self.transport.purge()
 
     # ---------- Echo test ---------------------------------- 
 
@@ -180,12 +188,15 @@ class Pollux(object):
 
     # ---------- Send a command and get the answer -----------
 
-    def send(self, cmd):
+    def send(self, cmd, lines = 1):
         """
         Send a command (Venus-2 language) to the motor and
         return the answer (if any).
 
         @param cmd: the command to send.
+        @param lines: number of lines of the answer 
+                      (0 for the commands without answer: 
+                      returns without waiting).
         """
 
         if len(cmd) < 2:
@@ -193,12 +204,20 @@ class Pollux(object):
 
         command = cmd
 
+        # Drop what is left from the previous answers: the prompt '>'
+        # has no end of line, it would be read as the next answer.
+        # The previous command may still be on its way: input only.
+        self.transport.purge(output = False)
+
         # Now send it
         self.write(command)
 
+        if lines == 0:
+            return []
+
         # Parsing the answer (to detect errors)
 
-        answer = self.read()
+        answer = self.read(lines = lines)
 
         if len(answer) < 1:
             return answer
@@ -213,10 +232,11 @@ class Pollux(object):
         #         # if error ("?") -> raise Exception
         #         raise MCAPIError(int(parts[0][1:]))
 
-        # Remove the useless prompt '>' (not always present)
+        # Remove the useless prompt '>' (not always present),
+        # which may come before or after the answer lines
 
-        if answer[-1] == '>':
-            answer = answer[:-1]
+        answer = [line.strip(' \t\r>') for line in answer]
+        answer = [line for line in answer if line]
 
         return answer
 
@@ -305,7 +325,7 @@ class Pollux(object):
                 raise ValueError("Invalid position (out of range)")
 
         command = ("%f" % position) + " " + ("%d" % self.axis_id) + " nm"
-        answer = self.send(command)
+        answer = self.send(command, lines = 0)
         # in ECHO=1 no answer []
 
         if wait:
@@ -329,7 +349,7 @@ class Pollux(object):
                 raise ValueError("Invalid position (out of range)")
 
         command = ("%f" % offset) + " " + ("%d" % self.axis_id) + " nr"
-        answer = self.send(command)
+        answer = self.send(command, lines = 0)
         # in ECHO=1 no answer []
 
         if wait:
@@ -363,7 +383,7 @@ class Pollux(object):
 
         if lower:
             command = ("%d" % self.axis_id) + " ncal"
-            answer = self.send(command)
+            answer = self.send(command, lines = 0)
             while (self.is_moving()): 
                 pass
             
@@ -373,7 +393,7 @@ class Pollux(object):
 
         if upper:
             command = ("%d" % self.axis_id) + " nrm"
-            answer = self.send(command)
+            answer = self.send(command, lines = 0)
             while (self.is_moving()): 
                 pass
             
@@ -396,7 +416,7 @@ class Pollux(object):
        
         command = ( ("%f" % float(position)) + " " + 
                     ("%d" % self.axis_id) + " setnpos" )
-        answer = self.send(command)
+        answer = self.send(command, lines = 0)
 
     # ---------- Home : find_limits and set zeros ------------ 
 
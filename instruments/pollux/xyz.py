@@ -14,6 +14,7 @@
 import sys
 import os, os.path
 import time
+import itertools
 
 import pollux 
 
@@ -339,18 +340,94 @@ class XYZ(object):
 
         return True
 
+    # ---------- Check the volume swept by a concurrent move -
+
+    def check_box(self, start, target):
+        """
+        Check that the whole box between start and target (x, y, z)
+        is in the permitted volume, by checking its 8 corners.
+        Return True if allowed, False otherwise.
+
+        When the axes are started together, each one runs at its
+        own speed: the path is not the straight line from start to
+        target, it can be any monotonous path inside this box
+        (e.g. Z reaching the wall while X and Y are still outside
+        the window radius). The permitted volume is a box, minus
+        the region above zwall outside a vertical cylinder: a box
+        is inside it if and only if its corners are.
+        """
+        for corner in itertools.product(*zip(start, target)):
+            try:
+                self.check_target(*corner)
+            except ValueError:
+                return False
+
+        return True
+
+    # ---------- Concurrent move of several axes -------------
+
+    def wait_axes(self, axes):
+        """
+        Wait until all the given axes (names) have stopped moving.
+        """
+        moving = list(axes)
+        while moving:
+            moving = [ax for ax in moving if self.axes[ax].is_moving()]
+
+    def move_axes(self, targets, wait = True, check = True):
+        """
+        Start the axes together towards their absolute 'targets'
+        (dictionary axis: position), then wait for all of them.
+        The path is *NOT* checked here (see move()).
+        """
+        for ax, position in targets.iteritems():
+            self.axes[ax].move_absolute(position = position,
+                                        wait = False, check = check)
+
+        if wait:
+            self.wait_axes(targets.keys())
 
     # ---------- Move absolute and relative ------------------ 
 
     def move(self, 
              x  = None, y  = None, z  = None, a = None,
              dx = None, dy = None, dz = None, da = None,
-             wait = True, check = True):
+             wait = True, check = True, concurrent = True):
         """
         Move the XYZ(A) to the given position (or offset).
         This function can do relative and absolute movements.
+
+        With check and concurrent, if the whole box between the
+        position and the target is in the permitted volume (see
+        check_box()), the axes move together. Otherwise they move
+        one after the other (X, Y, Z, then A).
         """
 
+        requests = { 'x': (x, dx), 'y': (y, dy), 'z': (z, dz), 'a': (a, da) }
+        requested = [ax for ax, (p, d) in requests.iteritems()
+                     if (p != None or d != None) and self.axes[ax] != None]
+
+        if check and concurrent and len(requested) > 1:
+            pos = self.get_position()
+            targets = {}
+            for ax in requested:
+                p, d = requests[ax]
+                targets[ax] = pos[ax]
+                if p != None: targets[ax] = p
+                if d != None: targets[ax] += d
+
+            start = (pos['x'], pos['y'], pos['z'])
+            target = tuple([targets.get(ax, pos[ax]) for ax in ['x', 'y', 'z']])
+            # raises ValueError if the target itself is not allowed
+            self.check_target(*target)
+
+            if self.check_box(start, target):
+                self.move_axes(targets, wait = wait, check = check)
+                return
+
+            if self.debug: 
+                print >>sys.stderr,  "Concurrent move not allowed: moving the axes one by one."
+
         ## First, check the geometric limits
         #
         # Due to the complicated shape of the permitted volume,
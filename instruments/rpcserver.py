@@ -0,0 +1,269 @@
+#
+# LSST / LPNHE
+#
+"""
+Common parts of the XML-RPC instrument servers.
+
+The servers answer several clients at the same time (one thread per connection, connections
+kept alive between calls). Accesses to the device itself go through a DeviceQueue, which executes
+them one at a time in a worker thread: a long operation only delays the other device commands,
+not the cheap queries answered from the state kept by the server. Long operations can also be
+started as jobs, polled with job_status() / job_wait() instead of holding the connection.
+"""
+
+import sys
+import time
+import itertools
+import threading
+import functools
+import logging
+import Queue
+import SocketServer
+from SimpleXMLRPCServer import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
+
+# finished jobs kept for polling
+MAX_JOBS = 100
+
+
+class KeepAliveRequestHandler(SimpleXMLRPCRequestHandler):
+    """
+    HTTP/1.1 request handler: the connection stays open for the next calls of the client.
+    """
+    protocol_version = 'HTTP/1.1'
+    # idle connections are closed after this time (seconds)
+    timeout = 60
+
+
+class Job(object):
+    """
+    A command executed by a DeviceQueue.
+    """
+
+    def __init__(self, jobid, name, function, args, kargs):
+        self.id = jobid
+        self.name = name
+        self.function = function
+        self.args = args
+        self.kargs = kargs
+        self.state = 'queued'
+        self.result = None
+        self.exc_info = None
+        self.t_submit = time.time()
+        self.t_start = None
+        self.t_end = None
+        self.finished = threading.Event()
+
+    def run(self):
+        self.state = 'running'
+        self.t_start = time.time()
+        try:
+            self.result = self.function(*self.args, **self.kargs)
+            self.state = 'done'
+        except Exception:
+            self.exc_info = sys.exc_info()
+            self.state = 'failed'
+            logging.exception("Job %d (%s) failed." % (self.id, self.name))
+        self.t_end = time.time()
+        self.finished.set()
+
+    def wait(self, timeout=None):
+        """
+        Waits for the end of the job.
+        :return: bool, False if still running after timeout
+        """
+        return self.finished.wait(timeout)
+
+    def get(self):
+        """
+        Result of the finished job, raises its exception if it failed.
+        """
+        if self.exc_info is not None:
+            raise self.exc_info[0], self.exc_info[1], self.exc_info[2]
+        return self.result
+
+    def info(self):
+        """
+        State of the job as an XML-RPC structure (no None values).
+        """
+        info = {'id': self.id,
+                'name': self.name,
+                'state': self.state,
+                'queued': (self.t_start or time.time()) - self.t_submit}
+        if self.t_start is not None:
+            info['elapsed'] = (self.t_end or time.time()) - self.t_start
+        if self.state == 'done' and self.result is not None:
+            info['result'] = self.result
+        if self.state == 'failed':
+            info['error'] = "%s: %s" % (self.exc_info[0].__name__, self.exc_info[1])
+        return info
+
+
+class DeviceQueue(object):
+    """
+    Executes the commands to a device one at a time, in order, in a worker thread.
+    The thread is started by the first command (after a daemonizing fork).
+    """
+
+    def __init__(self, name='device'):
+        self.name = name
+        self.queue = Queue.Queue()
+        self.current = None
+        self.jobs = {}
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+        self.worker = None
+
+    def run(self):
+        while True:
+            job = self.queue.get()
+            self.current = job
+            job.run()
+            self.current = None
+
+    def submit(self, function, *args, **kargs):
+        """
+        Queues a command.
+        :return: Job
+        """
+        name = getattr(function, '__name__', str(function))
+        with self.lock:
+            if self.worker is None:
+                self.worker = threading.Thread(target=self.run, name='%s-queue' % self.name)
+                self.worker.daemon = True
+                self.worker.start()
+            job = Job(self.ids.next(), name, function, args, kargs)
+            self.jobs[job.id] = job
+            # forget the oldest finished jobs
+            if len(self.jobs) > MAX_JOBS:
+                for jobid in sorted(self.jobs)[:len(self.jobs) - MAX_JOBS]:
+                    if self.jobs[jobid].finished.is_set():
+                        del self.jobs[jobid]
+        self.queue.put(job)
+
+        return job
+
+    def call(self, function, *args, **kargs):
+        """
+        Queues a command and waits for its result.
+        """
+        job = self.submit(function, *args, **kargs)
+        job.wait()
+        with self.lock:
+            self.jobs.pop(job.id, None)
+
+        return job.get()
+
+    def queued(self, function):
+        """
+        Wraps function so that it is executed through the queue.
+        """
+        @functools.wraps(function)
+        def wrapper(*args, **kargs):
+            return self.call(function, *args, **kargs)
+        return wrapper
+
+    def busy(self):
+        """
+        True if a command is running or waiting.
+        """
+        return self.current is not None or not self.queue.empty()
+
+    def get_job(self, jobid):
+        with self.lock:
+            if jobid not in self.jobs:
+                raise ValueError("Unknown job %d on %s" % (jobid, self.name))
+            return self.jobs[jobid]
+
+
+class ThreadedXMLRPCServer(SocketServer.ThreadingMixIn, SimpleXMLRPCServer):
+    """
+    XML-RPC server handling each connection in its own thread, with keep-alive connections,
+    system.multicall and jobs.
+    The quit attribute stops serve_forever(), as in the previous single-threaded servers.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+    # serve_forever() checks the quit flag at this interval (seconds)
+    timeout = 0.5
+
+    def __init__(self, addr, logRequests=True, allow_none=False):
+        SimpleXMLRPCServer.__init__(self, addr, requestHandler=KeepAliveRequestHandler,
+                                    logRequests=logRequests, allow_none=allow_none)
+        self.quit = 0
+        self.job_functions = {}
+        self.register_multicall_functions()
+        self.register_function(self.job_start, 'job_start')
+        self.register_function(self.job_status, 'job_status')
+        self.register_function(self.job_wait, 'job_wait')
+        self.register_function(self.job_list, 'job_list')
+
+    def serve_forever(self):
+        self.quit = 0
+        while not self.quit:
+            self.handle_request()
+
+    def server_methods(self):
+        """
+        Methods provided by the server itself, to add to the instrument methods in system.listMethods.
+        """
+        return ['system.multicall', 'job_start', 'job_status', 'job_wait', 'job_list']
+
+    def register_job(self, queue, function, name):
+        """
+        Registers a blocking call to function, executed through queue, which can also be started
+        as a job with job_start(name, args).
+        """
+        self.register_function(queue.queued(function), name)
+        self.job_functions[name] = (queue, function)
+
+    # ----------------------- Jobs --------------------------------------
+
+    def job_start(self, name, args=[]):
+        """
+        Starts a long operation (home, move...) with the list of arguments args, without waiting.
+        Returns the job number, to poll with job_status() or job_wait().
+        """
+        if name not in self.job_functions:
+            raise ValueError("%s cannot be started as a job (available: %s)" %
+                             (name, ', '.join(sorted(self.job_functions))))
+        queue, function = self.job_functions[name]
+        job = queue.submit(function, *args)
+        logging.info("Job %d (%s%s) started." % (job.id, name, tuple(args)))
+
+        return job.id
+
+    def find_job(self, jobid):
+        for queue, function in self.job_functions.itervalues():
+            try:
+                return queue.get_job(jobid)
+            except ValueError:
+                pass
+        raise ValueError("Unknown job %d" % jobid)
+
+    def job_status(self, jobid):
+        """
+        State of a job: dictionary with id, name, state (queued, running, done, failed),
+        elapsed time, result or error.
+        """
+        return self.find_job(jobid).info()
+
+    def job_wait(self, jobid, timeout=10.):
+        """
+        Waits up to timeout seconds for the end of a job, then returns its state as job_status().
+        """
+        job = self.find_job(jobid)
+        job.wait(timeout)
+
+        return job.info()
+
+    def job_list(self):
+        """
+        States of the jobs kept by the server.
+        """
+        queues = set([queue for queue, function in self.job_functions.itervalues()])
+        jobs = []
+        for queue in queues:
+            with queue.lock:
+                jobs.extend(queue.jobs.values())
+
+        return [job.info() for job in sorted(jobs, key=lambda job: job.id)]
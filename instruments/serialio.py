@@ -0,0 +1,299 @@
+#
+# LSST / LPNHE
+#
+"""
+Serial I/O shared by the instrument drivers.
+
+A SerialTransport wraps an open serial port (pyserial API) and reads the answers up to their
+terminator ('\\n', '\\r\\n', a prompt such as '>') or a fixed number of bytes, so that a command
+returns as soon as its answer is complete instead of after the port timeout. Every read has its
+own deadline, and several commands can be written before their answers are read (pipeline).
+
+FakeDevice is a pseudo-terminal answering the commands with a Python function, to test the
+drivers without the instruments; FilePort opens its port when pyserial is not available.
+"""
+
+import os
+import time
+import select
+import threading
+import termios
+import fcntl
+import struct
+import tty
+
+try:
+    import serial
+except ImportError:
+    serial = None
+
+
+class DeviceTimeout(IOError):
+    """
+    The answer was not complete before the deadline. The bytes read are in partial.
+    """
+
+    def __init__(self, message, partial=''):
+        IOError.__init__(self, message)
+        self.partial = partial
+
+
+def open_port(device, **settings):
+    """
+    Opens device with pyserial (settings: baudrate, parity, timeout...).
+    """
+    if serial is None:
+        raise IOError("pyserial is needed to open %s" % device)
+
+    port = serial.Serial(port=device, **settings)
+    if not port.isOpen():
+        raise IOError("Failed to open serial port %s" % device)
+
+    return port
+
+
+class SerialTransport(object):
+    """
+    Terminator-aware reads and writes on an open serial port.
+    :param port: open port (pyserial.Serial or FilePort)
+    :param terminator: end of the answers
+    :param eol: end of the commands
+    :param timeout: default deadline of an answer in seconds
+    """
+
+    def __init__(self, port, terminator='\n', eol='\n', timeout=1.0):
+        self.port = port
+        self.terminator = terminator
+        self.eol = eol
+        self.timeout = timeout
+        # bytes received after the last answer (pipelined answers)
+        self.pending = ''
+        # round-trip times of the queries: count, total, max
+        self.stats = [0, 0., 0.]
+
+    def isOpen(self):
+        return self.port is not None and self.port.isOpen()
+
+    def close(self):
+        if self.isOpen():
+            self.port.close()
+
+    def write(self, command, eol=None):
+        """
+        Sends a command, followed by the end of line.
+        """
+        if eol is None:
+            eol = self.eol
+        self.port.write(command + eol)
+
+    def purge(self, output=True):
+        """
+        Drops the bytes not read yet, without waiting.
+        :param output: also drops the bytes not sent yet
+        """
+        if output:
+            self.port.flushOutput()
+        self.port.flushInput()
+        self.pending = ''
+        waiting = self.port.inWaiting()
+        if waiting:
+            self.port.read(waiting)
+
+    def read_until(self, terminator=None, size=None, timeout=None):
+        """
+        Reads an answer up to terminator (excluded from the result), or of size bytes.
+        :param timeout: deadline in seconds (default: self.timeout)
+        :return: string
+        :raise DeviceTimeout: the answer is not complete at the deadline
+        """
+        if terminator is None and size is None:
+            terminator = self.terminator
+        if timeout is None:
+            timeout = self.timeout
+        deadline = time.time() + timeout
+
+        buff = self.pending
+        self.pending = ''
+        while True:
+            if size is not None:
+                if len(buff) >= size:
+                    self.pending = buff[size:]
+                    return buff[:size]
+            else:
+                end = buff.find(terminator)
+                if end >= 0:
+                    self.pending = buff[end + len(terminator):]
+                    return buff[:end]
+
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise DeviceTimeout("No complete answer within %.3f s" % timeout, buff)
+
+            self.port.timeout = remaining
+            # blocks until the first byte, then takes all the available ones
+            buff += self.port.read(max(1, self.port.inWaiting()))
+
+    def read_lines(self, count, terminator=None, timeout=None):
+        """
+        Reads count answers, the deadline applying to each of them.
+        :return: list of strings
+        """
+        return [self.read_until(terminator, timeout=timeout) for i in xrange(count)]
+
+    def query(self, command, terminator=None, size=None, timeout=None):
+        """
+        Sends a command and reads its answer (see read_until).
+        """
+        t0 = time.time()
+        self.write(command)
+        answer = self.read_until(terminator, size, timeout)
+        self.record(time.time() - t0)
+
+        return answer
+
+    def pipeline(self, commands, terminator=None, timeout=None):
+        """
+        Sends all commands, then reads their answers in order
+        (for devices buffering their input, each command having one answer).
+        :return: list of strings
+        """
+        t0 = time.time()
+        self.port.write(''.join([command + self.eol for command in commands]))
+        answers = self.read_lines(len(commands), terminator, timeout)
+        self.record((time.time() - t0) / max(1, len(commands)))
+
+        return answers
+
+    def record(self, duration):
+        self.stats[0] += 1
+        self.stats[1] += duration
+        self.stats[2] = max(self.stats[2], duration)
+
+    def latency(self):
+        """
+        Mean and maximum round-trip times of the queries (seconds).
+        """
+        count, total, maximum = self.stats
+        if count == 0:
+            return 0., 0.
+        return total / count, maximum
+
+## -----------------------------------------------------------------------
+
+
+class FilePort(object):
+    """
+    The part of the pyserial API used by SerialTransport and the drivers, on a terminal
+    device opened in raw mode (FakeDevice ports, or any tty when pyserial is missing).
+    """
+
+    def __init__(self, device, timeout=None):
+        self.device = device
+        self.timeout = timeout
+        self.fd = os.open(device, os.O_RDWR | os.O_NOCTTY)
+        tty.setraw(self.fd)
+
+    def isOpen(self):
+        return self.fd is not None
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def write(self, data):
+        os.write(self.fd, data)
+        return len(data)
+
+    def inWaiting(self):
+        return struct.unpack('I', fcntl.ioctl(self.fd, termios.FIONREAD, '\0' * 4))[0]
+
+    def read(self, size=1):
+        """
+        Reads size bytes, or less if the timeout expires.
+        """
+        buff = ''
+        deadline = None if self.timeout is None else time.time() + self.timeout
+        while len(buff) < size:
+            remaining = None if deadline is None else max(0, deadline - time.time())
+            ready, w, x = select.select([self.fd], [], [], remaining)
+            if not ready:
+                break
+            buff += os.read(self.fd, size - len(buff))
+
+        return buff
+
+    def readline(self):
+        line = ''
+        while not line.endswith('\n'):
+            c = self.read(1)
+            if not c:
+                break
+            line += c
+
+        return line
+
+    def readlines(self):
+        lines = []
+        while True:
+            line = self.readline()
+            if not line:
+                return lines
+            lines.append(line)
+
+    def flushInput(self):
+        termios.tcflush(self.fd, termios.TCIFLUSH)
+
+    def flushOutput(self):
+        termios.tcflush(self.fd, termios.TCOFLUSH)
+
+
+class FakeDevice(object):
+    """
+    Pseudo-terminal answering the commands (terminated by eol) with responder(command),
+    a string to send back or None for no answer, after delay seconds.
+    With eol None (binary protocols), responder gets the bytes as they arrive.
+    The driver opens the device name in port.
+    """
+
+    def __init__(self, responder, eol='\n', delay=0.):
+        self.responder = responder
+        self.eol = eol
+        self.delay = delay
+        self.commands = []
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.master)
+        tty.setraw(self.slave)
+        self.port = os.ttyname(self.slave)
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name='FakeDevice')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self):
+        buff = ''
+        while self.running:
+            ready, w, x = select.select([self.master], [], [], 0.1)
+            if not ready:
+                continue
+            try:
+                buff += os.read(self.master, 4096)
+            except OSError:
+                return
+            while buff and (self.eol is None or self.eol in buff):
+                if self.eol is None:
+                    command, buff = buff, ''
+                else:
+                    command, buff = buff.split(self.eol, 1)
+                self.commands.append(command)
+                answer = self.responder(command)
+                if answer is not None:
+                    if self.delay:
+                        time.sleep(self.delay)
+                    os.write(self.master, answer)
+
+    def close(self):
+        self.running = False
+        self.thread.join()
+        os.close(self.master)
+        os.close(self.slave)
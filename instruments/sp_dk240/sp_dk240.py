@@ -19,6 +19,8 @@ import time
 import datetime
 import serial
 
+import lsst.instruments.serialio as serialio
+
 
 # ======================================================================
 
@@ -101,6 +103,7 @@ class Monochromator:
         self.bytesize = serial.EIGHTBITS
         self.stopbits = serial.STOPBITS_ONE
         self.serial_port = None
+        self.transport = None
 
         # ---- debug mode
         self.debug = debug
@@ -144,6 +147,11 @@ class Monochromator:
              not(self.serial_port.isOpen()) ):
                  raise IOError("Failed to open serial port %s" % self.port)
 
+        # answers have a fixed size: read them as soon as they are complete
+        self.transport = serialio.SerialTransport(self.serial_port,
+                                                  eol = '',
+                                                  timeout = self.timeout)
+
         self.serial_port.flushOutput()
 
         if not(self.echotest()):
@@ -188,9 +196,7 @@ class Monochromator:
         """
         Purge the serial port to avoid framing errors.
         """
-        self.serial_port.flushOutput()
-        self.serial_port.flushInput()
-        self.serial_port.readline() # To purge remaining bytes (???)
+        self.transport.purge()
 
 # ------------------------------------------------------------------ 
 #
@@ -204,7 +210,7 @@ class Monochromator:
         if self.debug: print >>sys.stderr, \
                 "SP DK240: Sending command [", \
                 list(bytearray(command)), "]"
-        self.serial_port.write(command)
+        self.transport.write(command)
 
 
     def read(self, nbytes, timeout = None):
@@ -219,14 +225,14 @@ class Monochromator:
                 "Reading %d byte(s) on serial port" % nbytes
 
         if timeout != None:
-            self.serial_port.timeout = timeout
             if self.debug: print >>sys.stderr, "SP DK240: " + \
                     "Timeout specified: ", timeout
             
-        answer = self.serial_port.read(nbytes) # return buffer
-        
-        # Restoring timeout to default one
-        self.serial_port.timeout = self.timeout
+        try:
+            answer = self.transport.read_until(size = nbytes, timeout = timeout)
+        except serialio.DeviceTimeout, e:
+            # incomplete answer
+            answer = e.partial
         
         # removing end of line should not be done here !
 
@@ -400,9 +406,9 @@ class Monochromator:
         self.reopen_if_needed()
         self.purge()
         
-        self.serial_port.write(chr(30))
+        self.write(chr(30))
 
-        answer = self.serial_port.read(1) # Should return 30
+        answer = self.read(1) # Should return 30
 
         if not(answer):
             raise IOError("SP DK240: " +
@@ -461,9 +467,9 @@ class Monochromator:
         self.reopen_if_needed()
         self.purge()
         
-        self.serial_port.write(chr(14))
+        self.write(chr(14))
     
-        answer = self.serial_port.read(1) # Should return 14
+        answer = self.read(1) # Should return 14
 
         if not(answer):
             raise IOError("SP DK240: " +
@@ -605,7 +611,7 @@ class Monochromator:
         
         self.write(chr(32))
     
-        answer = self.serial_port.read(1) # Should return 32
+        answer = self.read(1) # Should return 32
 
         if not(answer):
             raise IOError("SP DK240: " + 
@@ -662,7 +668,7 @@ class Monochromator:
         self.reopen_if_needed()
         self.purge()
         
-        self.serial_port.write(chr(19))
+        self.write(chr(19))
 
         answer = self.read(1) # Should return 19
 
@@ -680,7 +686,7 @@ class Monochromator:
         # byte #2-#3 -> high-low current grating ruling (rule / mm)
         # byte #4-#5 -> high-low current grating blaze wavelength (nm)
 
-        answer = self.serial_port.read(8) 
+        answer = self.read(8) 
 
         if not(answer):
             raise IOError("SP DK240: " + 
@@ -726,7 +732,7 @@ class Monochromator:
 
         self.write(chr(26))
     
-        answer = self.serial_port.read(1) # Should return 26
+        answer = self.read(1) # Should return 26
 
         if not(answer):
             raise IOError("SP DK240: " + 
@@ -1,6 +1,8 @@
 
 import os, os.path
+import time
 import datetime
+import threading
 import logging ## critical: common logging system (all devices should log through it)
 
 import importlib
@@ -24,6 +26,47 @@ B = lsst.testbench.Bench()
 
 """
 
+def meta_entry(extname, keys, values, comments, data):
+    """
+    Meta data of one instrument, as returned by Bench.get_meta().
+    """
+    return {'extname': extname,
+            'keys': keys,
+            'values': values,
+            'comments': comments,
+            'data': data}
+
+
+def degraded_meta_entry(extname, reason):
+    """
+    Meta data entry standing for an instrument that did not answer.
+    """
+    return meta_entry(extname, ['METAERR'], {'METAERR': reason},
+                      {'METAERR': 'Meta data could not be read'}, [])
+
+
+class MetaQuery(threading.Thread):
+    """
+    Calls the get_meta() function of one instrument in its own thread.
+    """
+
+    def __init__(self, identifier, function):
+        threading.Thread.__init__(self, name='meta-%s' % identifier)
+        self.daemon = True
+        self.function = function
+        self.result = None
+        self.error = None
+        self.latency = None
+
+    def run(self):
+        t0 = time.time()
+        try:
+            self.result = self.function()
+        except Exception as e:
+            self.error = e
+        self.latency = time.time() - t0
+
+
 class Bench(Borg):
     """
     Generic class to manage the LSST CCD Testbench at LPNHE.  
@@ -41,6 +84,9 @@ class Bench(Borg):
             self.name = "LSST CCD Testbench -- LPNHE, Paris"
         if not(self.__dict__.has_key("registry")):
             self.registry = {}
+        if not(self.__dict__.has_key("meta_queries")):
+            self.meta_queries = {}  # get_meta() threads still running
+            self.meta_latency = {}
 
         now = datetime.datetime.now()
         logname = "bench-%s.log" % now.isoformat().split('T')[0]
@@ -198,23 +244,74 @@ class Bench(Borg):
         """
         return self.registry.iterkeys()
 
-    def get_meta(self):
+    def get_meta(self, parallel=False, timeout=10.0, extra={}):
         """
         Returns meta data describing the current state of all the
         registered instruments.  
         Useful to fill the FITS headers.
+
+        With parallel=True, all instruments are queried at the same
+        time, each in its own thread. An instrument which does not
+        answer within timeout seconds, or fails, gets a degraded entry
+        (a METAERR keyword) instead of delaying the frame. Its query
+        is left running, and it is reported as busy until it ends.
+        The time taken by each instrument is kept in self.meta_latency.
+
+        extra is a dict of additional entries {identifier: (extname,
+        function)}, function returning (keys, values, comments, data).
         """
 
-        meta = {}
+        functions = {}
         for identifier, element in self.registry.iteritems():
-            instance = element['instance']
-            extname = identifier.upper()
-            keys, values, comments, data = instance.get_meta()
-            meta[identifier] = { 'extname' : extname,
-                                 'keys' : keys,
-                                 'values' : values,
-                                 'comments' : comments,
-                                 'data': data }
+            functions[identifier] = (identifier.upper(), element['instance'].get_meta)
+        functions.update(extra)
+
+        meta = {}
+        latency = {}
+
+        if not parallel:
+            for identifier, (extname, function) in functions.iteritems():
+                t0 = time.time()
+                keys, values, comments, data = function()
+                latency[identifier] = time.time() - t0
+                meta[identifier] = meta_entry(extname, keys, values, comments, data)
+            self.meta_latency = latency
+            return meta
+
+        queries = {}
+        for identifier, (extname, function) in functions.iteritems():
+            previous = self.meta_queries.get(identifier)
+            if previous is not None and previous.is_alive():
+                meta[identifier] = degraded_meta_entry(extname, 'busy')
+                latency[identifier] = None
+                continue
+            query = MetaQuery(identifier, function)
+            query.start()
+            queries[identifier] = query
+
+        deadline = time.time() + timeout
+        for identifier, query in queries.iteritems():
+            extname = functions[identifier][0]
+            query.join(max(0., deadline - time.time()))
+            if query.is_alive():
+                self.meta_queries[identifier] = query
+                meta[identifier] = degraded_meta_entry(extname, 'timeout')
+                latency[identifier] = None
+                self.log("No meta data from %s after %.1f s" % (identifier, timeout), logging.WARNING)
+                continue
+            self.meta_queries.pop(identifier, None)
+            latency[identifier] = query.latency
+            if query.error is not None:
+                meta[identifier] = degraded_meta_entry(extname, 'error: %s' % query.error)
+                self.log("Failed to get meta data from %s: %s" % (identifier, query.error), logging.WARNING)
+            else:
+                keys, values, comments, data = query.result
+                meta[identifier] = meta_entry(extname, keys, values, comments, data)
+
+        self.meta_latency = latency
+        logging.debug("Meta data latency: " +
+                      ", ".join(["%s %s" % (identifier, "%.3f s" % t if t is not None else "none")
+                                 for identifier, t in sorted(latency.iteritems())]))
             
         return meta
 
@@ -8,7 +8,6 @@ Testbench driver for the programmable attenuator (REB test bench)
 
 from driver import Driver
 
-import xmlrpclib
 import time
 
 # =======================================================================
@@ -36,8 +35,7 @@ class Instrument(Driver):
         if 'port' not in kargs.keys():
             raise ValueError("port is requested")
 
-        self.xmlrpc = xmlrpclib.ServerProxy("http://%s:%d/" % 
-                                            (self.host, self.port))
+        self.xmlrpc = self.xmlrpc_proxy()
         self.att = 0
 
     def open(self):
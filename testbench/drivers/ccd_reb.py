@@ -236,11 +236,18 @@ class Instrument(Driver):
         """
         self.reb.fpga.step()
 
-    def wait_end_sequencer(self):
+    def wait_end_sequencer(self, timeout=None):
         """
         Waits until the sequencer is not running anymore.
         """
-        self.reb.wait_end_sequencer()
+        return self.reb.wait_end_sequencer(timeout)
+
+    def wait_end_readout(self, imgname=None, timeout=None):
+        """
+        Waits until the raw image of the latest frame is complete.
+        :return: string (raw file name)
+        """
+        return self.reb.wait_end_readout(imgname, timeout)
 
     def start_waiting_sequence(self, name="InfiniteWait"):
         """
@@ -447,16 +454,28 @@ class Instrument(Driver):
 
         return cols, lines
 
-    def conv_to_fits(self, imgname, channels=None, displayborders=False):
+    def get_image_geometry(self):
+        """
+        Geometry of the raw image of the current sequence.
+        :return: (imgcols, imglines, nchannels)
+        """
+        return self.reb.imgcols, self.reb.imglines, self.reb.nchannels
+
+    def conv_to_fits(self, imgname, channels=None, displayborders=False, geometry=None):
         """
         Creates the fits object from the acquired data.
         If channels is not None but a list, saves the channels in the list (number 0 to 15).
         :param imgname: string
         :param channels: list
         :param displayborders: bool
+        :param geometry: (imgcols, imglines, nchannels) of the image, current geometry if None
         :return: pyfits.HDUlist
         """
-        return conv_to_fits(imgname, self.reb.imgcols, self.reb.imglines, self.reb.nchannels, channels, displayborders)
+        if geometry is None:
+            geometry = self.get_image_geometry()
+        imgcols, imglines, nchannels = geometry
+
+        return conv_to_fits(imgname, imgcols, imglines, nchannels, channels, displayborders)
 
     def make_fits_name(self, imgstr, compressed=True):
         """
@@ -581,6 +600,30 @@ class Instrument(Driver):
 
         return header.keys, header.values, header.comments
 
+    def start_housekeeping(self, period=5.):
+        """
+        Monitors the board in the background between sequences, for get_meta_housekeeping.
+        """
+        self.reb.start_housekeeping(period)
+
+    def stop_housekeeping(self):
+        self.reb.stop_housekeeping()
+
+    def is_housekeeping(self):
+        """
+        True if the board is monitored in the background.
+        """
+        return self.reb.fpga.housekeeping is not None
+
+    def get_meta_housekeeping(self):
+        """
+        Board monitoring values averaged around the last sequence, from the background monitoring.
+        :return:
+        """
+        header = self.reb.get_meta_housekeeping()
+
+        return header.keys, header.values, header.comments
+
     def get_meta_sequencer(self):
         """
         Returns a string table that can be put in a TableHDU (size 73).
@@ -588,5 +631,12 @@ class Instrument(Driver):
         :return: numpy.array
         """
         return get_sequencer_string(self.reb.seq)
+
+    def get_sequencer_table(self):
+        """
+        Returns the TableHDU 'SEQUENCER' of the current sequencer, rebuilt only when the sequencer changes.
+        :return: pyfits.TableHDU
+        """
+        return self.reb.get_sequencer_table()
         
 
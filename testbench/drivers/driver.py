@@ -7,6 +7,8 @@ Ultra-thin abstraction layer for the various devices
 on the LPNHE LSST CCD testbench.
 """
 
+import rpctransport
+
 class Driver(object):
 
     # Minimal functions requested
@@ -22,6 +24,29 @@ class Driver(object):
         """
         pass
 
+    def xmlrpc_proxy(self, timeout=None):
+        """
+        XML-RPC proxy to the instrument server on self.host:self.port,
+        with kept-alive connections shared by all drivers (see rpctransport).
+        """
+        return rpctransport.ServerProxy("http://%s:%d/" % (self.host, self.port), timeout=timeout)
+
+    def xmlrpc_batch(self, calls):
+        """
+        Several calls to the instrument server in a single request if it supports system.multicall.
+        :param calls: list of (method name, tuple of arguments)
+        :return: list of results
+        """
+        return rpctransport.call_many(self.xmlrpc, calls)
+
+    def xmlrpc_stats(self):
+        """
+        Timing statistics of the XML-RPC calls to the instrument server, by method.
+        :return: dict {method: {'count', 'total', 'mean', 'max', 'errors'}}
+        """
+        host = "%s:%d" % (self.host, self.port)
+        return dict([(method, s) for (h, method), s in rpctransport.stats.summary(host).iteritems()])
+
     def checkConnection(self):
         """
         Check if the connection is established with the hardware.
@@ -8,8 +8,6 @@ Testbench driver for a dummy device (test only)
 
 from driver import Driver
 
-import xmlrpclib
-
 # =======================================================================
 
 class Instrument(Driver):
@@ -35,8 +33,7 @@ class Instrument(Driver):
         if 'port' not in kargs.keys():
             raise ValueError("port is requested")
 
-        self.xmlrpc = xmlrpclib.ServerProxy("http://%s:%d/" % 
-                                            (self.host, self.port))
+        self.xmlrpc = self.xmlrpc_proxy()
         self.a = 3.14
 
     def open(self):
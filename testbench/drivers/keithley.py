@@ -40,8 +40,6 @@ Testbench driver for the Keithley multimeter (through keithley-server and XML-RP
 
 from driver import Driver
 
-import xmlrpclib
-
 # =======================================================================
 
 class Instrument(Driver):
@@ -67,8 +65,7 @@ class Instrument(Driver):
         if 'port' not in kargs.keys():
             raise ValueError("port is requested")
 
-        self.xmlrpc = xmlrpclib.ServerProxy("http://%s:%d/" % 
-                                            (self.host, self.port))
+        self.xmlrpc = self.xmlrpc_proxy()
 
 
     def open(self):
@@ -36,8 +36,10 @@ Testbench driver for the Keithley multimeter
 
 from driver import Driver
 
-import xmlrpclib
+import time
+import string
 import logging
+import numpy as np
 
 # =======================================================================
 
@@ -64,11 +66,13 @@ class Instrument(Driver):
         if 'port' not in kargs.keys():
             raise ValueError("port is requested")
 
-        self.xmlrpc = xmlrpclib.ServerProxy("http://%s:%d/" % 
-                                            (self.host, self.port))
+        self.xmlrpc = self.xmlrpc_proxy()
 
         self.lastmeasure = 0.0 # None should be better ?
 
+        # ongoing burst: (number of samples, start time)
+        self.burst = None
+
 
     def open(self):
         """
@@ -165,10 +169,10 @@ class Instrument(Driver):
 
         logging.info("Keithley.send() called.")
         logging.info("  command = [%s]" % command)
-        answer = self.xmlrpc.send(command, timeout)
+        # command and error status in a single request
+        answer, esr = self.xmlrpc_batch([('send', (command, timeout)), ('get_error_status', ())])
         logging.info("  answer = [%s]" % answer)
         logging.info("Keithley.send() done.")
-        esr = self.xmlrpc.get_error_status()
         if esr != 0:
             logging.error("Keithley command [%s] failed: error code ESR = %d." 
                           % (command, esr))
@@ -241,6 +245,113 @@ class Instrument(Driver):
         
         return measure
 
+    # ----------------------- Burst acquisition -------------------------
+
+    # size of the Keithley 6514 trace buffer
+    max_burst = 2500
+    # serial link of the Keithley (19200 bauds, see keithley.py), in bytes per second
+    transfer_rate = 19200 / 10.
+    # upper bound of a READ,TIME sample in TRAC:DATA? ('+1.234567E-09A,+12345.678901,')
+    sample_size = 30
+
+    def start_burst(self, n):
+        """
+        Start the acquisition of n samples into the Keithley trace buffer
+        (TRIG:COUN / TRAC:POIN), without waiting for them.
+        The samples are then read with fetch_burst().
+        """
+        if not (1 <= n <= self.max_burst):
+            raise ValueError("Burst of %d samples: should be in [1, %d]" % (n, self.max_burst))
+
+        logging.info("Keithley.start_burst(%d) called." % n)
+        commands = [":ABOR",
+                    ":FORM:ELEM READ,TIME",
+                    ":TRAC:CLE",
+                    ":TRAC:POIN %d" % n,
+                    ":TRAC:FEED SENS",
+                    ":TRAC:FEED:CONT NEXT",
+                    ":TRIG:COUN %d" % n,
+                    ":INIT"]
+        # current data format (put back after the burst), configuration,
+        # start and error status in a single request
+        results = self.xmlrpc_batch([('send', (":FORM:ELEM?",))] +
+                                    [('send', (command,)) for command in commands] +
+                                    [('get_error_status', ())])
+        elements = results[0].strip()
+        esr = results[-1]
+        if esr != 0:
+            self.end_burst(elements)
+            logging.error("Keithley burst setup failed: error code ESR = %d." % esr)
+            raise IOError("Keithley burst setup failed: error code ESR = %d." % esr)
+        self.burst = (n, time.time(), elements)
+        logging.info("Keithley.start_burst(%d) done." % n)
+
+    def end_burst(self, elements = None):
+        """
+        Put back the settings changed by start_burst() (trigger count,
+        buffer control, data format 'elements'), so that READ? takes
+        a single sample again.
+        """
+        commands = [":ABOR",
+                    ":TRIG:COUN 1",
+                    ":TRAC:FEED:CONT NEVER"]
+        if elements:
+            commands.append(":FORM:ELEM %s" % elements)
+        self.xmlrpc_batch([('send', (command,)) for command in commands])
+
+    def fetch_burst(self, timeout = None):
+        """
+        Wait for the end of the burst started by start_burst() and
+        read all the samples in one transfer (TRAC:DATA?).
+        Returns (times, values) as numpy arrays: the sample times
+        (Unix time, from the Keithley timestamps) and the measurements.
+        The single-measurement settings are restored in any case.
+        """
+        if self.burst is None:
+            raise IOError("Keithley: no burst started.")
+        n, t_start, elements = self.burst
+        self.burst = None
+        if timeout is None:
+            # generous for the slowest integration time (10 PLC)
+            timeout = 5.0 + 0.25 * n
+
+        logging.info("Keithley.fetch_burst() called.")
+        try:
+            # *OPC? answers when the n triggers are done
+            self.send("*OPC?", timeout = timeout)
+            # the timeout is a deadline for the whole dump
+            s = self.send(":TRAC:DATA?",
+                          timeout = 5.0 + 1.5 * n * self.sample_size / self.transfer_rate)
+        finally:
+            self.end_burst(elements)
+
+        # reading, timestamp pairs (the unit may be attached)
+        fields = np.array([float(elt.strip().rstrip(string.ascii_letters))
+                           for elt in s.split(',') if elt.strip()])
+        if len(fields) < 2 * n:
+            logging.error("TRAC:DATA?: %d fields for %d samples." % (len(fields), n))
+            raise IOError("TRAC:DATA?: incomplete data from the Keithley.")
+
+        values = fields[0:2*n:2]
+        stamps = fields[1:2*n:2]
+        times = t_start + (stamps - stamps[0])
+
+        # keep memory of the last measure
+        self.lastmeasure = values.mean()
+        logging.info("   %d samples, mean = %g" % (n, self.lastmeasure))
+        logging.info("Keithley.fetch_burst() done.")
+
+        return times, values
+
+    def read_burst(self, n, timeout = None):
+        """
+        Take n samples in the Keithley buffer and read them at once.
+        Returns (times, values) numpy arrays (see fetch_burst).
+        Much faster than n calls to read_measurement().
+        """
+        self.start_burst(n)
+        return self.fetch_burst(timeout = timeout)
+
     # ===================================================================
     # PRE/POST exposure hooks
     # ===================================================================
@@ -286,3 +397,26 @@ class Instrument(Driver):
         return keys, values, comments, data
 
     # ===================================================================
+
+# =======================================================================
+
+def read_bursts(keithleys, n, timeout = None):
+    """
+    Simultaneous bursts of n samples on several Keithleys: all the
+    bursts are started, then read. 
+    Returns the list of (times, values) numpy arrays, in the same order.
+    """
+    try:
+        for keithley in keithleys:
+            keithley.start_burst(n)
+
+        return [keithley.fetch_burst(timeout = timeout) for keithley in keithleys]
+    finally:
+        # after a failure, the bursts not fetched are stopped
+        for keithley in keithleys:
+            if keithley.burst is not None:
+                elements = keithley.burst[2]
+                keithley.burst = None
+                keithley.end_burst(elements)
+
+# =======================================================================
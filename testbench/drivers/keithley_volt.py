@@ -36,10 +36,42 @@ Testbench driver for the Keithley multimeter 6514 (through keithley app on remot
 #   retrieveVoltage              retrieves last acquired value from instrument
 
 import time
+import threading
+import numpy as np
 
 from driver import Driver
 
-import xmlrpclib
+# =======================================================================
+
+class VoltageReading(threading.Thread):
+    """
+    Voltage statistics (get_voltage_stats) of the Keithley taken in the background.
+    """
+
+    def __init__(self, keithley, n):
+        threading.Thread.__init__(self, name='VoltageReading')
+        self.daemon = True
+        self.keithley = keithley
+        self.n = n
+        self.stats = None
+        self.error = None
+
+    def run(self):
+        try:
+            self.stats = self.keithley.get_voltage_stats(self.n)
+        except Exception as e:
+            self.error = e
+
+    def result(self, timeout=None):
+        """
+        Waits for the readings and returns the statistics (see get_voltage_stats).
+        """
+        self.join(timeout)
+        if self.is_alive():
+            raise IOError("Keithley voltage readings not done after %s s" % timeout)
+        if self.error is not None:
+            raise self.error
+        return self.stats
 
 # =======================================================================
 
@@ -66,10 +98,10 @@ class Instrument(Driver):
         if 'port' not in kargs.keys():
             raise ValueError("port is requested")
 
-        self.xmlrpc = xmlrpclib.ServerProxy("http://%s:%d/" % 
-                                            (self.host, self.port))
-        self.v1 = 0
-        self.v2 = 0
+        self.xmlrpc = self.xmlrpc_proxy()
+        # readings around the exposure (VoltageReading)
+        self.pre = None
+        self.post = None
         self.rangeV = 0  # for auto
 
     def open(self):
@@ -162,41 +194,109 @@ class Instrument(Driver):
         self.rangeV = rangevolts
         self.xmlrpc.zeroCorrectVolts()  # does it only if not done already
 
+    # polling of a new voltage value (seconds)
+    poll_delay = 0.02
+    max_wait = 0.5
+    # readings of the exposure hooks done during the exposure
+    background = True
+
+    def read_voltage(self, previous):
+        """
+        Triggers a voltage acquisition and returns the new value.
+        The instrument is polled until the value differs from previous
+        (the last value retrieved), at most max_wait seconds.
+        :return: float
+        """
+        self.xmlrpc.readVoltage()
+        t0 = time.time()
+        delay = self.poll_delay
+        while True:
+            v = self.xmlrpc.retrieveVoltage()
+            if v != previous or time.time() - t0 >= self.max_wait:
+                return v
+            time.sleep(delay)
+            delay = min(2 * delay, self.max_wait / 4)
+
     def get_voltage(self):
         """
         Gets a single voltage readout.
         :return:
         """
-        self.xmlrpc.readVoltage()
-        time.sleep(0.2)
+        return self.read_voltage(self.xmlrpc.retrieveVoltage())
 
-        return self.xmlrpc.retrieveVoltage()
-
-    def get_voltage_median(self, n=10, verbose=False):
+    def get_voltage_stats(self, n=10, verbose=False):
         """
-        Gets n voltage readouts and return the median.
-        :return:
+        Gets n voltage readouts.
+        :return: dict with median, mean, std, min, max and n
         """
         volts = []
+        v = self.xmlrpc.retrieveVoltage()
         for i in range(n):
-            self.xmlrpc.readVoltage()
-            time.sleep(0.5)
-            v = self.xmlrpc.retrieveVoltage()
+            v = self.read_voltage(v)
             volts.append(v)
             if verbose:
                 print v
-            
-        return sorted(volts)[n/2]
+
+        volts = np.array(volts)
+        return {'median': float(np.median(volts)),
+                'mean': float(volts.mean()),
+                'std': float(volts.std()),
+                'min': float(volts.min()),
+                'max': float(volts.max()),
+                'n': n}
+
+    def get_voltage_median(self, n=10, verbose=False):
+        """
+        Gets n voltage readouts and return the median.
+        :return:
+        """
+        return self.get_voltage_stats(n, verbose)['median']
+
+    def start_voltage_reading(self, n=5):
+        """
+        Starts n voltage readouts in the background.
+        :return: VoltageReading, its result() gives the statistics
+        """
+        reading = VoltageReading(self, n)
+        reading.start()
+        return reading
+
+    @property
+    def v1(self):
+        """
+        Median voltage before the exposure (waits for the readings).
+        """
+        if self.pre is None:
+            return 0
+        return self.pre.result()['median']
+
+    @property
+    def v2(self):
+        """
+        Median voltage after the exposure (waits for the readings).
+        """
+        if self.post is None:
+            return 0
+        return self.post.result()['median']
 
     # ===================================================================
     # PRE/POST exposure hooks
     # ===================================================================
 
     def pre_exposure(self, exptime):
-        self.v1 = self.get_voltage_median(5)
+        # the readings go on during the exposure
+        self.post = None
+        self.pre = self.start_voltage_reading(5)
+        if not self.background:
+            self.pre.join()
 
     def post_exposure(self):
-        self.v2 = self.get_voltage_median(5)
+        # one reading sequence at a time on the instrument
+        if self.pre is not None:
+            self.pre.join()
+        self.post = self.start_voltage_reading(5)
+        if not self.background:
+            self.post.join()
 
     # ===================================================================
     #  Meta data / state of the instrument 
@@ -227,12 +327,15 @@ class Instrument(Driver):
             'POSTEXP': '[V] measurement after exposure'
         }
 
+        # readings first: they use the instrument
+        v1, v2 = self.v1, self.v2
+
         values = {
             'MODEL'  : self.get_serial(),
             'DRIVER' : 'keithley_volt',
             'RANGE'  : self.rangeV,
-            'PREEXP' : self.v1,
-            'POSTEXP': self.v2
+            'PREEXP' : v1,
+            'POSTEXP': v2
             }
 
         data = []
@@ -29,7 +29,6 @@ Testbench driver for the Oriel lamps (through Edo 'oriel' software and XML-RPC)
 from driver import Driver
 
 import time
-import xmlrpclib
 import logging
 
 # =======================================================================
@@ -57,8 +56,7 @@ class Instrument(Driver):
         if 'port' not in kargs.keys():
             raise ValueError("port is requested")
 
-        self.xmlrpc = xmlrpclib.ServerProxy("http://%s:%d/" % 
-                                            (self.host, self.port))
+        self.xmlrpc = self.xmlrpc_proxy()
 
         self._model = 'Unknown'
 
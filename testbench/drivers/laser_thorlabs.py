@@ -25,7 +25,6 @@ Testbench driver for the Thorlabs Laser (through Edo software and XML-RPC)
 from driver import Driver
 
 import time
-import xmlrpclib
 import logging
 
 # =======================================================================
@@ -53,8 +52,7 @@ class Instrument(Driver):
         if 'port' not in kargs.keys():
             raise ValueError("port is requested")
 
-        self.xmlrpc = xmlrpclib.ServerProxy("http://%s:%d/" % 
-                                            (self.host, self.port))
+        self.xmlrpc = self.xmlrpc_proxy()
 
         # Available channels
         self.allchannels = [1,2,3,4]
@@ -224,11 +222,17 @@ class Instrument(Driver):
             'DRIVER' : 'laserthorlabs / pyBench' 
             }
 
+        # all channels in a single request
+        calls = []
+        for channel in self.allchannels:
+            calls.extend([('getCurrent', (channel,)), ('getPower', (channel,))])
+        results = iter(self.xmlrpc_batch(calls))
+
         for channel in self.allchannels:
             # current 
             key = 'CURR_CH%d' % channel
             comment = '[mA] Current in laser diode %d in mA' % channel
-            value = self.getCurrent(channel)
+            value = float(results.next())
             keys.append(key)
             values[key] = value
             comments[key] = comment
@@ -236,7 +240,7 @@ class Instrument(Driver):
             # current 
             key = 'POW_CH%d' % channel
             comment = '[mW] Output Power for laser diode %d in mW' % channel
-            value = self.getPower(channel)
+            value = float(results.next())
             keys.append(key)
             values[key] = value
             comments[key] = comment
@@ -27,7 +27,6 @@ Testbench driver for the Triax Monochromator (through Edo software and XML-RPC)
 from driver import Driver
 
 import time
-import xmlrpclib
 import logging
 
 # =======================================================================
@@ -55,8 +54,7 @@ class Instrument(Driver):
         if 'port' not in kargs.keys():
             raise ValueError("port is requested")
 
-        self.xmlrpc = xmlrpclib.ServerProxy("http://%s:%d/" % 
-                                            (self.host, self.port))
+        self.xmlrpc = self.xmlrpc_proxy()
 
         # Available gratings
         # TODO: add resolution, blaze angle, etc...
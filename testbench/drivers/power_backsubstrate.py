@@ -39,8 +39,6 @@ keithley /dev/ttyS11 8088
 
 from driver import Driver
 
-import xmlrpclib
-
 # =======================================================================
 
 class Instrument(Driver):
@@ -86,8 +84,7 @@ class Instrument(Driver):
         if 'port' not in kargs.keys():
             raise ValueError("port is requested")
 
-        self.xmlrpc = xmlrpclib.ServerProxy("http://%s:%d/" % 
-                                            (self.host, self.port))
+        self.xmlrpc = self.xmlrpc_proxy()
 
 
     def open(self):
@@ -187,10 +184,10 @@ class Instrument(Driver):
 
         # logging.info("Keithley.send() called.")
         # logging.info("  command = [%s]" % command)
-        answer = self.xmlrpc.send(command, timeout)
+        # command and error status in a single request
+        answer, esr = self.xmlrpc_batch([('send', (command, timeout)), ('get_error_status', ())])
         # logging.info("  answer = [%s]" % answer)
         # logging.info("Keithley.send() done.")
-        esr = self.xmlrpc.get_error_status()
         if esr != 0:
             raise IOError("Keithley command [%s] failed: error code ESR = %d." 
                           % (command, esr))
@@ -50,7 +50,6 @@ Testbench driver for the Keithley multimeter 6487 [power source] (through keithl
 # # TODO: implement: system.methodSignature
 # server.register_function(keithley._methodHelp,  "system.methodHelp")
 
-import xmlrpclib
 import time
 import logging
 
@@ -82,8 +81,7 @@ class Instrument(Driver):
         if 'port' not in kargs.keys():
             raise ValueError("port is requested")
 
-        self.xmlrpc = xmlrpclib.ServerProxy("http://%s:%d/" % 
-                                            (self.host, self.port))
+        self.xmlrpc = self.xmlrpc_proxy()
 
 
     def open(self):
@@ -184,10 +182,10 @@ class Instrument(Driver):
 
         # logging.info("Keithley.send() called.")
         # logging.info("  command = [%s]" % command)
-        answer = self.xmlrpc.send(command, timeout)
+        # command and error status in a single request
+        answer, esr = self.xmlrpc_batch([('send', (command, timeout)), ('get_error_status', ())])
         # logging.info("  answer = [%s]" % answer)
         # logging.info("Keithley.send() done.")
-        esr = self.xmlrpc.get_error_status()
         if esr != 0:
             raise IOError("Keithley command [%s] failed: error code ESR = %d." 
                           % (command, esr))
@@ -0,0 +1,241 @@
+#
+# LSST / LPNHE
+#
+"""
+Shared XML-RPC transport for the testbench drivers.
+Connections to the instrument servers are kept alive (HTTP/1.1) in a pool per host and reused
+by the next calls, from any thread. Calls can be batched with system.multicall when the server
+provides it, and the duration of every call is recorded by method.
+"""
+
+import re
+import time
+import socket
+import threading
+import httplib
+import xmlrpclib
+
+# timeout of the connections in seconds (None: blocking, as with xmlrpclib)
+default_timeout = None
+# idle connections kept for each host
+max_idle = 4
+
+methodname = re.compile(r'<methodName>([^<]*)</methodName>')
+
+
+class ConnectionPool(object):
+    """
+    Idle HTTP connections by host.
+    """
+
+    def __init__(self, max_idle=max_idle):
+        self.max_idle = max_idle
+        self.idle = {}
+        self.created = 0
+        self.reused = 0
+        self.lock = threading.Lock()
+
+    def get(self, host, timeout=None):
+        """
+        Takes an idle connection to host, or opens a new one.
+        :return: (httplib.HTTPConnection, bool reused)
+        """
+        with self.lock:
+            connections = self.idle.get(host)
+            if connections:
+                self.reused += 1
+                return connections.pop(), True
+            self.created += 1
+
+        return httplib.HTTPConnection(host, timeout=timeout), False
+
+    def put(self, host, connection):
+        """
+        Gives back a connection after a complete exchange.
+        """
+        with self.lock:
+            connections = self.idle.setdefault(host, [])
+            if len(connections) < self.max_idle:
+                connections.append(connection)
+                return
+        connection.close()
+
+    def clear(self, host=None):
+        """
+        Closes idle connections (all hosts if None).
+        """
+        with self.lock:
+            if host is None:
+                hosts = self.idle.keys()
+            else:
+                hosts = [host]
+            connections = []
+            for h in hosts:
+                connections.extend(self.idle.pop(h, []))
+        for connection in connections:
+            connection.close()
+
+
+class CallStats(object):
+    """
+    Number, total and maximum duration, errors of the XML-RPC calls by host and method.
+    """
+
+    def __init__(self):
+        self.calls = {}
+        self.lock = threading.Lock()
+
+    def record(self, host, method, duration, error=False):
+        with self.lock:
+            stats = self.calls.setdefault((host, method), [0, 0., 0., 0])
+            stats[0] += 1
+            stats[1] += duration
+            stats[2] = max(stats[2], duration)
+            if error:
+                stats[3] += 1
+
+    def summary(self, host=None):
+        """
+        :return: dict {(host, method): {'count', 'total', 'mean', 'max', 'errors'}}
+        """
+        with self.lock:
+            items = [(key, list(stats)) for key, stats in self.calls.iteritems()
+                     if host is None or key[0] == host]
+
+        return dict([(key, {'count': count, 'total': total, 'mean': total / count,
+                            'max': maxduration, 'errors': errors})
+                     for key, (count, total, maxduration, errors) in items])
+
+    def reset(self):
+        with self.lock:
+            self.calls = {}
+
+
+pool = ConnectionPool()
+stats = CallStats()
+
+
+def no_status_line(e):
+    """
+    Whether a BadStatusLine comes from a connection closed before the first byte of the answer.
+    """
+    # httplib gives repr('') or, since Python 2.7.10, this message
+    return e.line in ('', repr('')) or e.line.startswith('No status line received')
+
+
+class PooledTransport(xmlrpclib.Transport):
+    """
+    XML-RPC transport over the kept-alive connections of a ConnectionPool.
+    A connection is only used by one call at a time, so that a proxy can be shared by threads.
+    """
+
+    def __init__(self, pool=pool, stats=stats, timeout=None, use_datetime=0):
+        xmlrpclib.Transport.__init__(self, use_datetime)
+        self.pool = pool
+        self.stats = stats
+        self.timeout = timeout if timeout is not None else default_timeout
+
+    def request(self, host, handler, request_body, verbose=0):
+        match = methodname.search(request_body)
+        method = match.group(1) if match else '?'
+        t0 = time.time()
+        try:
+            result = self.pooled_request(host, handler, request_body, verbose)
+        except Exception:
+            self.stats.record(host, method, time.time() - t0, error=True)
+            raise
+        self.stats.record(host, method, time.time() - t0)
+
+        return result
+
+    def pooled_request(self, host, handler, request_body, verbose=0):
+        # a call is only sent again when the server cannot have run it: the request could not be
+        # sent, or the connection was closed without any answer (idle connection closed by the server)
+        while True:
+            connection, reused = self.pool.get(host, self.timeout)
+            try:
+                connection.set_debuglevel(verbose)
+                connection.request('POST', handler, request_body,
+                                   {'Content-Type': 'text/xml',
+                                    'User-Agent': self.user_agent,
+                                    'Connection': 'keep-alive'})
+            except (socket.error, httplib.CannotSendRequest):
+                connection.close()
+                if reused:
+                    continue
+                raise
+            except:
+                connection.close()
+                raise
+
+            try:
+                response = connection.getresponse(buffering=True)
+            except httplib.BadStatusLine as e:
+                connection.close()
+                if reused and no_status_line(e):
+                    continue
+                raise
+            except:
+                connection.close()
+                raise
+            break
+
+        try:
+            if response.status != 200:
+                response.read()
+                raise xmlrpclib.ProtocolError(host + handler, response.status, response.reason, response.msg)
+            self.verbose = verbose
+            result = self.parse_response(response)
+        except:
+            connection.close()
+            raise
+
+        if response.will_close:
+            connection.close()
+        else:
+            self.pool.put(host, connection)
+
+        return result
+
+
+def ServerProxy(uri, timeout=None, **kargs):
+    """
+    xmlrpclib.ServerProxy using the shared pool of connections.
+    """
+    return xmlrpclib.ServerProxy(uri, transport=PooledTransport(timeout=timeout), **kargs)
+
+## -----------------------------------------------------------------------
+
+# servers known to provide system.multicall, by proxy URI
+_multicall = {}
+
+
+def supports_multicall(proxy):
+    """
+    Whether the server of the proxy provides system.multicall (asked once per server).
+    """
+    uri = proxy._ServerProxy__host + proxy._ServerProxy__handler
+    if uri not in _multicall:
+        try:
+            _multicall[uri] = 'system.multicall' in proxy.system.listMethods()
+        except (xmlrpclib.Error, socket.error):
+            _multicall[uri] = False
+
+    return _multicall[uri]
+
+
+def call_many(proxy, calls):
+    """
+    Calls several methods on a server, in a single request with system.multicall if possible,
+    one after the other otherwise. A fault raises as for the single call.
+    :param proxy: xmlrpclib.ServerProxy
+    :param calls: list of (method name, tuple of arguments)
+    :return: list of results
+    """
+    if len(calls) > 1 and supports_multicall(proxy):
+        multicall = xmlrpclib.MultiCall(proxy)
+        for name, args in calls:
+            getattr(multicall, name)(*args)
+        return list(multicall())
+
+    return [getattr(proxy, name)(*args) for name, args in calls]
@@ -22,6 +22,9 @@ Testbench driver for the DICE CLAP
 # server.register_function(clap.write_at,     "write_at")
 # server.register_function(clap.sample,       "sample")
 # server.register_function(clap.get_sampling_data,    "get_sampling_data")
+# server.register_function(clap.get_sampling_info,    "get_sampling_info")
+#
+# Binary streaming of the samples on port + 1 (see clap-server).
 
 
 from driver import Driver
@@ -29,11 +32,29 @@ from driver import Driver
 import time
 import xmlrpclib
 import logging
+import socket
 import struct
 import numpy as np
 
 # =======================================================================
 
+def recv_exactly(sock, length):
+    """
+    Receives exactly length bytes from the socket into a new bytearray.
+    """
+    buff = bytearray(length)
+    view = memoryview(buff)
+    received = 0
+    while received < length:
+        n = sock.recv_into(view[received:], length - received)
+        if not n:
+            raise IOError("CLAP data stream interrupted.")
+        received += n
+
+    return buff
+
+# =======================================================================
+
 class Instrument(Driver):
 
     default_channels  = [1]
@@ -76,8 +97,11 @@ class Instrument(Driver):
         if 'blocksize' not in kargs.keys():
             self.blocksize = self.default_blocksize
 
-        self.xmlrpc = xmlrpclib.ServerProxy("http://%s:%d/" % 
-                                            (self.host, self.port))
+        # binary data streaming port (None to get the data through XML-RPC)
+        if 'streamport' not in kargs.keys():
+            self.streamport = self.port + 1
+
+        self.xmlrpc = self.xmlrpc_proxy()
 
     def open(self):
         """
@@ -203,20 +227,79 @@ class Instrument(Driver):
                                   blocksize)
 
 
+    def stream_sampling_blocks(self, offset=0, timeout=60.0, port=None):
+        """
+        Iterates over the raw blocks (bytearrays of little-endian int16)
+        of the current or last sampling, starting at sample number
+        offset, as they are read from the CLAP FIFO (also while the
+        sampling is running).
+        The port is the streaming port of the server (self.streamport
+        if None).
+        """
+        if port is None:
+            port = self.streamport
+        sock = socket.create_connection((self.host, port), timeout)
+        try:
+            sock.sendall("DATA %d\n" % (2 * offset))
+            while True:
+                (length,) = struct.unpack('<I', str(recv_exactly(sock, 4)))
+                if length == 0:
+                    break
+                yield recv_exactly(sock, length)
+        finally:
+            sock.close()
+
+    def stream_sampling_data(self, offset=0):
+        """
+        Same as stream_sampling_blocks(), each block decoded in place
+        as a numpy int16 array.
+        """
+        for block in self.stream_sampling_blocks(offset):
+            yield np.frombuffer(block, dtype='<i2')
+
+    def read_sampling_stream(self, offset=0, port=None):
+        """
+        Fetches all the samples (from sample number offset) through
+        the binary stream, waiting for the end of the readout.
+        Returns a numpy int16 array.
+        """
+        data = bytearray()
+        for block in self.stream_sampling_blocks(offset, port=port):
+            data += block
+
+        return np.frombuffer(data, dtype='<i2')
+
     def get_sampling_data(self):
         """
         Return the data and meta data from the last sampling
         as a dictionary.
-        Return an empty dictionary if no sampling has been done yet.
+        Return an empty dictionary if no sampling has been done yet,
+        or if it is not successfully finished.
+        The data are transferred through the binary stream if the
+        server provides it, through XML-RPC otherwise, and returned
+        as a numpy int64 array as before.
         """
 
+        if self.streamport is not None:
+            try:
+                result = dict(self.xmlrpc.get_sampling_info())
+            except xmlrpclib.Fault:
+                # older server: no streaming
+                result = None
+            if result is not None:
+                # as get_sampling_data() on the server: nothing until
+                # the readout is over and succeeded
+                if not (result.get('done') and result.get('ready')):
+                    return {}
+                port = result.pop('stream_port', self.streamport)
+                result['data'] = self.read_sampling_stream(port=port).astype(np.int64)
+                return result
+
         result = dict(self.xmlrpc.get_sampling_data())
         
         if result.has_key('binarydata'):
             blurb = result['binarydata'].data
-            fmt = "<%dh" % (len(blurb) / 2)
-            data = np.array(struct.unpack(fmt, blurb))
-            result['data'] = data
+            result['data'] = np.frombuffer(bytearray(blurb), dtype='<i2').astype(np.int64)
 
         return result
 
@@ -18,7 +18,6 @@ Testbench driver for the Lakeshore-325 (through Edo 'lakeshore' software and XML
 from driver import Driver
 
 import time
-import xmlrpclib
 import logging
 
 # =======================================================================
@@ -46,8 +45,7 @@ class Instrument(Driver):
         if 'port' not in kargs.keys():
             raise ValueError("port is requested")
 
-        self.xmlrpc = xmlrpclib.ServerProxy("http://%s:%d/" % 
-                                            (self.host, self.port))
+        self.xmlrpc = self.xmlrpc_proxy()
 
         self._model = 'Unknown'
 
@@ -32,7 +32,6 @@ which generates ttl signals (through Edo software and XML-RPC)
 #                         wheel(-1: moving, 0: home, 1: other), ("QTH","XeHg")
 
 import time
-import xmlrpclib
 
 from driver import Driver
 
@@ -61,8 +60,7 @@ class Instrument(Driver):
         if 'port' not in kargs.keys():
             raise ValueError("port is requested")
 
-        self.xmlrpc = xmlrpclib.ServerProxy("http://%s:%d/" % 
-                                            (self.host, self.port))
+        self.xmlrpc = self.xmlrpc_proxy()
         
         self.filter_position = None # unknown by default
 
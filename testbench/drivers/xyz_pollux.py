@@ -36,8 +36,6 @@ Testbench driver for the XYZ Pollux motors
 
 from driver import Driver
 
-import xmlrpclib
-
 # =======================================================================
 
 class Instrument(Driver):
@@ -63,8 +61,7 @@ class Instrument(Driver):
         if 'port' not in kargs.keys():
             raise ValueError("port is requested")
 
-        self.xmlrpc = xmlrpclib.ServerProxy("http://%s:%d/" % 
-                                            (self.host, self.port))
+        self.xmlrpc = self.xmlrpc_proxy()
 
     def open(self):
         """
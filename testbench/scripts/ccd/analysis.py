@@ -148,15 +148,79 @@ def area_stats(hdulist, logtofile=False, selectchannels=None):
     #return out
 
 
-def cut_scan_plot(hdulist, cutcolumns=[180], selectchannels=None, outputdir = '', polynomfit=True):
+def scan_fit(img, polynomfit=True):
     """
-    Cut and fit plots accross image (designed for images acquired in scanning mode).
-    If polynomfit is set to False, reverts to average and standard deviation.
-    :param cutcolumns: list of columns for display accross column direction
-    :param selectchannels: list of selected channels for display (all by default)
-    :return:
+    Fits all the columns of scan images at once: first-order polynomial along the lines,
+    or average if polynomfit is False, with the dispersion around it.
+    Same results as np.polyfit(lines, img, 1) and the residuals column by column.
+    :param img: array (Nlines, Nbins), or (Nchannels, Nlines, Nbins) for several channels
+    :return: array (..., 3, Nbins) of constant, slope and residual dispersion,
+    or (..., 2, Nbins) of average and dispersion
+    """
+    img = np.asarray(img, dtype=np.float64)
+
+    if not polynomfit:
+        values = np.array((img.mean(axis=-2), img.std(axis=-2)))
+        return np.rollaxis(values, 0, values.ndim - 1)
+
+    lines = np.arange(img.shape[-2], dtype=np.float64)
+    x = lines - lines.mean()
+    slope = np.tensordot(x, img, axes=([0], [img.ndim - 2])) / np.dot(x, x)
+    const = img.mean(axis=-2) - slope * lines.mean()
+    residuals = img - const[..., np.newaxis, :]
+    residuals -= slope[..., np.newaxis, :] * lines[:, np.newaxis]
+
+    values = np.array((const, slope, residuals.std(axis=-2)))
+    return np.rollaxis(values, 0, values.ndim - 1)
+
+
+def scan_analysis(hdulist, selectchannels=None, polynomfit=True):
+    """
+    Scan fit (see scan_fit) of all the selected channels of an image, without display.
+    :return: list of channel names, array (Nchannels, 3 or 2, Nbins)
+    """
+    Nlines = hdulist[0].header['HEIGHT']
+    Nbins = hdulist[0].header['WIDTH']
+
+    listchan = find_channels(hdulist, selectchannels)
+    if not listchan:
+        return listchan, np.empty((0, 3 if polynomfit else 2, Nbins))
+    images = np.array([hdulist[name].data[:Nlines, :Nbins] for name in listchan])
+
+    return listchan, scan_fit(images, polynomfit)
+
+
+def write_scan_values(listchan, values, valuelog, polynomfit=True):
+    """
+    Writes the results of scan_analysis to a text file, one line per bin.
+    """
+    Nbins = values.shape[-1]
+    outfile = open(valuelog, 'w')
+    # header line
+    outfile.write("ScanBin\t")
+    for name in listchan:
+        if polynomfit:
+            outfile.write("%s_P0\t%s_P1\t%s_SD\t" % (name, name, name))
+        else:
+            outfile.write("%s_MN\t%s_SD\t" % (name, name))
+    outfile.write("\n")
+    # one line per bin
+    if polynomfit:
+        fmt = "%d\t" + "%.2f\t%.4f\t%.2f\t" * len(listchan)
+    else:
+        fmt = "%d\t" + "%.2f\t%.2f\t" * len(listchan)
+    table = np.column_stack([np.arange(Nbins)] + list(values.reshape(-1, Nbins)))
+    np.savetxt(outfile, table, fmt=fmt)
+
+    outfile.close()
+
+
+def plot_scan_values(hdulist, listchan, values, cutcolumns=[180], polynomfit=True):
+    """
+    Plots the results of scan_analysis along the line direction, and the scans of the cut columns
+    with their fit.
+    :return: the two figures
     """
-    values = []
     figX, (p0, p1, pdev) = plt.subplots(nrows=3, num='Fit over lines', figsize=(8,12))
     plt.xlabel('Scan increment (10 ns)')
     figY = plt.figure(num='Selected line fit', figsize=(8,5))
@@ -164,99 +228,59 @@ def cut_scan_plot(hdulist, cutcolumns=[180], selectchannels=None, outputdir = ''
     plt.ylabel('ADU')
 
     Nlines = hdulist[0].header['HEIGHT']
-    Nbins = hdulist[0].header['WIDTH']
+    Nbins = values.shape[-1]
     lines = np.arange(Nlines)
+    cutcolumns = [b for b in cutcolumns if b < Nbins]
 
-    listchan = find_channels(hdulist, selectchannels)
-    for name in listchan:
-        #hdr = hdulist[name].header
+    for name, chanvalues in zip(listchan, values):
         img = hdulist[name].data
-        #dsec = split_slicing(hdr['DATASEC'])
-        #Nbins = dsec[1]
-        #Nlines = dsec[3]
-
-        chanvalues = []
+        plt.figure(figY.number)
+        for b in cutcolumns:
+            plt.plot(img[:Nlines, b])
+            if polynomfit:
+                plt.plot(chanvalues[0, b] + chanvalues[1, b] * lines)
+            else:
+                plt.plot(np.full(Nlines, chanvalues[0, b]))
 
+        # plots along line direction
+        plt.figure(figX.number)
         if polynomfit:
-            stddev = np.empty(Nbins)
-            # first-order polynomial fit of scans, plus dispersion
-            polyscan = np.polyfit(lines, img, 1)
-
-            for b in range(Nbins):
-                polyfit = np.poly1d(polyscan[:, b])
-                residuals = img[:,b] - polyfit(lines)
-                stddev[b] = residuals.std()
-                chanvalues.append((polyscan[1, b], polyscan[0, b], stddev[b]))
-                if b in cutcolumns:
-                    plt.figure(figY.number)
-                    plt.plot(img[:,b])
-                    plt.plot(polyfit(lines))
-
-            # plots along line direction
-            plt.figure(figX.number)
-            #p0.plot(polyscan[1, :])
             plt.subplot(311)
-            plt.plot(polyscan[1, :])
+            plt.plot(chanvalues[0])
             plt.ylabel('Constant in polynomial fit')
             plt.subplot(312)
-            plt.plot(polyscan[0, :])
-            #p1.plot(polyscan[0, :])
+            plt.plot(chanvalues[1])
             plt.ylabel('Slope in polynomial fit')
             plt.subplot(313)
-            plt.plot(stddev)
-            #pdev.plot(stddev)
+            plt.plot(chanvalues[2])
             plt.ylabel('Residuals from fit')
-
         else:
-            # mean and standard deviation
-            stddev = np.empty(Nbins)
-            meanbin = np.empty(Nbins)
-            for b in range(Nbins):
-                meanbin[b] =  img[:,b].mean()
-                stddev[b] = img[:,b].std()
-                chanvalues.append((meanbin[b], stddev[b]))
-                if b in cutcolumns:
-                    plt.figure(figY.number)
-                    plt.plot(img[:,b])
-                    plt.plot(np.full_like(img[:,b], meanbin[b]))
-
-            # plots along line direction
-            plt.figure(figX.number)
             plt.subplot(311)
-            plt.plot(meanbin)
+            plt.plot(chanvalues[0])
             plt.ylabel('Average of column')
             plt.subplot(312)
-            plt.plot(stddev)
+            plt.plot(chanvalues[1])
             plt.ylabel('Dispersion along column')
 
-        values.append(chanvalues)
+    return figX, figY
 
 
+def cut_scan_plot(hdulist, cutcolumns=[180], selectchannels=None, outputdir = '', polynomfit=True):
+    """
+    Cut and fit plots accross image (designed for images acquired in scanning mode).
+    If polynomfit is set to False, reverts to average and standard deviation.
+    :param cutcolumns: list of columns for display accross column direction
+    :param selectchannels: list of selected channels for display (all by default)
+    :return:
+    """
+    listchan, values = scan_analysis(hdulist, selectchannels, polynomfit)
+
     # log to file
     rootname = get_image_id(hdulist)
-    valuelog = os.path.join(outputdir, 'scanfit' + rootname + '.txt')
-    outfile = open(valuelog, 'w')
-    # header line
-    outfile.write("ScanBin\t")
-    for name in listchan:
-        if polynomfit:
-            outfile.write("%s_P0\t%s_P1\t%s_SD\t" % (name, name, name))
-        else:
-            outfile.write("%s_MN\t%s_SD\t" % (name, name))
-    outfile.write("\n")
-    # one line per bin
-    for b in range(Nbins):
-        outfile.write("%d\t" % b)
-        for j in range(len(listchan)):
-            if polynomfit:
-                outfile.write("%.2f\t%.4f\t%.2f\t" % values[j][b])
-            else:
-                outfile.write("%.2f\t%.2f\t" % values[j][b])
-        outfile.write("\n")
-
-    outfile.close()
+    write_scan_values(listchan, values, os.path.join(outputdir, 'scanfit' + rootname + '.txt'), polynomfit)
 
     # save figures
+    figX, figY = plot_scan_values(hdulist, listchan, values, cutcolumns, polynomfit)
     figX.savefig(os.path.join(outputdir, 'scanfit' + rootname + '.png'))
     figY.savefig(os.path.join(outputdir, 'plotscanfit' + rootname + '.png'))
 
@@ -9,12 +9,15 @@ import os
 import time
 import datetime
 import logging
+import threading
+import Queue
 import astropy.io.fits as pyfits
 from astropy.time import Time
+import lsst.camera.generic.fitswriter as fitswriter
 
 #reload(lsst.testbench.scripts.ccd.functions)
 
-from lsst.testbench.bench import Bench
+from lsst.testbench.bench import Bench, meta_entry
 
 B = Bench()  # singleton
 
@@ -117,11 +120,13 @@ def shutdown_CCD(self):
 Bench.shutdown_CCD = shutdown_CCD
 
 
-def execute_reb_sequence(self, name='', exptime=None, delaytime=4, withclap=True, withmeta=True):
+def execute_reb_sequence(self, name='', exptime=None, delaytime=4, withclap=True, withmeta=True,
+                         exposuremeta=False):
     """
     Configure new REB sequence if name and/or exptime are given.
     Executes the sequence.
-    Acquires meta parameters if withmeta is True.
+    Acquires meta parameters if withmeta is True. With exposuremeta, the instruments are read
+    during the exposure instead of after the readout, only for slowly varying parameters.
     :return: dict
     """
     if name and exptime:
@@ -137,36 +142,70 @@ def execute_reb_sequence(self, name='', exptime=None, delaytime=4, withclap=True
     
     # ... then send the execute sequence command 
     self.reb.execute_sequence()
-    # delay for clear before exposure
-    time.sleep(delaytime)
+    tstart = time.time()
+    instrumentmeta = None
+    if withmeta and exposuremeta:
+        # not longer than the exposure, so that post_exposure is not delayed
+        instrumentmeta = self.get_meta(parallel=True, timeout=max(delaytime + self.reb.reb.exptime, 1.0))
 
-    # delay for exposure
-    time.sleep(self.reb.reb.exptime)
+    # delay for clear before exposure, and for exposure
+    time.sleep(max(0., delaytime + self.reb.reb.exptime - (time.time() - tstart)))
 
     # Here execute, for all instruments, the post_exposure functions
     self.post_exposure()
 
     # self.PhD.read_measurement() -> transfered in post exposure hook
 
-    # delay for readout
-    time.sleep(4.0)
+    # wait for the raw image to be complete (returns as soon as the readout is done)
+    duration = self.reb.reb.sequence_duration()
+    if duration is None:
+        duration = self.reb.reb.exptime
+    self.reb.wait_end_readout(timeout=duration + 30.0)
     
     meta = {}
     if withmeta:
-        # meta from all instruments
-        meta = self.get_meta()
-        # additionnal meta from REB
-        keys, values, comments = self.reb.get_meta_operating()
-        meta['reb_ope'] = {'extname': 'CCD_COND',
-                           'keys': keys,
-                           'values': values,
-                           'comments': comments,
-                           'data': []}  # added data for compatibility with the rest of the meta
+        meta = self.get_frame_meta(instrumentmeta=instrumentmeta)
     return meta
 
 Bench.execute_reb_sequence = execute_reb_sequence
 
 
+def get_frame_meta(self, parallel=True, timeout=10.0, instrumentmeta=None):
+    """
+    Meta parameters from all instruments, plus REB operating parameters and, if the REB is monitored
+    in the background, its monitoring values around the frame (REB_HK).
+    With parallel, all instruments are read concurrently and an instrument not answering within
+    timeout gets a degraded entry (see Bench.get_meta).
+    If instrumentmeta (from Bench.get_meta) is given, only the REB is read and added to it.
+    :return: dict
+    """
+    def reb_operating():
+        keys, values, comments = self.reb.get_meta_operating()
+        return keys, values, comments, []  # added data for compatibility with the rest of the meta
+
+    def reb_housekeeping():
+        keys, values, comments = self.reb.get_meta_housekeeping()
+        return keys, values, comments, []
+
+    extra = {'reb_ope': ('CCD_COND', reb_operating)}
+    if self.reb.is_housekeeping():
+        extra['reb_hk'] = ('REB_HK', reb_housekeeping)
+
+    if instrumentmeta is not None:
+        meta = dict(instrumentmeta)
+        keys, values, comments, data = self.reb.get_meta()
+        meta['reb'] = meta_entry('REB', keys, values, comments, data)
+        for identifier, (extname, function) in extra.iteritems():
+            keys, values, comments, data = function()
+            meta[identifier] = meta_entry(extname, keys, values, comments, data)
+        return meta
+
+    # meta from all instruments, and additionnal meta from REB
+    return self.get_meta(parallel=parallel, timeout=timeout, extra=extra)
+
+Bench.get_frame_meta = get_frame_meta
+
+
 def append_kvc(exthdu, keys, values, comments):
     """
     Appends the keywords to the header of exthdu
@@ -211,51 +250,58 @@ def eotest_header(hdulist):
     testhdu = pyfits.ImageHDU(name='TEST_COND')
     primaryhdu = hdulist[0]
 
-    obstime = primaryhdu.header["DATE-OBS"]
-    primaryhdu.header["MJD-OBS"] = (Time(obstime).mjd, 'Modified Julian Date of image acquisition')
+    def valid(extname):
+        # instruments which did not answer only have a METAERR keyword
+        return extname in hdulist and 'METAERR' not in hdulist[extname].header
 
-    if 'BSS' in hdulist:
+    if "DATE-OBS" in primaryhdu.header:
+        obstime = primaryhdu.header["DATE-OBS"]
+        primaryhdu.header["MJD-OBS"] = (Time(obstime).mjd, 'Modified Julian Date of image acquisition')
+
+    if valid('BSS'):
         if hdulist['BSS'].header['VOLTSRC']:  # if it is activated
             hdulist['CCD_COND'].header['V_BSS'] = (hdulist['BSS'].header['VOLTAGE'], '[V] Keithley Back-Substrate voltage')
         else:
             hdulist['CCD_COND'].header['V_BSS'] = (0.0, '[V] Keithley Back-Substrate voltage')
         hdulist['CCD_COND'].header['I_BSS'] = (hdulist['BSS'].header['CURRENT'], '[A] Keithley Back-Substrate current')
-    if 'TRIAX' in hdulist:
+    if valid('TRIAX'):
         primaryhdu.header['MONOWL'] = (hdulist['TRIAX'].header['WVLGTH'], '[nm] Monochromator wavelength')
-    elif 'CORNERSTONE' in hdulist:
+    elif valid('CORNERSTONE'):
         primaryhdu.header['MONOWL'] = (hdulist['CORNERSTONE'].header['WVLGTH'], '[nm] Monochromator wavelength')
         # add to testhdu
         # replace with laser wavelength if laser is connected
-    if 'LAKESHORE0' in hdulist:
+    if valid('LAKESHORE0'):
         primaryhdu.header['CCDTEMP'] = (hdulist['LAKESHORE0'].header['TEMPA'], '[C] CCD temperature')
-    elif 'LAKESHORE1' in hdulist:
+    elif valid('LAKESHORE1'):
         primaryhdu.header['CCDTEMP'] = (hdulist['LAKESHORE1'].header['TEMPA'], '[C] CCD temperature')
         # also need 'TEMP_SET' for primaryhdu, not yet available in thermal_lakeshore
-    if 'TTL' in hdulist:
+    if valid('TTL'):
         primaryhdu.header['FILTER'] = (hdulist['TTL'].header['LMPFILT'], 'Filter wheel position')
         # TODO: add conversion to filter reference
     for extname in ['QTH', 'XEHG']:
-        if extname in hdulist:
+        if valid(extname):
             testhdu.header['SRCTYPE'] = (extname, 'Source type')
             if hdulist[extname].header['ON']:
                 testhdu.header['SRCPWR'] = (hdulist[extname].header['POWER'], '[W] Lamp power')
             else:
                 testhdu.header['SRCPWR'] = (0, '[W] Lamp power')
-    if 'LASER' in hdulist:
+    if valid('LASER'):
         # currently no parameter to know which channels are enabled
         testhdu.header['SRCTYPE'] = ('LASER', 'Source type')
         for chan in range(1,5):
             keylaser = 'POW_CH%d' % chan
             testhdu.header[keylaser] = hdulist['LASER'].header[keylaser]
-    if 'PHD' in hdulist:
+    if valid('PHD'):
         testhdu.header['MONDIODE'] = (hdulist['PHD'].header['CURRENT'], '[A] Monitoring photodiode current')
 
     return testhdu
 
 
-def save_to_fits(self, hdulist, meta={}, fitsname='', LSSTstyle = True):
+def save_to_fits(self, hdulist, meta={}, fitsname='', LSSTstyle = True, workers=None, seqhdu=None):
     """
     Saves the given FITS HDUlist to a file with auxiliary headers for instruments parameters.
+    Channels are compressed in parallel if workers (or fitswriter.default_workers) is more than 1.
+    seqhdu is the sequencer table of the frame if it was taken earlier (current sequencer otherwise).
     """
     if not fitsname:
         fitsname = self.reb.make_fits_name(self.reb.make_img_name(), compressed=True)
@@ -284,18 +330,185 @@ def save_to_fits(self, hdulist, meta={}, fitsname='', LSSTstyle = True):
         hdulist.append(testhdu)
 
     # Sequencer content
-    seqhdu = pyfits.TableHDU.from_columns([pyfits.Column(format='A73',
-                                                         array=self.reb.get_meta_sequencer(),
-                                                         ascii=True)])
-    seqhdu.header['EXTNAME'] = 'SEQUENCER'
+    if seqhdu is None:
+        seqhdu = self.reb.get_sequencer_table()
     hdulist.append(seqhdu)
 
-    hdulist.writeto(fitsname, clobber=True, checksum=True)
+    fitswriter.write_fits(hdulist, fitsname, workers=workers, checksum=True)
     logging.info("Wrote FITS file "+fitsname)
 
 Bench.save_to_fits = save_to_fits
 
 
+def write_frame(bench, frame, workers=None):
+    """
+    Converts the raw file of an acquired frame and writes it with its meta data.
+    Only uses what was kept in the frame: the instruments and the REB may be driven meanwhile.
+    :param bench: Bench
+    :param frame: dict built by acquire_to_fits
+    """
+    hdulist = bench.reb.conv_to_fits(frame['rawfile'], frame['channels'], displayborders=frame['borders'],
+                                     geometry=frame['geometry'])
+    for key, value in frame['headers'].iteritems():
+        hdulist[0].header[key] = value
+
+    bench.save_to_fits(hdulist, frame['meta'], fitsname=frame['fitsname'], workers=workers,
+                       seqhdu=frame['seqhdu'])
+    hdulist.close()
+
+
+class AcquisitionPipeline(object):
+    """
+    Converts and writes acquired frames in a background thread, so that the next sequence can be
+    configured and started while the previous frame is being saved.
+    The queue of pending frames is bounded: submitting a frame blocks while it is full.
+    """
+
+    def __init__(self, bench, maxpending=2, workers=None):
+        """
+        :param bench: Bench
+        :param maxpending: maximum number of frames waiting to be written
+        :param workers: number of processes compressing the channels of each frame
+        """
+        self.bench = bench
+        self.workers = workers
+        self.queue = Queue.Queue(maxpending)
+        self.written = []  # FITS files written
+        self.errors = []  # (FITS name, exception) for failed frames
+        self.thread = threading.Thread(target=self.run, name='AcquisitionPipeline')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def submit(self, frame):
+        """
+        Queues a frame for writing, waiting for room in the queue if needed.
+        :param frame: dict with rawfile, fitsname, geometry, channels, borders, headers, meta, seqhdu
+        """
+        if not self.thread.is_alive():
+            raise RuntimeError("Acquisition pipeline is stopped")
+        self.queue.put(frame)
+
+    def run(self):
+        while True:
+            frame = self.queue.get()
+            try:
+                if frame is None:
+                    return
+                self.process(frame)
+                self.written.append(frame['fitsname'])
+            except Exception as e:
+                logging.exception("Failed to write %s" % frame['fitsname'])
+                self.errors.append((frame['fitsname'], e))
+            finally:
+                self.queue.task_done()
+
+    def process(self, frame):
+        write_frame(self.bench, frame, self.workers)
+
+    def pending(self):
+        """
+        Number of frames not written yet.
+        """
+        return self.queue.unfinished_tasks
+
+    def wait(self):
+        """
+        Waits until all submitted frames are written.
+        :return: list of (FITS name, exception) for frames that failed since the last call
+        """
+        self.queue.join()
+        errors = self.errors
+        self.errors = []
+        return errors
+
+    def close(self):
+        """
+        Writes all pending frames and stops the thread.
+        """
+        errors = self.wait()
+        self.queue.put(None)
+        self.thread.join()
+        return errors
+
+
+def start_pipeline(self, maxpending=2, workers=None):
+    """
+    Starts writing acquired frames in the background (see acquire_to_fits).
+    """
+    if getattr(self, 'pipeline', None) is None:
+        self.pipeline = AcquisitionPipeline(self, maxpending, workers)
+    return self.pipeline
+
+Bench.start_pipeline = start_pipeline
+
+
+def wait_pipeline(self):
+    """
+    Waits until all frames submitted to the pipeline are written, logs the failed ones.
+    :return: list of (FITS name, exception)
+    """
+    if getattr(self, 'pipeline', None) is None:
+        return []
+    errors = self.pipeline.wait()
+    for fitsname, e in errors:
+        self.log("Failed to write %s: %s" % (fitsname, e), logging.ERROR)
+    return errors
+
+Bench.wait_pipeline = wait_pipeline
+
+
+def stop_pipeline(self):
+    """
+    Writes all pending frames and goes back to synchronous writing.
+    """
+    errors = self.wait_pipeline()
+    if getattr(self, 'pipeline', None) is not None:
+        self.pipeline.close()
+        self.pipeline = None
+    return errors
+
+Bench.stop_pipeline = stop_pipeline
+
+
+def acquire_to_fits(self, fitsname='', name='', exptime=None, delaytime=4, channels=None, borders=False,
+                    headers={}, background_meta=False):
+    """
+    Executes a REB sequence and saves the frame to fitsname.
+    If the pipeline is started, the frame is written in the background and this returns as soon as
+    the readout is done. With background_meta, the instruments meta data are read during the
+    exposure (see execute_reb_sequence), only for slowly varying parameters.
+    :param fitsname: output file, '{imgtag}' in it is replaced by the image tag of the frame
+    :param headers: additional primary header keywords
+    :return: string (FITS file name)
+    """
+    meta = self.execute_reb_sequence(name, exptime, delaytime, exposuremeta=background_meta)
+
+    # everything describing this frame is taken before the next sequence changes it
+    rawfile = self.reb.make_img_name()
+    if fitsname:
+        fitsname = fitsname.replace('{imgtag}', self.reb.reb.imgtag)
+    else:
+        fitsname = self.reb.make_fits_name(rawfile, compressed=True)
+    frame = {'rawfile': rawfile,
+             'fitsname': fitsname,
+             'geometry': self.reb.get_image_geometry(),
+             'channels': channels,
+             'borders': borders,
+             'headers': dict(headers),
+             'meta': meta,
+             'seqhdu': self.reb.get_sequencer_table()}
+
+    pipeline = getattr(self, 'pipeline', None)
+    if pipeline is None:
+        write_frame(self, frame)
+    else:
+        pipeline.submit(frame)
+
+    return fitsname
+
+Bench.acquire_to_fits = acquire_to_fits
+
+
 # def wait_for_action(action):
 #     """
 #     Pause the execution until the specified action has been recorded as 'done' by the user.
@@ -62,32 +62,31 @@ def ptc_acquisition(self, explow=0.1, exphigh=2, expdelta=0.1, laserchannel = 2,
 
     print >>f, "# power\t exposure time\t file name"
 
-    effpow = self.laser.getPower(laserchannel)
-    # First take bias frames
-    self.log("Taking bias")
-    m = self.execute_reb_sequence('ClearBias', 0, 20, True )
-    #to have only useful channels:
-    fname = "%s_ptc_bias_%s.fits" % (serno, self.reb.reb.imgtag)
-    i = self.conv_to_fits(channels=validamps)
-    # to save FITS HDU with headers
-    self.save_to_fits(i, m, fitsname=os.path.join(eodir, fname))
-
-    print >>f, effpow, 0, fname
-
-    for t in np.arange(explow, exphigh+expdelta, expdelta):
-        # pair of flats
-        for numpair in [1, 2]:
-            effpow = self.laser.getPower(laserchannel)
-            m = self.execute_reb_sequence('Acquisition', t)
-            #to have only useful channels:
-            fname = "%s_ptc_flat%d_%05d_%s.fits" % (serno, numpair, int(t*100), self.reb.reb.imgtag)
-            i = self.conv_to_fits(channels=validamps)
-            # to save FITS HDU with headers
-            self.save_to_fits(i, m, fitsname=os.path.join(eodir, fname))
-
-            print >>f, effpow, t, fname
-
-    f.close()
+    # frames are written in the background during the next exposure
+    self.start_pipeline()
+    try:
+        effpow = self.laser.getPower(laserchannel)
+        # First take bias frames
+        self.log("Taking bias")
+        #to have only useful channels:
+        fname = "%s_ptc_bias_{imgtag}.fits" % serno
+        fname = self.acquire_to_fits(os.path.join(eodir, fname), 'ClearBias', 0, 20, channels=validamps)
+
+        print >>f, effpow, 0, os.path.basename(fname)
+
+        for t in np.arange(explow, exphigh+expdelta, expdelta):
+            # pair of flats
+            for numpair in [1, 2]:
+                effpow = self.laser.getPower(laserchannel)
+                #to have only useful channels:
+                fname = "%s_ptc_flat%d_%05d_{imgtag}.fits" % (serno, numpair, int(t*100))
+                fname = self.acquire_to_fits(os.path.join(eodir, fname), 'Acquisition', t, channels=validamps)
+
+                print >>f, effpow, t, os.path.basename(fname)
+    finally:
+        # pending frames are still written if an acquisition fails
+        self.stop_pipeline()
+        f.close()
 
     # Shutting down (not the lamp by default)
     self.laser.disable()
@@ -151,12 +151,8 @@ def save_to_fits(self, hdulist, meta={}, fitsname=''):
     #    testhdu = eotest_header(hdulist)
     #    hdulist.append(testhdu)
 
-    # Sequencer content, removed for speed
-    #seqhdu = pyfits.TableHDU.from_columns([pyfits.Column(format='A73',
-    #                                                     array=self.reb.get_meta_sequencer(),
-    #                                                     ascii=True)])
-    #seqhdu.header['EXTNAME'] = 'SEQUENCER'
-    #hdulist.append(seqhdu)
+    # Sequencer content (kept between frames until the sequencer changes)
+    hdulist.append(self.reb.get_sequencer_table())
 
     hdulist.writeto(fitsname, clobber=True, checksum=True)
     logging.info("Wrote FITS file "+fitsname)
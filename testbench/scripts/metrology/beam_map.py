@@ -115,10 +115,11 @@ def beam_map(self,
     yc = xyz_pos['y']
     zc = xyz_pos['z']
 
-    for i in xrange(n):
-        value = self.PhD.read_measurement()
-        print time.time(),xc,yc,zc,value, 0
-        print >>output, time.time(),xc,yc,zc,value, 0
+    # n samples in one Keithley burst
+    times, values = self.PhD.read_burst(n)
+    for now, value in zip(times, values):
+        print now,xc,yc,zc,value, 0
+        print >>output, now,xc,yc,zc,value, 0
 
     self.log("Opening the shutter")
     self.ttl.openShutter()
@@ -135,10 +136,10 @@ def beam_map(self,
         print "X,Y = ", x,y
         self.xyz.move({'x': x, 'y': y}, wait=True)
         time.sleep(.5)
-        for i in xrange(n):
-            value = self.PhD.read_measurement()
-            print time.time(),x,y,z,value, 1
-            print >>output, time.time(),x,y,z,value, 1
+        times, values = self.PhD.read_burst(n)
+        for now, value in zip(times, values):
+            print now,x,y,z,value, 1
+            print >>output, now,x,y,z,value, 1
         output.flush()
 
     self.ttl.closeShutter() 
@@ -151,10 +152,10 @@ def beam_map(self,
     yc = xyz_pos['y']
     zc = xyz_pos['z']
 
-    for i in xrange(n):
-        value = self.PhD.read_measurement()
-        print time.time(),x,y,z,value, 0
-        print >>output, time.time(),x,y,z,value, 0
+    times, values = self.PhD.read_burst(n)
+    for now, value in zip(times, values):
+        print now,x,y,z,value, 0
+        print >>output, now,x,y,z,value, 0
 
     output.close()
 
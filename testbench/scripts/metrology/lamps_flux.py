@@ -6,6 +6,8 @@ import time
 import datetime
 import numpy as np
 
+import lsst.testbench.drivers.keithley_ks as keithley_ks
+
 B = lsst.testbench.Bench()
 
 B.register("QTH")
@@ -47,6 +49,24 @@ B.qth_stability(wl = 500.0, grating = 0, filt = 1,
 
 # ==============================================================================
 
+def lamp_fluxes(self, n):
+    """
+    n simultaneous DKD and PhD samples (Keithley bursts), the lamp
+    current and power being read once per burst.
+    Yields (time, lamp current, lamp power, DKD flux, PhD flux).
+    """
+    while n > 0:
+        size = min(n, self.PhD.max_burst)
+        lampcurrent = self.QTH.getAmps()
+        lamppower = self.QTH.getWatts()
+        (dkdtimes, dkdflux), (phdtimes, phdflux) = \
+            keithley_ks.read_bursts([self.DKD, self.PhD], size)
+        for i in xrange(size):
+            yield phdtimes[i], lampcurrent, lamppower, dkdflux[i], phdflux[i]
+        n -= size
+
+# ==============================================================================
+
 def qth_flux(self, 
              wlrange = [300.0, 1200.0], dwl = 5.0, 
              grating = 1, filt = 1,
@@ -133,14 +153,8 @@ def qth_flux(self,
     self.ttl.closeSafetyShutter(wait=True)
     self.ttl.closeShutter(wait=True)
 
-    for i in xrange(n):
-        now = time.time()
-        lampcurrent = self.QTH.getAmps()
-        lamppower = self.QTH.getWatts()
-        eff_wl = self.triax.getWavelength()
-        dkdflux = self.DKD.read_measurement()
-        phdflux = self.PhD.read_measurement()
-
+    eff_wl = self.triax.getWavelength()
+    for now, lampcurrent, lamppower, dkdflux, phdflux in lamp_fluxes(self, n):
         print >>f, now, -1, -1, eff_wl, \
             lampcurrent, lamppower, dkdflux, phdflux, 0
         print now, -1, -1, eff_wl, \
@@ -157,14 +171,7 @@ def qth_flux(self,
         time.sleep(2)
         eff_wl = self.triax.getWavelength() # there seems to be a bug
 
-        for i in xrange(n):
-            now = time.time()
-            lampcurrent = self.QTH.getAmps()
-            lamppower = self.QTH.getWatts()
-            eff_wl = self.triax.getWavelength()
-            dkdflux = self.DKD.read_measurement()
-            phdflux = self.PhD.read_measurement()
-
+        for now, lampcurrent, lamppower, dkdflux, phdflux in lamp_fluxes(self, n):
             print >>f, now, filt, grating, eff_wl, \
                 lampcurrent, lamppower, dkdflux, phdflux, 1
             print now, filt, grating, eff_wl, \
@@ -174,14 +181,8 @@ def qth_flux(self,
     self.ttl.closeSafetyShutter(wait=True)
     self.ttl.closeShutter(wait=True)
 
-    for i in xrange(n):
-        now = time.time()
-        lampcurrent = self.QTH.getAmps()
-        lamppower = self.QTH.getWatts()
-        eff_wl = self.triax.getWavelength()
-        dkdflux = self.DKD.read_measurement()
-        phdflux = self.PhD.read_measurement()
-
+    eff_wl = self.triax.getWavelength()
+    for now, lampcurrent, lamppower, dkdflux, phdflux in lamp_fluxes(self, n):
         print >>f, now, filt, grating, eff_wl, \
             lampcurrent, lamppower, dkdflux, phdflux, 0
         print now, filt, grating, eff_wl, \
@@ -304,29 +305,30 @@ def qth_stability(self,
 
     eff_wl = self.triax.getWavelength()
 
-    for i in xrange(repeat + ndark):
+    i = 0
+    while i < repeat + ndark:
         # interleaving dark measurements
         if (i % freq) == 0:
             shutter_open = 0
             self.ttl.closeSafetyShutter(wait=True)
             self.ttl.closeShutter(wait=True)
             time.sleep(5)
-        elif (i % freq) == ndark:
+            block = ndark
+        else:
             shutter_open = 1
             self.ttl.openSafetyShutter(wait=True)
             self.ttl.openShutter(wait=True)
             time.sleep(5)
+            block = freq - ndark
 
-        now = time.time()
-        lampcurrent = self.QTH.getAmps()
-        lamppower = self.QTH.getWatts()
-        dkdflux = self.DKD.read_measurement()
-        phdflux = self.PhD.read_measurement()
-
-        print >>f, now, filt, grating, eff_wl, \
-            lampcurrent, lamppower, dkdflux, phdflux, shutter_open
-        print now, filt, grating, eff_wl, \
-            lampcurrent, lamppower, dkdflux, phdflux, shutter_open
+        # samples until the next shutter change, in bursts
+        block = min(block, repeat + ndark - i)
+        for now, lampcurrent, lamppower, dkdflux, phdflux in lamp_fluxes(self, block):
+            print >>f, now, filt, grating, eff_wl, \
+                lampcurrent, lamppower, dkdflux, phdflux, shutter_open
+            print now, filt, grating, eff_wl, \
+                lampcurrent, lamppower, dkdflux, phdflux, shutter_open
+        i += block
 
     f.close()
 
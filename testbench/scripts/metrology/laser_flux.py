@@ -5,6 +5,8 @@ import time
 import datetime
 import numpy as np
 
+import lsst.testbench.drivers.keithley_ks as keithley_ks
+
 B = lsst.testbench.Bench()
 
 B.register("laser")
@@ -32,6 +34,24 @@ B.laser_stability(channel = 2, current = 45.0, repeat=10000)
 
 #------------------------------------------------------------------------
 
+def laser_fluxes(self, channel, n):
+    """
+    n simultaneous DKD and PhD samples (Keithley bursts), the laser
+    current and power being read once per burst.
+    Yields (time, laser current, laser power, DKD flux, PhD flux).
+    """
+    while n > 0:
+        size = min(n, self.PhD.max_burst)
+        lasercurrent = self.laser.getCurrent(channel)
+        laserpower = self.laser.getPower(channel)
+        (dkdtimes, dkdflux), (phdtimes, phdflux) = \
+            keithley_ks.read_bursts([self.DKD, self.PhD], size)
+        for i in xrange(size):
+            yield phdtimes[i], lasercurrent, laserpower, dkdflux[i], phdflux[i]
+        n -= size
+
+#------------------------------------------------------------------------
+
 def laser_flux_ramp(self, channels = [1,2,3,4]):
     ramps = { 
         #1: { 'Imin': 15.0, 'Imax': 35.20, 'Istep': 1. },
@@ -91,13 +111,8 @@ def laser_flux_ramp(self, channels = [1,2,3,4]):
             self.laser.setCurrent(ch, I)
             time.sleep(2)
 
-            for i in xrange(20):
-                now = time.time()
-                lasercurrent = self.laser.getCurrent(ch)
-                laserpower = self.laser.getPower(ch)
-                dkdflux = self.DKD.read_measurement()
-                phdflux = self.PhD.read_measurement()
-
+            for now, lasercurrent, laserpower, dkdflux, phdflux in \
+                    laser_fluxes(self, ch, 20):
                 print >>f, now, ch, lasercurrent, laserpower, dkdflux, phdflux
                 print now, ch, lasercurrent, laserpower, dkdflux, phdflux
         #
@@ -163,13 +178,8 @@ def laser_stability(self, channel = 2, current = 45.0, repeat = 10000):
     self.laser.disable()
     self.ttl.closeShutter()
 
-    for i in xrange(10):
-        now = time.time()
-        lasercurrent = self.laser.getCurrent(channel)
-        laserpower = self.laser.getPower(channel)
-        dkdflux = self.DKD.read_measurement()
-        phdflux = self.PhD.read_measurement()
-
+    for now, lasercurrent, laserpower, dkdflux, phdflux in \
+            laser_fluxes(self, channel, 10):
         print >>f, now, channel, lasercurrent, laserpower, dkdflux, phdflux, 0
         print now, channel, lasercurrent, laserpower, dkdflux, phdflux, 0
 
@@ -181,13 +191,8 @@ def laser_stability(self, channel = 2, current = 45.0, repeat = 10000):
     self.ttl.openShutter()
     time.sleep(2)
         
-    for i in xrange(repeat):
-        now = time.time()
-        lasercurrent = self.laser.getCurrent(channel)
-        laserpower = self.laser.getPower(channel)
-        dkdflux = self.DKD.read_measurement()
-        phdflux = self.PhD.read_measurement()
-
+    for now, lasercurrent, laserpower, dkdflux, phdflux in \
+            laser_fluxes(self, channel, repeat):
         print >>f, now, channel, lasercurrent, laserpower, dkdflux, phdflux, 1
         print now, channel, lasercurrent, laserpower, dkdflux, phdflux, 1
 
@@ -196,13 +201,8 @@ def laser_stability(self, channel = 2, current = 45.0, repeat = 10000):
     self.laser.disable()
     self.ttl.closeShutter()
 
-    for i in xrange(10):
-        now = time.time()
-        lasercurrent = self.laser.getCurrent(channel)
-        laserpower = self.laser.getPower(channel)
-        dkdflux = self.DKD.read_measurement()
-        phdflux = self.PhD.read_measurement()
-
+    for now, lasercurrent, laserpower, dkdflux, phdflux in \
+            laser_fluxes(self, channel, 10):
         print >>f, now, channel, lasercurrent, laserpower, dkdflux, phdflux, 0
         print now, channel, lasercurrent, laserpower, dkdflux, phdflux, 0
 